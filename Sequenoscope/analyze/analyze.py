@@ -7,15 +7,19 @@ from Sequenoscope.version import __version__
 from Sequenoscope.utils.parser import GeneralSeqParser 
 from Sequenoscope.utils.sequence_class import Sequence
 from Sequenoscope.analyze.minimap2 import Minimap2Runner
+from Sequenoscope.analyze.reference_index import ReferenceIndexCache
 from Sequenoscope.analyze.fastP import FastPRunner
 from Sequenoscope.analyze.kat import KatRunner
 from Sequenoscope.analyze.processing import SamBamProcessor
-from Sequenoscope.analyze.fastq_extractor import FastqExtractor
+from Sequenoscope.analyze.fastq_scanner import FastqScanner
+from Sequenoscope.analyze.stream import StreamingAligner
+from Sequenoscope.analyze.scheduler import StageScheduler
+from Sequenoscope.analyze.checkpoint import StageCheckpoints
 from Sequenoscope.analyze.seq_manifest import SeqManifest
-from Sequenoscope.utils.parser import FastqPairedEndRenamer
 from Sequenoscope.analyze.seq_manifest import SeqManifestSummary
+from Sequenoscope.analyze.manifest_writer import manifest_path
 
-def parse_args():
+def parse_args(argv=None):
     parser = ap.ArgumentParser(prog="sequenoscope",
                                usage="sequenoscope analyze --input_fastq <file.fq> --input_reference <ref.fasta> -o <out> -seq_type <sr>[options]\nFor help use: sequenoscope analyze -h or sequenoscope analyze --help", 
                                 description="%(prog)s version {}: a tool for analyzing and processing sequencing data.".format(__version__), 
@@ -39,12 +43,37 @@ def parse_args():
     #parser.add_argument('--exclude', required=False, help='Choose to exclude reads based on reference instead of including them', action='store_true')
     parser.add_argument('--kat_hist_kmer', default= 27, metavar="", type=int, help="A designation of the kmer size when running kat hist")
     parser.add_argument('--minimap2_kmer', default= 15, metavar="", type=int, help="A designation of the kmer size when running minimap2")
+    parser.add_argument('--minimap2_index_cache', default= None, metavar="", type=str, help="Path to a directory of prebuilt minimap2 reference indexes. The index of the reference is built once per reference content, kmer size and preset and reused by every later run. default is to index the reference on every run")
+    parser.add_argument('--coverage_mode', default= 'interval', metavar="", type=str, choices=['interval', 'blocks'], help="A designation of how coverage is counted: 'interval' uses the alignment span, 'blocks' uses only aligned CIGAR blocks. default is [interval]")
+    parser.add_argument('--bam_mode', default= 'fetch', metavar="", type=str, choices=['fetch', 'scan'], help="A designation of how the bam file is analyzed: 'fetch' queries each reference contig through the index, 'scan' streams the bam once and only reports contigs with reads, recommended for references with many contigs. default is [fetch]")
+    parser.add_argument('--coverage_store', default= 'rle', metavar="", type=str, choices=['dense', 'rle'], help="A designation of how coverage is stored while the bam is analyzed: 'dense' arrays or compact run-length 'rle' events. default is [rle]")
+    parser.add_argument('--coverage_bin_size', default= 100, metavar="", type=int, help="A designation of the window size in bases of the binned coverage profile. default is [100]")
+    parser.add_argument('--per_base_coverage', required=False, help='Keep the exact per-base coverage of every contig instead of the binned profile', action='store_true')
+    parser.add_argument('--manifest_engine', default= 'python', metavar="", type=str, choices=['python', 'pandas'], help="A designation of how the manifest files are built: 'python' streams and joins the reads row by row, 'pandas' joins chunks of columns with vectorized operations. default is [python]")
+    parser.add_argument('--manifest_format', default= 'text', metavar="", type=str, choices=['text', 'parquet'], help="A designation of the format of the manifest files: tab delimited 'text' or typed, compressed 'parquet' (requires pyarrow). default is [text]")
+    parser.add_argument('--max_memory', default= None, metavar="", type=int, help="Approximate memory budget in megabytes for the per-read state of the manifest, reads spill to temporary databases in the output directory once it is exceeded. default is no limit")
+    parser.add_argument('--stream', required=False, help='Connect fastp, minimap2, samtools sort and kat hist through pipes so that the filtered fastq and the sam file are never written to disk', action='store_true')
+    parser.add_argument('--keep_intermediates', required=False, help='With --stream, also write the filtered fastq (interleaved for paired-end reads) and the sam file for debugging', action='store_true')
     parser.add_argument('--force', required=False, help='Force overwite of existing results directory', action='store_true')
+    parser.add_argument('--resume', required=False, help='Reuse an existing results directory and skip every step whose inputs, parameters and outputs are unchanged since it last finished', action='store_true')
+    parser.add_argument('--checkpoint_hash', default= 'sampled', metavar="", type=str, choices=['sampled', 'full'], help="A designation of how files are fingerprinted for the step checkpoints: 'sampled' hashes the size and sampled blocks of a file, 'full' hashes the whole file. default is [sampled]")
     parser.add_argument('-v', '--version', action='version', version="%(prog)s " + __version__)
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 def run():
-    args = parse_args()
+    run_analyze(parse_args())
+
+def run_analyze(args, ref_index=None):
+    """
+    Runs the analysis of one sample
+
+    Arguments:
+        args: argparse Namespace
+            arguments of the analyze command, see parse_args
+        ref_index: str
+            path of a prebuilt minimap2 index of the reference that is used instead of indexing the reference,
+            built with the minimap2 kmer size and the preset of the sequencing type. default is None
+    """
     input_fastq = args.input_fastq
     input_reference = args.input_reference
     seq_summary = args.sequencing_summary
@@ -56,12 +85,25 @@ def run():
     threads = args.threads
     kat_hist_kmer_size = args.kat_hist_kmer
     minimap_kmer_size = args.minimap2_kmer
+    minimap_index_cache = args.minimap2_index_cache
     min_len = args.minimum_read_length
     max_len = args.maximum_read_length
     trim_front = args.trim_front_bp
     trim_tail = args.trim_tail_bp
+    coverage_mode = args.coverage_mode
+    bam_mode = args.bam_mode
+    coverage_store = args.coverage_store
+    manifest_engine = args.manifest_engine
+    manifest_format = args.manifest_format
+    max_memory = args.max_memory
+    coverage_bin_size = args.coverage_bin_size
+    per_base_coverage = args.per_base_coverage
+    stream = args.stream
+    keep_intermediates = args.keep_intermediates
     #exclude = args.exclude
     force = args.force
+    resume = args.resume
+    checkpoint_hash = args.checkpoint_hash
 
     print("-"*40)
     print(f"Sequenoscope analyze version {__version__}: processing and analyzing reads based on given paramters")
@@ -71,10 +113,17 @@ def run():
 
     if not os.path.isdir(out_directory):
         os.mkdir(out_directory, 0o755)
-    elif not force:
-        print(f"Error directory {out_directory} already exists, if you want to overwrite existing results then specify --force")
+    elif not force and not resume:
+        print(f"Error directory {out_directory} already exists, if you want to overwrite existing results then specify --force, if you want to continue a previous run then specify --resume")
         sys.exit()
 
+    ## every step that finished is checkpointed, --resume skips the steps whose checkpoint is still valid
+
+    checkpoints = StageCheckpoints(os.path.join(out_directory, f"{out_prefix}_checkpoints.json"),
+                                   full_hash=checkpoint_hash == 'full')
+    if not resume:
+        checkpoints.clear()
+
     ##checking fastq files
 
     #if seq_class == 'pe':
@@ -95,135 +144,244 @@ def run():
 
     sequencing_sample = Sequence("Test", input_fastq)
     
+    ## the analyze steps are stages of a graph, stages whose inputs are ready run at the same time and
+    ## split the thread budget, kat hist for example runs next to the mapping of the filtered reads
+
+    paired = seq_class.upper() == SequenceTypes.paired_end
+    scheduler = StageScheduler(threads=threads, checkpoints=checkpoints)
+
     ## extracting reads into a read list
 
-    extractor_run = FastqExtractor(sequencing_sample, out_prefix=f"{out_prefix}_read_list",
-                                    out_dir=out_directory)
-    if seq_class.upper() == SequenceTypes.paired_end:
-        ## generate a read set for renaming read_ids
-        extractor_run.extract_paired_reads()
-
-        ##rename
-        rename_read_ids_run = FastqPairedEndRenamer(sequencing_sample, extractor_run.result_files["read_list_file"], 
-                                                    out_prefix=f"{out_prefix}_renamed_reads", out_dir=out_directory)
-        rename_read_ids_run.rename()
-
-        ##overwrite class objects with renamed files
-        sequencing_sample = Sequence("Test", rename_read_ids_run.result_files["fastq_file_renamed"])
-        extractor_run = FastqExtractor(sequencing_sample, out_prefix=f"{out_prefix}_read_list",
-                                    out_dir=out_directory)
-        
-        ##extract read ids
-        extractor_run.alt_extract_paired_reads()
-    elif seq_class.upper() == SequenceTypes.single_end:
-        extractor_run.extract_single_reads()
+    ## a single pass over the fastq gives the read list and the raw read stats, paired-end mates are
+    ## keyed on their name and mate instead of rewriting the fastq files with renamed headers
+    extractor_run = FastqScanner(sequencing_sample, out_prefix=out_prefix, out_dir=out_directory, paired=paired)
+
+    def run_scan(stage_threads):
+        extractor_run.scan()
+        return extractor_run.result_files
+
+    def restore_scan(result_files):
+        extractor_run.result_files = result_files
+
+    scheduler.add_stage("fastq scan", run_scan, outputs=["read_list", "read_stats"], max_threads=1,
+                        params={"paired": paired}, input_files=input_fastq, restore=restore_scan)
 
     ## filtering reads with fastp
 
     fastp_run_process = FastPRunner(sequencing_sample, out_directory, f"{out_prefix}_fastp_output", 
                                     min_read_len=min_len, max_read_len=max_len, trim_front_bp=trim_front,
                                     trim_tail_bp=trim_tail, report_only=False, dedup=False, threads=threads)
-
-    
-    fastp_run_process.run_fastp()
-
-    ## mapping to reference via minimap2 and samtools
-
-    print("-"*40)
-    print("Mapping fastq based on the provided reference fasta file....")
-    print("-"*40)
-
-    sequencing_sample_filtered = Sequence("Test", fastp_run_process.result_files["output_files_fastp"])
-    minimap_run_process = Minimap2Runner(sequencing_sample_filtered, out_directory, input_reference,
+    fastp_params = {"min_len":min_len, "max_len":max_len, "trim_front":trim_front, "trim_tail":trim_tail}
+    minimap_run_process = Minimap2Runner(sequencing_sample, out_directory, input_reference,
                                         f"{out_prefix}_mapped_sam", threads=threads,
                                         kmer_size=minimap_kmer_size)
-    minimap_run_process.run_minimap2()
-
-    sam_to_bam_process = SamBamProcessor(minimap_run_process.result_files["sam_output_file"], out_directory,
-                                         input_reference, f"{out_prefix}_mapped_bam", thread=threads)
-    sam_to_bam_process.run_samtools_bam()
-
-    bam_to_fastq_process = SamBamProcessor(sam_to_bam_process.result_files["bam_output"], out_directory,
-                                         input_reference, f"{out_prefix}_mapped_fastq", thread=threads)
-    bam_to_fastq_process.run_samtools_fastq()
-
-    print("-"*40)
-    print("Analyzing kmers...")
-    print("-"*40)
-
-    # using kat hist to analyze kmers
-
-    kat_run = KatRunner(sequencing_sample_filtered, input_reference, out_directory, f"{out_prefix}_kmer_analysis", kmersize = kat_hist_kmer_size)
-    kat_run.kat_hist()
-
-    print("-"*40)
-    print("Creating manifest files...")
-    print("-"*40)
+    sam_to_bam_process = SamBamProcessor(None, out_directory, input_reference, f"{out_prefix}_mapped_bam",
+                                         thread=threads)
+    kat_run = KatRunner(sequencing_sample, input_reference, out_directory, f"{out_prefix}_kmer_analysis",
+                        kmersize = kat_hist_kmer_size)
+
+    ## indexing the reference into the shared index cache, next to the filtering of the reads
+
+    mapping_inputs = []
+    if ref_index is not None:
+        minimap_run_process.ref_index = ref_index
+    elif minimap_index_cache is not None:
+        index_cache = ReferenceIndexCache(minimap_index_cache)
+        mapping_inputs.append("ref_index")
+
+        def run_reference_index(stage_threads):
+            minimap_run_process.ref_index = index_cache.get_index(input_reference, kmer_size=minimap_kmer_size,
+                                                                  preset=minimap_run_process.preset(),
+                                                                  threads=stage_threads)
+            return {"ref_index":minimap_run_process.ref_index}
+
+        def restore_reference_index(result_files):
+            minimap_run_process.ref_index = result_files["ref_index"]
+
+        scheduler.add_stage("minimap2 index", run_reference_index, outputs=["ref_index"],
+                            params={"minimap2_kmer":minimap_kmer_size, "preset":minimap_run_process.preset()},
+                            input_files=[input_reference], restore=restore_reference_index)
+
+    if stream:
+        ## fastp, minimap2, samtools sort and kat hist connected through pipes
+
+        stream_run = StreamingAligner(fastp_run_process, minimap_run_process, sam_to_bam_process, kat_run,
+                                      keep_intermediates=keep_intermediates)
+
+        def run_stream(stage_threads):
+            print("-"*40)
+            print("Filtering, mapping and analyzing kmers of the reads in a single stream....")
+            print("-"*40)
+            stream_run.set_threads(stage_threads)
+            stream_run.run()
+            return {"fastp":fastp_run_process.result_files, "bam":sam_to_bam_process.result_files,
+                    "kat":kat_run.result_files}
+
+        def restore_stream(result_files):
+            fastp_run_process.result_files = result_files["fastp"]
+            sam_to_bam_process.result_files = result_files["bam"]
+            kat_run.result_files = result_files["kat"]
+
+        scheduler.add_stage("stream", run_stream, inputs=mapping_inputs, outputs=["fastp_json", "bam", "kat_json"],
+                            weight=6, params={"fastp":fastp_params, "minimap2_kmer":minimap_kmer_size,
+                                    "kat_hist_kmer":kat_hist_kmer_size, "keep_intermediates":keep_intermediates},
+                            input_files=input_fastq + [input_reference], restore=restore_stream)
+    else:
+        def run_fastp(stage_threads):
+            fastp_run_process.threads = stage_threads
+            fastp_run_process.run_fastp()
+            restore_fastp(fastp_run_process.result_files)
+            return fastp_run_process.result_files
+
+        def restore_fastp(result_files):
+            fastp_run_process.result_files = result_files
+            filtered_sample = Sequence("Test", result_files["output_files_fastp"])
+            minimap_run_process.read_set = filtered_sample
+            kat_run.input_path = filtered_sample
+
+        ## mapping to reference via minimap2 and samtools
+
+        def run_minimap2(stage_threads):
+            print("-"*40)
+            print("Mapping fastq based on the provided reference fasta file....")
+            print("-"*40)
+            minimap_run_process.threads = stage_threads
+            minimap_run_process.run_minimap2()
+            return minimap_run_process.result_files
+
+        def restore_minimap2(result_files):
+            minimap_run_process.result_files = result_files
+
+        def run_samtools_bam(stage_threads):
+            sam_to_bam_process.file = minimap_run_process.result_files["sam_output_file"]
+            sam_to_bam_process.threads = stage_threads
+            sam_to_bam_process.run_samtools_bam()
+            return sam_to_bam_process.result_files
+
+        def restore_samtools_bam(result_files):
+            sam_to_bam_process.result_files = result_files
+
+        # using kat hist to analyze kmers
+
+        def run_kat_hist(stage_threads):
+            print("-"*40)
+            print("Analyzing kmers...")
+            print("-"*40)
+            kat_run.threads = stage_threads
+            kat_run.kat_hist()
+            return kat_run.result_files
+
+        def restore_kat_hist(result_files):
+            kat_run.result_files = result_files
+
+        scheduler.add_stage("fastp", run_fastp, outputs=["fastp_fastq", "fastp_json"], params=fastp_params,
+                            input_files=input_fastq, restore=restore_fastp)
+        scheduler.add_stage("minimap2", run_minimap2, inputs=["fastp_fastq"] + mapping_inputs, outputs=["sam"],
+                            weight=4, params={"minimap2_kmer":minimap_kmer_size}, input_files=[input_reference],
+                            restore=restore_minimap2)
+        scheduler.add_stage("samtools bam", run_samtools_bam, inputs=["sam"], outputs=["bam"],
+                            input_files=[input_reference], restore=restore_samtools_bam)
+        scheduler.add_stage("kat hist", run_kat_hist, inputs=["fastp_fastq"], outputs=["kat_json"],
+                            params={"kat_hist_kmer":kat_hist_kmer_size}, restore=restore_kat_hist)
+
+    bam_to_fastq_process = SamBamProcessor(None, out_directory, input_reference, f"{out_prefix}_mapped_fastq",
+                                           thread=threads)
+
+    def run_samtools_fastq(stage_threads):
+        bam_to_fastq_process.file = sam_to_bam_process.result_files["bam_output"]
+        bam_to_fastq_process.threads = stage_threads
+        bam_to_fastq_process.run_samtools_fastq()
+        return bam_to_fastq_process.result_files
+
+    scheduler.add_stage("samtools fastq", run_samtools_fastq, inputs=["bam"], outputs=["mapped_fastq"])
+
+    def run_manifest(stage_threads):
+        print("-"*40)
+        print("Creating manifest files...")
+        print("-"*40)
+
+        ## a streamed run keeps no filtered fastq, the reads that passed fastp are the reads of the bam file
+        fastp_fastq = None
+        if not stream:
+            fastp_fastq = fastp_run_process.result_files["output_files_fastp"]
+
+        if seq_summary is not None:
+            manifest_run = SeqManifest(out_prefix,
+                                   sam_to_bam_process.result_files["bam_output"], 
+                                   f"{out_prefix}_manifest",
+                                   out_dir=out_directory,
+                                   fastp_fastq=fastp_fastq,
+                                   fastp_in_bam=stream,
+                                   read_list=extractor_run.result_files["read_list_file"],
+                                   in_seq_summary=seq_summary,
+                                   paired=paired,
+                                   coverage_mode=coverage_mode,
+                                   threads=stage_threads,
+                                   bam_mode=bam_mode,
+                                   coverage_store=coverage_store,
+                                   coverage_bin_size=coverage_bin_size,
+                                   per_base_coverage=per_base_coverage,
+                                   manifest_engine=manifest_engine,
+                                   manifest_format=manifest_format,
+                                   max_memory=max_memory
+                                   )
+        else:
+            manifest_run = SeqManifest(out_prefix,
+                                   sam_to_bam_process.result_files["bam_output"], 
+                                   f"{out_prefix}_manifest",
+                                   out_dir=out_directory,
+                                   fastp_fastq=fastp_fastq,
+                                   fastp_in_bam=stream,
+                                   read_list=extractor_run.result_files["read_list_file"],
+                                   in_fastq=input_fastq,
+                                   read_stats=extractor_run.result_files["read_stats_file"],
+                                   paired=paired,
+                                   start_time=start_time,
+                                   end_time=end_time,
+                                   coverage_mode=coverage_mode,
+                                   threads=stage_threads,
+                                   bam_mode=bam_mode,
+                                   coverage_store=coverage_store,
+                                   coverage_bin_size=coverage_bin_size,
+                                   per_base_coverage=per_base_coverage,
+                                   manifest_engine=manifest_engine,
+                                   manifest_format=manifest_format,
+                                   max_memory=max_memory
+                                   )
+        if manifest_run.status == False:
+            raise ValueError(str(manifest_run.error_msg))
 
-    if seq_summary is not None:
-        
-        manifest_with_sum_run = SeqManifest(out_prefix,
-                               sam_to_bam_process.result_files["bam_output"], 
-                               f"{out_prefix}_manifest",
-                               out_dir=out_directory,
-                               fastp_fastq=fastp_run_process.result_files["output_files_fastp"],
-                               read_list=extractor_run.result_files["read_list_file"],
-                               in_seq_summary=seq_summary
-                               )
-        
         kmer_file = GeneralSeqParser(kat_run.result_files["hist"]["json_file"], "json")
         fastp_file = GeneralSeqParser(fastp_run_process.result_files["json"], "json")
 
-        seq_summary_single_end_run = SeqManifestSummary(out_prefix,
-                                manifest_with_sum_run.bam_obj, 
+        ## reads of a sequencing summary are single-end nanopore reads
+        summary_run = SeqManifestSummary(out_prefix,
+                                manifest_run.bam_obj, 
                                 f"{out_prefix}_manifest_summary",
                                 out_dir=out_directory,
                                 kmer_json_file=kmer_file.parsed_file,
-                                fastp_json_file=fastp_file.parsed_file
+                                fastp_json_file=fastp_file.parsed_file,
+                                paired=paired and seq_summary is None,
+                                manifest_format=manifest_format
                                 )
-    
-        seq_summary_single_end_run.generate_summary()
-
-    else:
-        
-        manifest_no_sum_run = SeqManifest(out_prefix,
-                               sam_to_bam_process.result_files["bam_output"], 
-                               f"{out_prefix}_manifest",
-                               out_dir=out_directory,
-                               fastp_fastq=fastp_run_process.result_files["output_files_fastp"],
-                               read_list=extractor_run.result_files["read_list_file"],
-                               in_fastq=input_fastq,
-                               start_time=start_time,
-                               end_time=end_time
-                               )
-        
-        kmer_file = GeneralSeqParser(kat_run.result_files["hist"]["json_file"], "json")
-        fastp_file = GeneralSeqParser(fastp_run_process.result_files["json"], "json")
-
-        if seq_class.upper() == SequenceTypes.paired_end:
-            seq_summary_no_sum_run = SeqManifestSummary(out_prefix,
-                                    manifest_no_sum_run.bam_obj, 
-                                    f"{out_prefix}_manifest_summary",
-                                    out_dir=out_directory,
-                                    kmer_json_file=kmer_file.parsed_file,
-                                    fastp_json_file=fastp_file.parsed_file,
-                                    paired=True
-                                    )
-        
-            
-        else:
-            seq_summary_no_sum_run = SeqManifestSummary(out_prefix,
-                                    manifest_no_sum_run.bam_obj, 
-                                    f"{out_prefix}_manifest_summary",
-                                    out_dir=out_directory,
-                                    kmer_json_file=kmer_file.parsed_file,
-                                    fastp_json_file=fastp_file.parsed_file,
-                                    paired=False
-                                    )
-        
-        seq_summary_no_sum_run.generate_summary()
-        
+        summary_run.generate_summary()
+        return {"manifest":manifest_path(out_directory, f"{out_prefix}_manifest", manifest_format),
+                "manifest_summary":manifest_path(out_directory, f"{out_prefix}_manifest_summary", manifest_format)}
+
+    manifest_inputs = ["read_list", "read_stats", "bam", "fastp_json", "kat_json"]
+    if not stream:
+        manifest_inputs.append("fastp_fastq")
+    manifest_params = {"start_time":start_time, "end_time":end_time, "coverage_mode":coverage_mode,
+                       "bam_mode":bam_mode, "coverage_store":coverage_store, "coverage_bin_size":coverage_bin_size,
+                       "per_base_coverage":per_base_coverage, "manifest_engine":manifest_engine,
+                       "manifest_format":manifest_format}
+    manifest_files = []
+    if seq_summary is not None:
+        manifest_files.append(seq_summary)
+    scheduler.add_stage("manifest", run_manifest, inputs=manifest_inputs, outputs=["manifest", "manifest_summary"],
+                        params=manifest_params, input_files=manifest_files)
 
+    scheduler.run()
 
     print("-"*40)
     print("All Done!")
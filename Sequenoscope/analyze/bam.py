@@ -1,10 +1,16 @@
 #!/usr/bin/env python
 
-import statistics
 import pysam
-from math import log
-from Sequenoscope.constant import DefaultValues
-from Sequenoscope.utils.__init__ import run_command, is_non_zero_file
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+from Sequenoscope.constant import DefaultValues, CoverageModes, BamProcessingModes, CoverageStores, ReadRecords
+from Sequenoscope.analyze.coverage import CoverageEngine, RunLengthCoverageEngine
+from Sequenoscope.utils.qscore import calc_mean_qscore
+from Sequenoscope.utils.read_stats import ReadStatsAccumulator
+from Sequenoscope.utils.__init__ import is_non_zero_file
+from Sequenoscope.utils.read_store import ReadStore
+from Sequenoscope.utils.read_id_index import mate_read_id
 
 
 
@@ -14,25 +20,94 @@ class BamProcessor:
     index_file = None
     pysam_obj = None
     threads = 1
-    read_locations = {}
-    ref_stats = {}
-    ref_coverage = {}
+    read_locations = None
+    read_index = None
+    ref_stats = None
+    ref_coverage = None
+    coverage_engine = None
+    coverage_mode = CoverageModes.interval
+    processing_mode = BamProcessingModes.fetch
+    coverage_store = CoverageStores.rle
+    coverage_bin_size = DefaultValues.coverage_bin_size
+    per_base_coverage = False
+    paired = False
+    memory_budget = None
+    spill_dir = None
+    contig_lengths = None
     status = True
     error_msg = ''
 
-    def __init__(self,input_file):
+    def __init__(self,input_file,coverage_mode=CoverageModes.interval,threads=1,processing_mode=BamProcessingModes.fetch,
+                 coverage_store=CoverageStores.rle,coverage_bin_size=DefaultValues.coverage_bin_size,per_base_coverage=False,
+                 memory_budget=None,spill_dir=None,paired=False):
         """
         Initalize the class with an input bam file
 
         Arguments:
             input_file: str
                 a string that designates the path of the bam file to be analyzed
+            coverage_mode: str
+                'interval' to count coverage from the reference start over the query alignment length,
+                'blocks' to count only the aligned blocks of each read (skipping deletions and N-skips), default is 'interval'
+            threads: int
+                an integer representing the number of worker processes used to process the bam regions, default is 1
+            processing_mode: str
+                'fetch' to query the indexed bam contig by contig, 'scan' to stream the whole bam once in file order
+                and only create statistics for contigs with reads, default is 'fetch'
+            coverage_store: str
+                'dense' to keep a difference array per touched contig, 'rle' to keep the coverage as compacted
+                run-length events, default is 'rle'
+            coverage_bin_size: int
+                width of the windows of mean depth stored in ref_coverage, default is 100
+            per_base_coverage: bool
+                store the exact per-base depth in ref_coverage instead of the windowed depth, default is False
+            memory_budget: MemoryBudget
+                budget of the per-read state shared with the rest of the run. When given, read_index spills to a
+                temporary database in spill_dir once the budget is exceeded, default is None meaning no limitation
+            spill_dir: str
+                directory of the temporary database of read_index, default is the system temporary directory
+            paired: bool
+                key the reads on their name and their mate, taken from the READ1 and READ2 flags, so that the two
+                mates of a paired-end read are kept apart, see mate_read_id. default is False
         """
+        self.read_locations = {}
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.read_index = ReadStore(memory_budget, spill_dir, ReadRecords.mapping)
+        self.ref_stats = {}
+        self.ref_coverage = {}
+        self.contig_lengths = {}
         self.alignment_file = input_file
+        self.coverage_mode = coverage_mode
+        self.threads = threads
+        self.processing_mode = processing_mode
+        self.coverage_store = coverage_store
+        self.coverage_bin_size = coverage_bin_size
+        self.per_base_coverage = per_base_coverage
+        self.paired = paired
+        if self.coverage_mode not in [CoverageModes.interval, CoverageModes.blocks]:
+            self.status = False
+            self.error_msg = "Error coverage mode {} is not supported".format(coverage_mode)
+            return
+        if self.processing_mode not in [BamProcessingModes.fetch, BamProcessingModes.scan]:
+            self.status = False
+            self.error_msg = "Error processing mode {} is not supported".format(processing_mode)
+            return
+        if self.coverage_store not in [CoverageStores.dense, CoverageStores.rle]:
+            self.status = False
+            self.error_msg = "Error coverage store {} is not supported".format(coverage_store)
+            return
         if not is_non_zero_file(input_file):
             self.status = False
             self.error_msg = "Error bam file {} does not exist".format(input_file)
             return
+        if self.processing_mode == BamProcessingModes.scan:
+            self.pysam_obj = pysam.AlignmentFile(input_file, "rb", threads=self.threads)
+            self.contig_lengths = dict(zip(self.pysam_obj.references, self.pysam_obj.lengths))
+            self.contig_lengths['*'] = 0
+            self.coverage_engine = self.create_coverage_engine()
+            self.scan_bam()
+            return
         index_file = "{}.bai".format(input_file)
         self.index_file = index_file
         if not is_non_zero_file(index_file):
@@ -41,66 +116,202 @@ class BamProcessor:
             self.status = False
             self.error_msg = "STDOUT:{}\nSTDERR:{}".format(stdout,stderr)
             return
+        self.pysam_obj = pysam.AlignmentFile(input_file, "rb", index_filename=index_file)
         self.ref_stats = self.get_bam_stats()
         self.init_base_cov()
-        self.pysam_obj = pysam.AlignmentFile(input_file, "rb")
         self.process_bam()
 
 
     def init_base_cov(self):
         """
-        Uses the contig lengths from self.ref_stats to create a list of positions with counts initialized to 0
+        Uses the contig lengths from self.ref_stats to create a coverage engine, contigs are only
+        materialized by the engine once they receive coverage
         """
+        self.contig_lengths = {}
         for contig_id in self.ref_stats:
-            self.ref_coverage[contig_id] = [0] * self.ref_stats[contig_id]['length']
+            self.contig_lengths[contig_id] = self.ref_stats[contig_id]['length']
+        self.coverage_engine = self.create_coverage_engine()
+
+    def create_coverage_engine(self):
+        """
+        Creates the coverage engine matching self.coverage_store for the contigs of self.contig_lengths
+
+        Returns:
+            CoverageEngine or RunLengthCoverageEngine:
+                empty coverage engine
+        """
+        if self.coverage_store == CoverageStores.dense:
+            return CoverageEngine(self.contig_lengths)
+        return RunLengthCoverageEngine(self.contig_lengths)
 
 
     def process_bam(self):
         """
-        Reads a bam file line by line and produces summary statistics based on each contig
+        Reads a bam file region by region and produces summary statistics based on each contig.
+        When more than one thread is available the regions are processed in a pool of worker processes,
+        each with its own handle on the bam file, and the results are merged back per contig.
+        A contig is summarized and its coverage state released as soon as its last region was merged.
         """
+        regions = self.plan_regions()
+        contig_results = {}
+        remaining_regions = {}
         for contig_id in self.ref_stats:
-            contig_len = self.ref_stats[contig_id]['length']
-            num_reads = 0
-            total_bases = 0
-            lengths = []
-            qualities = []
-            for read in self.pysam_obj.fetch(contig_id):
-                num_reads+=1
-                read_id = read.query_name
-                seq = read.query_sequence
-                if seq is not None:
-                    length = len(seq)
-                else:
-                    length = 0
-                total_bases += length
-                lengths.append(length)
-                qual = read.query_qualities
-                qscore = self.calc_mean_qscores(qual)
-                qualities.append(qscore)
-                self.ref_stats[contig_id]['reads'][read_id] = (length,qscore)
-                if contig_id == '*':
-                    continue
-                start_pos = read.reference_start
-                aln_len = read.query_alignment_length
-                for i in range(start_pos,start_pos+aln_len):
-                    if i < contig_len:
-                        self.ref_coverage[contig_id][i]+=1
-
-            lengths = sorted(lengths,reverse=True)
-            if len(self.ref_coverage[contig_id]) > 0:
-                self.ref_stats[contig_id]['mean_cov'] = statistics.mean(self.ref_coverage[contig_id])
-                self.ref_stats[contig_id]['covered_bases'] = self.count_cov_bases(self.ref_coverage[contig_id])
-            self.ref_stats[contig_id]['n50'] = self.calc_n50(lengths,total_bases)
-            self.ref_stats[contig_id]['num_reads'] = num_reads
-            if len(lengths) > 0:
-                self.ref_stats[contig_id]['median_len'] = statistics.median(lengths)
-                self.ref_stats[contig_id]['mean_len'] = statistics.mean(lengths)
-            if len(qualities) > 0:
-                self.ref_stats[contig_id]['median_qual'] = statistics.median(qualities)
-                self.ref_stats[contig_id]['mean_qual'] = statistics.mean(qualities)
+            contig_results[contig_id] = ReadStatsAccumulator()
+        for (contig_id, start, end) in regions:
+            remaining_regions[contig_id] = remaining_regions.get(contig_id, 0) + 1
+        for contig_id in self.ref_stats:
+            if contig_id not in remaining_regions:
+                self.summarize_contig(contig_id, contig_results.pop(contig_id))
+
+        if self.threads > 1 and len(regions) > 1:
+            chunksize = max(1, len(regions) // (self.threads * 4))
+            with ProcessPoolExecutor(max_workers=self.threads, mp_context=get_pool_context(),
+                                     initializer=init_region_worker,
+                                     initargs=(self.alignment_file, self.coverage_mode, self.paired)) as executor:
+                for result in executor.map(process_region_task, regions, chunksize=chunksize):
+                    self.merge_region_result(result, contig_results, remaining_regions)
+        else:
+            for (contig_id, start, end) in regions:
+                result = process_region(self.pysam_obj, contig_id, start, end, self.coverage_mode, self.paired)
+                self.merge_region_result(result, contig_results, remaining_regions)
         return
 
+    def scan_bam(self):
+        """
+        Streams the whole bam file once in file order and accumulates statistics on the fly. Statistics
+        and coverage are only created for contigs the first time one of their reads is seen, which avoids
+        the per contig overhead of fetch for references with a very large number of contigs.
+        """
+        region_results = {}
+        for read in self.pysam_obj.fetch(until_eof=True):
+            if read.reference_id < 0:
+                contig_id = '*'
+            else:
+                contig_id = read.reference_name
+            if contig_id not in region_results:
+                region_results[contig_id] = create_region_result(contig_id)
+                self.ref_stats[contig_id] = self.create_contig_stats(self.contig_lengths[contig_id])
+            if read.is_unmapped:
+                self.ref_stats[contig_id]['unmapped'] += 1
+            else:
+                self.ref_stats[contig_id]['mapped'] += 1
+            result = region_results[contig_id]
+            collect_read(result, read, self.coverage_mode, self.paired)
+            if len(result['intervals']) > 0:
+                for (starts, ends) in result['intervals']:
+                    self.coverage_engine.add_intervals(contig_id, starts, ends)
+                result['intervals'] = []
+
+        contig_results = {}
+        for contig_id in region_results:
+            flush_intervals(region_results[contig_id])
+            contig_results[contig_id] = ReadStatsAccumulator()
+            self.merge_region_result(region_results[contig_id], contig_results)
+            self.summarize_contig(contig_id, contig_results[contig_id])
+        return
+
+    def plan_regions(self):
+        """
+        Splits the contigs of the bam file into regions for processing. Contigs longer than
+        DefaultValues.bam_region_size are split into several regions when more than one thread is used.
+        Contigs without any reads in the bam index are skipped.
+
+        Returns:
+            list:
+                list of (contig_id, start, end) tuples, start and end are None when the whole contig is processed
+        """
+        regions = []
+        region_size = DefaultValues.bam_region_size
+        for contig_id in self.ref_stats:
+            contig_len = self.ref_stats[contig_id]['length']
+            if self.ref_stats[contig_id]['mapped'] + self.ref_stats[contig_id]['unmapped'] == 0:
+                continue
+            if self.threads > 1 and contig_id != '*' and contig_len > region_size:
+                for start in range(0, contig_len, region_size):
+                    regions.append((contig_id, start, min(start + region_size, contig_len)))
+            else:
+                regions.append((contig_id, None, None))
+        return regions
+
+    def merge_region_result(self, result, contig_results, remaining_regions=None):
+        """
+        Merges the reads, read statistics and coverage intervals of a processed region into its contig
+
+        Arguments:
+            result: dict
+                region result produced by process_region
+            contig_results: dict
+                per contig ReadStatsAccumulator of the read statistics
+            remaining_regions: dict
+                number of regions left to merge per contig, the contig is summarized when it reaches 0
+        """
+        contig_id = result['contig_id']
+        contig_results[contig_id].merge(result['read_stats'])
+        self.index_reads(contig_id, result['reads'])
+        for (starts, ends) in result['intervals']:
+            self.coverage_engine.add_intervals(contig_id, starts, ends)
+        if remaining_regions is not None:
+            remaining_regions[contig_id] -= 1
+            if remaining_regions[contig_id] == 0:
+                self.summarize_contig(contig_id, contig_results.pop(contig_id))
+
+    def index_reads(self, contig_id, reads):
+        """
+        Adds the reads of a merged region to read_index, which maps every read id to the tuple
+        (mapped contigs, read length, read qscore). Regions are merged in the order of ref_stats, so the
+        contigs of a read keep that order and the length and qscore are the ones of the last contig
+        the read was seen on. Unmapped reads ('*') are indexed without a contig.
+
+        Arguments:
+            contig_id: str
+                contig the reads were aligned to
+            reads: dict
+                read ids and their (length, qscore) on the contig
+        """
+        indexed_reads = self.read_index.get_many(list(reads))
+        updates = {}
+        for read_id, (length, qscore) in reads.items():
+            entry = indexed_reads.get(read_id)
+            if entry is None:
+                contigs = ()
+            else:
+                contigs = entry[0]
+            if contig_id != '*' and contig_id not in contigs:
+                contigs = contigs + (contig_id,)
+            updates[read_id] = (contigs, length, qscore)
+        self.read_index.update_many(updates)
+
+    def summarize_contig(self, contig_id, accumulator):
+        """
+        Resolves the coverage and read statistics of a contig once all of its regions were merged.
+        ref_coverage receives the windowed mean depth, or the exact per-base depth when per_base_coverage is set.
+
+        Arguments:
+            contig_id: str
+                contig to summarize
+            accumulator: ReadStatsAccumulator
+                merged read statistics of the contig
+        """
+        contig_len = self.ref_stats[contig_id]['length']
+        depth = None
+        if self.per_base_coverage or self.coverage_store == CoverageStores.dense:
+            depth = self.coverage_engine.get_depth(contig_id)
+        if self.per_base_coverage:
+            self.ref_coverage[contig_id] = depth
+        else:
+            self.ref_coverage[contig_id] = self.coverage_engine.binned_depth(contig_id, self.coverage_bin_size)
+        if contig_len > 0:
+            self.ref_stats[contig_id]['mean_cov'] = self.coverage_engine.mean_cov(contig_id, depth=depth)
+            self.ref_stats[contig_id]['covered_bases'] = self.coverage_engine.covered_bases(contig_id, depth=depth)
+        self.coverage_engine.release(contig_id)
+        self.ref_stats[contig_id]['n50'] = accumulator.n50()
+        self.ref_stats[contig_id]['num_reads'] = accumulator.num_reads
+        if accumulator.num_reads > 0:
+            self.ref_stats[contig_id]['median_len'] = accumulator.median_length()
+            self.ref_stats[contig_id]['mean_len'] = accumulator.mean_length()
+            self.ref_stats[contig_id]['median_qual'] = accumulator.median_qscore()
+            self.ref_stats[contig_id]['mean_qual'] = accumulator.mean_qscore()
+
     def calc_n50(self,lengths,total_length):
         """
         Calculates the N50 of a set of read lengths
@@ -129,7 +340,7 @@ class BamProcessor:
         Counts positions where the count is >=min and <= max
 
         Arguments:
-            list_of_values: list
+            list_of_values: list or numpy array
                 list of coverage value for calcualtion
             min_value: int
                 minimum coverage value
@@ -140,94 +351,248 @@ class BamProcessor:
             int:
                 int number of positions meeting this threshold
         """
-        total = 0
-        for v in list_of_values:
-            if v >= min_value and v<=max_value:
-                total+=1
-        return total
+        values = np.asarray(list_of_values)
+        return int(np.count_nonzero((values >= min_value) & (values <= max_value)))
     
-    def error_prob_list_tab(n):
+    def get_bam_stats(self):
         """
-        generate a list of error rates for qualities less than or equal to n.
-        source: github.com/wdecoster/nanoget/blob/master/nanoget/utils.py
-
-        Arguments: 
-            n: error probability threshold
+        Reads the contig lengths from the bam header and the mapped and unmapped read counts
+        from the bam index, equivalent to SAMTOOLS IDXSTATS without spawning a process
 
         Returns:
-            list:
-                list of error rates
+            dictionary:
+                dictionary with the length and index read counts of every contig, including '*' for unplaced reads
+
         """
-        return [10**(q / -10) for q in range(n+1)]
+        result = {}
+        index_stats = {}
+        for stats in self.pysam_obj.get_index_statistics():
+            index_stats[stats.contig] = stats
+        for contig_id, length in zip(self.pysam_obj.references, self.pysam_obj.lengths):
+            mapped = 0
+            unmapped = 0
+            if contig_id in index_stats:
+                mapped = index_stats[contig_id].mapped
+                unmapped = index_stats[contig_id].unmapped
+            result[contig_id] = self.create_contig_stats(length, mapped, unmapped)
+        result['*'] = self.create_contig_stats(0, 0, self.pysam_obj.nocoordinate)
+        return result
 
-    def calc_mean_qscores(self,qual,tab=error_prob_list_tab(DefaultValues.nanoget_threshold)):
+    def create_contig_stats(self, length, mapped=0, unmapped=0):
         """
-        Calculates the mean quality score for a read where they have been converted to Phred.
-        Phred scores are first converted to probabilites, then the average error probability is calculated.
-        The average is then converted back to the Phred scale.
+        Creates the initial statistics entry of a contig
 
         Arguments:
-            qual: string
-                string of Phred 33 ints for quality calcualtions
-            
-            tab: list
-                list of error rates for qaulties specified
-                default designation of 128 based on nanoget 
+            length: int
+                length of the contig
+            mapped: int
+                number of mapped reads placed on the contig according to the index
+            unmapped: int
+                number of unmapped reads placed on the contig according to the index
 
         Returns:
-            float:
-                mean qscore
+            dictionary:
+                statistics entry with counts initialized to 0
         """
-        if qual:
-            phred_score = -10 * log(sum([tab[q] for q in qual]) / len(qual) , 10)
-            return phred_score
-        else:
-            return 0
+        return {'length':length, 'mapped':mapped, 'unmapped':unmapped,
+                'num_reads':0,'mean_cov':0,
+                'covered_bases':0,'mean_len':0,'median_len':0,
+                'mean_qual':0,'median_qual':0,'n50':0}
 
 
-    def get_bam_stats(self):
+    def index_bam(self):
         """
-        Wrapper class around SAMTOOLS IDXSTATS for getting information about bam file
+        Builds the bam index file in-process with the samtools index bundled in pysam
 
         Returns:
-            dictionary:
-                dictionary with some results from the samtools IDXSTATS tool
+            tuple:
+                stdout and stderr of the indexing
+        """
+        try:
+            stdout = pysam.index('-@', "{}".format(self.threads), self.alignment_file, self.index_file)
+        except pysam.SamtoolsError as e:
+            return ('', str(e))
+        return (stdout, '')
 
+    def close(self):
         """
-        cmd = [
-            'samtools',
-            'idxstats',
-            "{}".format(self.alignment_file)
-        ]
-        cmd = " ".join(cmd)
-        (stdout,stderr) = run_command(cmd)
-        result = {}
-        stdout = stdout.split("\n")
-        for row in stdout:
-            row = row.split("\t")
-            if len(row) < DefaultValues.samtools_idxstats_field_number:
-                continue
-            result[row[0]] = {'length':int(row[1]),
-                              'reads': {},'num_reads':0,'mean_cov':0,
-                              'covered_bases':0,'mean_len':0,'median_len':0,
-                              'mean_qual':0,'median_qual':0,'n50':0}
-        return result
+        Closes the handle on the bam file and drops the coverage state, the summarized
+        ref_stats and ref_coverage stay available
+        """
+        if self.pysam_obj is not None:
+            self.pysam_obj.close()
+            self.pysam_obj = None
+        self.coverage_engine = None
 
 
-    def index_bam(self):
-        """
-        Wrapper class around SAMTOOLS INDEX for creating a bam index file
+region_worker = {}
 
-        Returns:
-            file object:
-                indexed bam file
-        """
-        cmd = [
-            'samtools',
-            'index',
-            '-@',"{}".format(self.threads),
-            "{}".format(self.alignment_file),
-            "{}".format(self.index_file)
-        ]
-        cmd = " ".join(cmd)
-        return run_command(cmd)
\ No newline at end of file
+def get_pool_context():
+    """
+    Returns the multiprocessing context of the region pool. Worker processes are started from a clean
+    forkserver where available, so a BamProcessor can safely run from a thread of a larger pipeline
+    without forking the state of the other threads
+
+    Returns:
+        multiprocessing context:
+            forkserver context, or spawn where forkserver is not available
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+def init_region_worker(alignment_file, coverage_mode, paired=False):
+    """
+    Opens a dedicated handle on the bam file for a worker process of the region pool
+
+    Arguments:
+        alignment_file: str
+            path of the indexed bam file
+        coverage_mode: str
+            coverage mode used to collect the coverage intervals
+        paired: bool
+            key the reads on their name and their mate, see BamProcessor
+    """
+    region_worker['pysam_obj'] = pysam.AlignmentFile(alignment_file, "rb")
+    region_worker['coverage_mode'] = coverage_mode
+    region_worker['paired'] = paired
+
+def process_region_task(region):
+    """
+    Processes a (contig_id, start, end) region with the bam handle of the current worker process
+
+    Arguments:
+        region: tuple
+            region to process as produced by BamProcessor.plan_regions
+
+    Returns:
+        dict:
+            region result, see process_region
+    """
+    (contig_id, start, end) = region
+    return process_region(region_worker['pysam_obj'], contig_id, start, end, region_worker['coverage_mode'],
+                          region_worker['paired'])
+
+def process_region(pysam_obj, contig_id, start=None, end=None, coverage_mode=CoverageModes.interval, paired=False):
+    """
+    Collects read statistics and coverage intervals for the reads of one region of a contig.
+    A read belongs to the region that contains its reference start, so reads overlapping
+    several regions of a split contig are only counted once.
+
+    Arguments:
+        pysam_obj: pysam.AlignmentFile
+            open handle on the indexed bam file
+        contig_id: str
+            contig to process, '*' for the unmapped reads
+        start: int
+            0-based start of the region, None for the whole contig
+        end: int
+            0-based exclusive end of the region, None for the whole contig
+        coverage_mode: str
+            'interval' or 'blocks', see BamProcessor
+        paired: bool
+            key the reads on their name and their mate, see BamProcessor
+
+    Returns:
+        dict:
+            region result, see create_region_result
+    """
+    result = create_region_result(contig_id)
+    if start is None:
+        reads = pysam_obj.fetch(contig_id)
+    else:
+        reads = pysam_obj.fetch(contig_id, start, end)
+    for read in reads:
+        if start is not None and read.reference_start < start:
+            continue
+        collect_read(result, read, coverage_mode, paired)
+    flush_intervals(result)
+    return result
+
+def create_region_result(contig_id):
+    """
+    Creates an empty result for the reads of a contig or of a region of a contig
+
+    Arguments:
+        contig_id: str
+            contig the result belongs to
+
+    Returns:
+        dict:
+            contig_id, read_stats, reads, batches of coverage intervals and the pending
+            interval starts and ends that were not batched yet
+    """
+    return {'contig_id':contig_id, 'read_stats':ReadStatsAccumulator(),
+            'reads':{}, 'intervals':[], 'starts':[], 'ends':[]}
+
+def collect_read(result, read, coverage_mode=CoverageModes.interval, paired=False):
+    """
+    Adds the statistics and coverage intervals of one aligned read to a region result. Pending
+    intervals are batched into numpy arrays every DefaultValues.coverage_batch_size intervals.
+
+    Arguments:
+        result: dict
+            region result the read belongs to
+        read: pysam.AlignedSegment
+            read to add
+        coverage_mode: str
+            'interval' or 'blocks', see BamProcessor
+        paired: bool
+            key the read on its name and its mate, see BamProcessor
+    """
+    read_id = read.query_name
+    if paired:
+        read_id = mate_read_id(read_id, read_mate(read))
+    seq = read.query_sequence
+    if seq is not None:
+        length = len(seq)
+    else:
+        length = 0
+    qual = read.query_qualities
+    qscore = calc_mean_qscore(qual)
+    result['read_stats'].add(length, qscore)
+    result['reads'][read_id] = (length,qscore)
+    if result['contig_id'] == '*':
+        return
+    if coverage_mode == CoverageModes.blocks:
+        for block_start, block_end in read.get_blocks():
+            result['starts'].append(block_start)
+            result['ends'].append(block_end)
+    else:
+        start_pos = read.reference_start
+        aln_len = read.query_alignment_length
+        result['starts'].append(start_pos)
+        result['ends'].append(start_pos + aln_len)
+    if len(result['starts']) >= DefaultValues.coverage_batch_size:
+        flush_intervals(result)
+
+def read_mate(read):
+    """
+    Returns the mate of a read from its flags
+
+    Arguments:
+        read: pysam.AlignedSegment
+            read to look at
+
+    Returns:
+        int:
+            1 for READ1, 2 for READ2, 0 for reads that are not paired
+    """
+    if read.is_read1:
+        return 1
+    if read.is_read2:
+        return 2
+    return 0
+
+def flush_intervals(result):
+    """
+    Moves the pending interval starts and ends of a region result into a batch of numpy arrays
+
+    Arguments:
+        result: dict
+            region result to flush
+    """
+    if len(result['starts']) > 0:
+        result['intervals'].append((np.array(result['starts'], dtype=np.int64), np.array(result['ends'], dtype=np.int64)))
+        result['starts'] = []
+        result['ends'] = []
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+import os
+import json
+import hashlib
+from Sequenoscope.utils.__init__ import compute_fingerprint, compute_sha256
+
+
+def result_file_paths(result):
+    """
+    Collects the paths of the files of a stage result, the result_files of the runners are nested dicts
+    and lists of paths
+
+    Arguments:
+        result: dict, list or str
+            result of a stage
+
+    Returns:
+        list:
+            sorted paths of the result that name files
+    """
+    paths = set()
+    if isinstance(result, dict):
+        for value in result.values():
+            paths.update(result_file_paths(value))
+    elif isinstance(result, (list, tuple)):
+        for value in result:
+            paths.update(result_file_paths(value))
+    elif isinstance(result, str) and os.path.isfile(result):
+        paths.add(result)
+    return sorted(paths)
+
+
+class StageCheckpoints:
+    checkpoint_file = None
+    full_hash = False
+    records = None
+    fingerprints = None
+
+    def __init__(self, checkpoint_file, full_hash=False):
+        """
+        Initalize the class with the path of the checkpoint file. A checkpoint is recorded for every stage that
+        finished, keyed on the name and parameters of the stage and the fingerprints of its input files. A stage
+        whose key is unchanged and whose output files still have the recorded fingerprints is complete and does
+        not need to run again.
+
+        Arguments:
+            checkpoint_file: str
+                path of the json file holding the checkpoints, created when missing
+            full_hash: bool
+                fingerprint files with the sha256 of their whole content instead of their size and sampled
+                blocks, see compute_fingerprint. default is False
+        """
+        self.checkpoint_file = checkpoint_file
+        self.full_hash = full_hash
+        self.records = {}
+        self.fingerprints = {}
+        if os.path.isfile(checkpoint_file):
+            with open(checkpoint_file) as f:
+                self.records = json.load(f)
+
+    def fingerprint(self, path):
+        """
+        Fingerprints a file, the fingerprint of a file is computed once per run
+
+        Arguments:
+            path: str
+                path of the file
+
+        Returns:
+            str:
+                fingerprint of the file, empty if the file does not exist
+        """
+        if not os.path.isfile(path):
+            return ""
+        if path not in self.fingerprints:
+            if self.full_hash:
+                self.fingerprints[path] = compute_sha256(path)
+            else:
+                self.fingerprints[path] = compute_fingerprint(path)
+        return self.fingerprints[path]
+
+    def stage_key(self, name, params, input_files):
+        """
+        Computes the key of a stage from its name, its parameters and the fingerprints of its input files
+
+        Arguments:
+            name: str
+                name of the stage
+            params: dict
+                parameters of the stage that change its outputs, values must be json serializable
+            input_files: list
+                paths of the files the stage reads
+
+        Returns:
+            str:
+                hex digest of the key
+        """
+        key = {"name": name, "params": params,
+               "inputs": [[path, self.fingerprint(path)] for path in sorted(set(input_files))]}
+        return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+    def lookup(self, name, key):
+        """
+        Returns the recorded result of a stage if its key is unchanged and its output files were not changed
+        since they were recorded
+
+        Arguments:
+            name: str
+                name of the stage
+            key: str
+                key of the stage, see stage_key
+
+        Returns:
+            dict:
+                recorded result of the stage, None if the stage has to run
+        """
+        record = self.records.get(name)
+        if record is None or record["key"] != key:
+            return None
+        for (path, fingerprint) in record["outputs"].items():
+            if self.fingerprint(path) != fingerprint:
+                return None
+        return record["result"]
+
+    def invalidate(self, name):
+        """
+        Removes the checkpoint of a stage before it runs, so a crash in the stage leaves no checkpoint behind
+
+        Arguments:
+            name: str
+                name of the stage
+        """
+        if self.records.pop(name, None) is not None:
+            self.save()
+
+    def record(self, name, key, result):
+        """
+        Records the checkpoint of a stage that finished
+
+        Arguments:
+            name: str
+                name of the stage
+            key: str
+                key of the stage, see stage_key
+            result: dict
+                result of the stage, the files it names are the outputs of the stage
+        """
+        outputs = {}
+        for path in result_file_paths(result):
+            self.fingerprints.pop(path, None)
+            outputs[path] = self.fingerprint(path)
+        self.records[name] = {"key": key, "result": result, "outputs": outputs}
+        self.save()
+
+    def outputs(self, name):
+        """
+        Returns the output files of a recorded stage
+
+        Arguments:
+            name: str
+                name of the stage
+
+        Returns:
+            list:
+                paths of the output files, empty if the stage has no checkpoint
+        """
+        record = self.records.get(name)
+        if record is None:
+            return []
+        return sorted(record["outputs"])
+
+    def save(self):
+        """
+        Writes the checkpoints to a temporary file that replaces the checkpoint file, so an interrupted write
+        never leaves a truncated checkpoint file
+        """
+        tmp_file = f"{self.checkpoint_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.records, f, indent=1)
+        os.replace(tmp_file, self.checkpoint_file)
+
+    def clear(self):
+        """
+        Removes every checkpoint
+        """
+        self.records = {}
+        self.fingerprints = {}
+        if os.path.isfile(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+
+import numpy as np
+from Sequenoscope.constant import DefaultValues
+
+
+class CoverageEngine:
+    contig_lengths = None
+    diff_arrays = None
+    dtype = np.int32
+
+    def __init__(self, contig_lengths, dtype=np.int32):
+        """
+        Initalize the class with the lengths of the contigs that coverage will be tracked for.
+        Difference arrays are only allocated for a contig once it receives its first interval.
+
+        Arguments:
+            contig_lengths: dict
+                a dictionary of contig ids and their lengths
+            dtype: numpy dtype
+                integer type used to store per-base depth, default is int32
+        """
+        self.contig_lengths = dict(contig_lengths)
+        self.dtype = dtype
+        self.diff_arrays = {}
+
+    def add_intervals(self, contig_id, starts, ends):
+        """
+        Adds a batch of half-open [start, end) intervals to the difference array of a contig.
+        Each interval adds +1 at its start and -1 at its end, intervals are clipped to the contig length.
+
+        Arguments:
+            contig_id: str
+                contig the intervals belong to
+            starts: list or numpy array
+                0-based start positions of the intervals
+            ends: list or numpy array
+                0-based exclusive end positions of the intervals
+        """
+        length = self.contig_lengths[contig_id]
+        if length == 0 or len(starts) == 0:
+            return
+        starts = np.clip(np.asarray(starts, dtype=np.int64), 0, length)
+        ends = np.clip(np.asarray(ends, dtype=np.int64), 0, length)
+        keep = ends > starts
+        starts = starts[keep]
+        ends = ends[keep]
+        if contig_id not in self.diff_arrays:
+            self.diff_arrays[contig_id] = np.zeros(length + 1, dtype=self.dtype)
+        diff = self.diff_arrays[contig_id]
+        if len(starts) * 8 < length:
+            np.add.at(diff, starts, 1)
+            np.subtract.at(diff, ends, 1)
+        else:
+            diff += np.bincount(starts, minlength=length + 1).astype(self.dtype)
+            diff -= np.bincount(ends, minlength=length + 1).astype(self.dtype)
+
+    def get_depth(self, contig_id):
+        """
+        Resolves the difference array of a contig into per-base depth with a cumulative sum.
+        Contigs that never received an interval resolve to all zeros.
+
+        Arguments:
+            contig_id: str
+                contig to resolve
+
+        Returns:
+            numpy array:
+                depth at every position of the contig
+        """
+        if contig_id not in self.diff_arrays:
+            return np.zeros(self.contig_lengths[contig_id], dtype=self.dtype)
+        return np.cumsum(self.diff_arrays[contig_id][:-1], dtype=self.dtype)
+
+    def mean_cov(self, contig_id, depth=None):
+        """
+        Calculates the mean depth across all positions of a contig
+
+        Arguments:
+            contig_id: str
+                contig to summarize
+            depth: numpy array
+                already resolved depth of the contig, resolved from the difference array if not given
+
+        Returns:
+            float:
+                mean depth, 0 for contigs of length 0
+        """
+        if self.contig_lengths[contig_id] == 0:
+            return 0
+        if depth is None:
+            depth = self.get_depth(contig_id)
+        return float(depth.mean(dtype=np.float64))
+
+    def covered_bases(self, contig_id, min_value=1, max_value=9999999999999, depth=None):
+        """
+        Counts positions of a contig where the depth is >=min and <= max
+
+        Arguments:
+            contig_id: str
+                contig to summarize
+            min_value: int
+                minimum coverage value
+            max_value: int
+                maximum coverage value
+            depth: numpy array
+                already resolved depth of the contig, resolved from the difference array if not given
+
+        Returns:
+            int:
+                number of positions meeting this threshold
+        """
+        if depth is None:
+            depth = self.get_depth(contig_id)
+        return int(np.count_nonzero((depth >= min_value) & (depth <= max_value)))
+
+    def binned_depth(self, contig_id, bin_size):
+        """
+        Calculates the mean depth of fixed-size windows along a contig, the last window may be shorter
+
+        Arguments:
+            contig_id: str
+                contig to summarize
+            bin_size: int
+                width of the windows in bases
+
+        Returns:
+            numpy array:
+                mean depth of every window
+        """
+        length = self.contig_lengths[contig_id]
+        if length == 0:
+            return np.zeros(0, dtype=np.float64)
+        bounds = np.append(np.arange(0, length, bin_size), length)
+        sums = np.add.reduceat(self.get_depth(contig_id).astype(np.float64), bounds[:-1])
+        return sums / np.diff(bounds)
+
+    def release(self, contig_id):
+        """
+        Frees the coverage state of a contig once it was summarized
+
+        Arguments:
+            contig_id: str
+                contig to release
+        """
+        self.diff_arrays.pop(contig_id, None)
+
+
+class RunLengthCoverageEngine:
+    contig_lengths = None
+    events = None
+    pending_events = None
+    compacted_events = None
+    compact_threshold = DefaultValues.coverage_compact_events
+
+    def __init__(self, contig_lengths, compact_threshold=DefaultValues.coverage_compact_events):
+        """
+        Initalize the class with the lengths of the contigs that coverage will be tracked for. Instead of one
+        counter per base, the start (+1) and end (-1) events of the intervals are kept sparsely and periodically
+        compacted into sorted unique positions, so memory follows the number of distinct interval boundaries
+        rather than the length of the reference. Contigs only get state once they receive their first interval.
+
+        Arguments:
+            contig_lengths: dict
+                a dictionary of contig ids and their lengths
+            compact_threshold: int
+                number of pending events of a contig that triggers a compaction
+        """
+        self.contig_lengths = dict(contig_lengths)
+        self.compact_threshold = compact_threshold
+        self.events = {}
+        self.pending_events = {}
+        self.compacted_events = {}
+
+    def add_intervals(self, contig_id, starts, ends):
+        """
+        Adds a batch of half-open [start, end) intervals to a contig, intervals are clipped to the contig length
+
+        Arguments:
+            contig_id: str
+                contig the intervals belong to
+            starts: list or numpy array
+                0-based start positions of the intervals
+            ends: list or numpy array
+                0-based exclusive end positions of the intervals
+        """
+        length = self.contig_lengths[contig_id]
+        if length == 0 or len(starts) == 0:
+            return
+        starts = np.clip(np.asarray(starts, dtype=np.int64), 0, length)
+        ends = np.clip(np.asarray(ends, dtype=np.int64), 0, length)
+        keep = ends > starts
+        starts = starts[keep]
+        ends = ends[keep]
+        if contig_id not in self.events:
+            self.events[contig_id] = []
+            self.pending_events[contig_id] = 0
+            self.compacted_events[contig_id] = 0
+        positions = np.concatenate([starts, ends])
+        deltas = np.concatenate([np.ones(len(starts), dtype=np.int64), np.full(len(ends), -1, dtype=np.int64)])
+        self.events[contig_id].append((positions, deltas))
+        self.pending_events[contig_id] += len(positions)
+        if self.pending_events[contig_id] >= max(self.compact_threshold, self.compacted_events[contig_id]):
+            self.compact(contig_id)
+
+    def compact(self, contig_id):
+        """
+        Merges the events of a contig into sorted unique positions with their summed deltas, dropping positions
+        where the deltas cancel out
+
+        Arguments:
+            contig_id: str
+                contig to compact
+
+        Returns:
+            tuple:
+                numpy arrays of the sorted positions and their deltas
+        """
+        if contig_id not in self.events:
+            return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        chunks = self.events[contig_id]
+        if len(chunks) > 1 or self.pending_events[contig_id] > 0:
+            positions = np.concatenate([chunk[0] for chunk in chunks])
+            deltas = np.concatenate([chunk[1] for chunk in chunks])
+            positions, inverse = np.unique(positions, return_inverse=True)
+            deltas = np.bincount(inverse, weights=deltas, minlength=len(positions)).astype(np.int64)
+            keep = deltas != 0
+            chunks = [(positions[keep], deltas[keep])]
+            self.events[contig_id] = chunks
+            self.pending_events[contig_id] = 0
+            self.compacted_events[contig_id] = len(chunks[0][0])
+        return chunks[0]
+
+    def get_runs(self, contig_id):
+        """
+        Resolves the events of a contig into runs of constant depth covering the whole contig
+
+        Arguments:
+            contig_id: str
+                contig to resolve
+
+        Returns:
+            tuple:
+                numpy arrays of the run starts, run lengths and run depths
+        """
+        length = self.contig_lengths[contig_id]
+        (positions, deltas) = self.compact(contig_id)
+        if len(positions) == 0 or positions[0] != 0:
+            positions = np.insert(positions, 0, 0)
+            deltas = np.insert(deltas, 0, 0)
+        depths = np.cumsum(deltas)
+        run_lengths = np.diff(np.append(positions, length))
+        keep = run_lengths > 0
+        return (positions[keep], run_lengths[keep], depths[keep])
+
+    def get_depth(self, contig_id):
+        """
+        Materializes the exact per-base depth of a contig, only needed when per-base coverage is requested
+
+        Arguments:
+            contig_id: str
+                contig to resolve
+
+        Returns:
+            numpy array:
+                depth at every position of the contig
+        """
+        if self.contig_lengths[contig_id] == 0:
+            return np.zeros(0, dtype=np.int32)
+        (run_starts, run_lengths, depths) = self.get_runs(contig_id)
+        return np.repeat(depths, run_lengths).astype(np.int32)
+
+    def mean_cov(self, contig_id, depth=None):
+        """
+        Calculates the mean depth across all positions of a contig from its runs
+
+        Arguments:
+            contig_id: str
+                contig to summarize
+            depth: numpy array
+                unused, accepted for compatibility with CoverageEngine
+
+        Returns:
+            float:
+                mean depth, 0 for contigs of length 0
+        """
+        length = self.contig_lengths[contig_id]
+        if length == 0:
+            return 0
+        (run_starts, run_lengths, depths) = self.get_runs(contig_id)
+        return float(np.dot(depths, run_lengths) / length)
+
+    def covered_bases(self, contig_id, min_value=1, max_value=9999999999999, depth=None):
+        """
+        Counts positions of a contig where the depth is >=min and <= max from its runs
+
+        Arguments:
+            contig_id: str
+                contig to summarize
+            min_value: int
+                minimum coverage value
+            max_value: int
+                maximum coverage value
+            depth: numpy array
+                unused, accepted for compatibility with CoverageEngine
+
+        Returns:
+            int:
+                number of positions meeting this threshold
+        """
+        if self.contig_lengths[contig_id] == 0:
+            return 0
+        (run_starts, run_lengths, depths) = self.get_runs(contig_id)
+        return int(run_lengths[(depths >= min_value) & (depths <= max_value)].sum())
+
+    def binned_depth(self, contig_id, bin_size):
+        """
+        Calculates the exact mean depth of fixed-size windows along a contig from its runs, the last window may be shorter
+
+        Arguments:
+            contig_id: str
+                contig to summarize
+            bin_size: int
+                width of the windows in bases
+
+        Returns:
+            numpy array:
+                mean depth of every window
+        """
+        length = self.contig_lengths[contig_id]
+        if length == 0:
+            return np.zeros(0, dtype=np.float64)
+        (run_starts, run_lengths, depths) = self.get_runs(contig_id)
+        cumulative = np.concatenate([[0], np.cumsum(depths * run_lengths)]).astype(np.float64)
+        bounds = np.append(np.arange(0, length, bin_size), length)
+        run_index = np.searchsorted(run_starts, bounds, side='right') - 1
+        run_index = np.minimum(run_index, len(run_starts) - 1)
+        integral = cumulative[run_index] + depths[run_index] * (bounds - run_starts[run_index])
+        integral[-1] = cumulative[-1]
+        return np.diff(integral) / np.diff(bounds)
+
+    def release(self, contig_id):
+        """
+        Frees the coverage state of a contig once it was summarized
+
+        Arguments:
+            contig_id: str
+                contig to release
+        """
+        self.events.pop(contig_id, None)
+        self.pending_events.pop(contig_id, None)
+        self.compacted_events.pop(contig_id, None)
@@ -16,7 +16,7 @@ class FastPRunner:
     threads = 1
     status = False
     error_messages = None
-    result_files = {"html":"", "json":"", "output_files_fastp":[]}
+    result_files = None
     paired = False
 
     def __init__(self, read_set, out_dir, out_prefix, min_read_len=15, max_read_len=0, 
@@ -48,6 +48,7 @@ class FastPRunner:
             threads: int
                 an integer representing the number of threads utilized for the operation, default is 1
         """
+        self.result_files = {"html":"", "json":"", "output_files_fastp":[]}
         self.read_set = read_set
         self.out_dir = out_dir
         self.out_prefix = out_prefix
@@ -70,12 +71,34 @@ class FastPRunner:
             bool:
                 returns True if the generated output file is found and not empty, False otherwise
         """
+        cmd = "fastp {}".format(" ".join(self.build_command()))
+        (self.stdout, self.stderr) = run_command(cmd)
+        self.status = self.check_files([self.result_files["json"], self.result_files["html"]] +
+                                       self.result_files["output_files_fastp"])
+        if self.status == False:
+            self.error_messages = "one or more files was not created or was empty, check error message\n{}".format(self.stderr)
+            raise ValueError(str(self.error_messages))
+
+    def build_command(self, stream=False):
+        """
+        Builds the arguments of the fastp command and sets the result files
+
+        Arguments:
+            stream: bool
+                write the filtered reads to stdout instead of fastq files, paired reads are interleaved.
+                default is False
+
+        Returns:
+            list:
+                arguments of the fastp command, without the program name
+        """
         json = os.path.join(self.out_dir,f"{self.out_prefix}.json")
         html = os.path.join(self.out_dir,f"{self.out_prefix}.html")
         out1 = os.path.join(self.out_dir,f"{self.out_prefix}.fastp.fastq")
 
         self.result_files["html"] = html
         self.result_files["json"] = json
+        self.result_files["output_files_fastp"] = []
 
         cmd_args = {'-j':json, '-h':html, '-w':self.threads}
         cmd_args['-i'] = self.read_set.files[0]
@@ -86,23 +109,24 @@ class FastPRunner:
         if self.paired:
             cmd_args['-I'] = self.read_set.files[1]
             out2 = os.path.join(self.out_dir,f"{self.out_prefix_2}.fastp.fastq")
-            if not self.report_only:
+            if not self.report_only and not stream:
                 cmd_args['-O'] = out2
         if self.dedup:
             cmd_args['-D'] = ''
-        if not self.report_only:
+        if stream:
+            cmd_args['--stdout'] = ''
+        elif not self.report_only:
             cmd_args['-o'] = out1
             self.result_files["output_files_fastp"].append(out1)
             if self.paired:
                 self.result_files["output_files_fastp"].append(out2)
-            
 
-        cmd = "fastp {}".format((" ".join(f'{k} {v}' for k,v in cmd_args.items())))
-        (self.stdout, self.stderr) = run_command(cmd)
-        self.status = self.check_files([json, html] + self.result_files["output_files_fastp"])
-        if self.status == False:
-            self.error_messages = "one or more files was not created or was empty, check error message\n{}".format(self.stderr)
-            raise ValueError(str(self.error_messages))
+        cmd = []
+        for k,v in cmd_args.items():
+            cmd.append(k)
+            if v != '':
+                cmd.append(str(v))
+        return cmd
 
     def check_files(self, files_to_check):
         """
@@ -1,13 +1,15 @@
 #!/usr/bin/env python
 import os
 from Sequenoscope.constant import DefaultValues
+from Sequenoscope.utils.compressed import open_input
+from Sequenoscope.utils.read_id_index import write_read_ids
 
 class FastqExtractor:
     out_prefix = None
     out_dir = None
     read_set = None
     status = False
-    result_files = {"read_list_file":""}
+    result_files = None
     
     def __init__(self, read_set, out_prefix, out_dir):
         """
@@ -21,6 +23,7 @@ class FastqExtractor:
             out_dir: str
                 a string to the path where the output files will be stored
         """
+        self.result_files = {"read_list_file":""}
         self.reads = []
         self.out_prefix = out_prefix
         self.out_dir = out_dir
@@ -62,14 +65,14 @@ class FastqExtractor:
                 returns True if the generated output file is found and not empty, False otherwise
         """
         forward_reads = []
-        with open(self.read_set.files[0], 'r') as f:
+        with open_input(self.read_set.files[0], 'r') as f:
             for line in f:
                 if line.startswith('@'):
                     if line.endswith('1\n'):
                         read_id = line.strip().split()[0][1:] #+ '_R1'
                         forward_reads.append(read_id)
         reverse_reads = []
-        with open(self.read_set.files[1], 'r') as f:
+        with open_input(self.read_set.files[1], 'r') as f:
             for line in f:
                 if line.startswith('@'):
                     if line.endswith('2\n'):
@@ -92,7 +95,7 @@ class FastqExtractor:
             split_delimitor: str
                 delimitor that is located by the read id before stripping the lines
         """
-        with open(file, 'r') as f:
+        with open_input(file, 'r') as f:
             for line in f:
                 if line.startswith(DefaultValues.fastq_line_starter):
                     if len(line.strip().split(split_delimiter)) >= DefaultValues.fastq_sample_row_number:
@@ -104,7 +107,8 @@ class FastqExtractor:
     
     def write_reads(self, read_lists=[]):
         """
-        Append the lines extracted from a list into a file output and check if the file was created
+        Write the reads extracted into lists as a binary read id index and check if the file was created,
+        see Sequenoscope.utils.read_id_index
 
         Arguments:
             read_lists: list
@@ -114,19 +118,10 @@ class FastqExtractor:
             bool:
                 returns True if the generated output file is found and not empty, False otherwise
         """
-        output_file = os.path.join(self.out_dir,f"{self.out_prefix}.txt")
+        output_file = os.path.join(self.out_dir,f"{self.out_prefix}.ridx")
         self.result_files["read_list_file"] = output_file
 
-        if len(read_lists) == 1:
-            with open(output_file, 'w') as f:
-                f.write("read_id\n")  # Write the header row
-                for read in read_lists[0]:
-                    f.write(f"{read}\n")
-        else:
-            with open(output_file, 'w') as f:
-                f.write("read_id\n")  # Write the header row
-                for read in read_lists[0] + read_lists[1]:
-                    f.write(f"{read}\n")
+        write_read_ids(output_file, read_lists)
             
         self.status = self.check_files(output_file)
         if self.status == False:
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+import os
+import json
+import numpy as np
+from Sequenoscope.utils.parser import fastq_parser
+from Sequenoscope.utils.read_stats import ReadStatsAccumulator
+from Sequenoscope.utils.read_id_index import ReadIdIndexWriter, mate_read_ids
+
+GC_BASES = np.zeros(256, dtype=np.int64)
+GC_BASES[list(b'GCgc')] = 1
+
+
+class FastqScanner:
+    out_prefix = None
+    out_dir = None
+    read_set = None
+    status = False
+    result_files = None
+    read_stats = None
+    gc_bases = 0
+    paired = False
+
+    def __init__(self, read_set, out_prefix, out_dir, paired=False):
+        """
+        Initalize the class with read_set, out_prefix, and out_dir. The scanner reads every fastq file of the
+        read set once and writes everything the later stages need from the raw reads: the read list, the
+        length and mean qscore of every read and the statistics of the whole read set.
+
+        Arguments:
+            read_set: sequence object
+                an object that contains the list of sequence files for analysis
+            out_prefix: str
+                a designation of what the output files will be named
+            out_dir: str
+                a string to the path where the output files will be stored
+            paired: bool
+                a designation of wheather or not the files are the two mates of paired-end sequencing data, the
+                reads are then keyed on their name and their mate, see mate_read_id. default is False
+        """
+        self.result_files = {"read_list_file":"", "read_stats_file":"", "stats_json":""}
+        self.out_prefix = out_prefix
+        self.out_dir = out_dir
+        self.read_set = read_set
+        self.read_stats = ReadStatsAccumulator()
+        self.gc_bases = 0
+        self.paired = paired
+
+    def scan(self):
+        """
+        Scans the fastq files of the read set in a single pass and writes the read list, the per read
+        statistics and the read set statistics
+
+        Returns:
+            bool:
+                returns True if the generated output files are found and not empty, False otherwise
+        """
+        read_list_file = os.path.join(self.out_dir, f"{self.out_prefix}_read_list.ridx")
+        read_stats_file = os.path.join(self.out_dir, f"{self.out_prefix}_read_stats.txt")
+        stats_json = os.path.join(self.out_dir, f"{self.out_prefix}_stats.json")
+        self.result_files["read_list_file"] = read_list_file
+        self.result_files["read_stats_file"] = read_stats_file
+        self.result_files["stats_json"] = stats_json
+
+        read_list_out = ReadIdIndexWriter(read_list_file)
+        with open(read_stats_file, 'w') as read_stats_out:
+            read_stats_out.write("read_id\tread_len\tread_qscore\n")
+            for (file_num, fastq_file) in enumerate(self.read_set.files):
+                mate = file_num + 1 if self.paired else 0
+                for batch in fastq_parser(fastq_file).parse_batches():
+                    self.scan_batch(batch, read_list_out, read_stats_out, mate)
+        read_list_out.close()
+        self.write_stats(stats_json)
+
+        self.status = self.check_files([read_list_file, read_stats_file, stats_json])
+        if self.status == False:
+            self.error_messages = "one or more files was not created or was empty"
+            raise ValueError(str(self.error_messages))
+        return self.status
+
+    def scan_batch(self, batch, read_list_out, read_stats_out, mate=0):
+        """
+        Adds the reads of a batch to the read list, writes their per read statistics and adds them to the read
+        set statistics
+
+        Arguments:
+            batch: FastqBatch
+                batch of fastq records
+            read_list_out: ReadIdIndexWriter
+                writer of the read list
+            read_stats_out: file object
+                open per read statistics file
+            mate: int
+                mate of the reads of the batch, 0 when they are not paired
+        """
+        read_ids = mate_read_ids(batch.read_ids(), mate)
+        lengths = batch.lengths()
+        qscores = batch.qscore_values()
+        if len(read_ids) == 0:
+            return
+        read_list_out.add(read_ids)
+        read_stats_out.write("\n".join(map("{}\t{}\t{!r}".format, read_ids, lengths.tolist(), qscores)))
+        read_stats_out.write("\n")
+        self.read_stats.add_many(lengths, qscores)
+        gc_sums = np.cumsum(GC_BASES[np.frombuffer(batch.buffer, dtype=np.uint8)])
+        gc_sums = np.concatenate([[0], gc_sums])
+        self.gc_bases += int((gc_sums[batch.seq_ends] - gc_sums[batch.seq_starts]).sum())
+
+    def write_stats(self, stats_json):
+        """
+        Writes the statistics of the read set as json
+
+        Arguments:
+            stats_json: str
+                path of the json file
+        """
+        read_stats = self.read_stats
+        gc_content = 0
+        if read_stats.total_bases > 0:
+            gc_content = self.gc_bases / read_stats.total_bases
+        length_hist = {}
+        for length_bin in sorted(read_stats.length_hist):
+            length_hist[read_stats.length_bin_value(length_bin)] = read_stats.length_hist[length_bin]
+        stats = {'num_reads': read_stats.num_reads, 'total_bases': read_stats.total_bases,
+                 'mean_read_length': read_stats.mean_length(), 'median_read_length': read_stats.median_length(),
+                 'n50': read_stats.n50(), 'mean_qscore': read_stats.mean_qscore(),
+                 'median_qscore': read_stats.median_qscore(), 'gc_content': gc_content,
+                 'length_hist': length_hist}
+        with open(stats_json, 'w') as f:
+            json.dump(stats, f, indent=4)
+
+    def check_files(self, files_to_check):
+        """
+        check if the output file exists and is not empty
+
+        Arguments:
+            files_to_check: list
+                list of file paths
+
+        Returns:
+            bool:
+                returns True if the generated output file is found and not empty, False otherwise
+        """
+        if isinstance (files_to_check, str):
+            files_to_check = [files_to_check]
+        for f in files_to_check:
+            if not os.path.isfile(f):
+                return False
+            elif os.path.getsize(f) == 0:
+                return False
+        return True
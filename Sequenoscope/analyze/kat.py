@@ -8,7 +8,7 @@ class KatRunner:
     input_path = None
     ref_path = None
     out_path = None
-    result_files = {"sect":{"cvg":"", "tsv":""}, "filter":{"jf27":"", "filtered_fastq":[]}, "hist":{"png_file":"", "json_file":""}}
+    result_files = None
     error_messages = None
     status = False
     threads = 1
@@ -30,6 +30,7 @@ class KatRunner:
             kmersize: int
                 an integer representing the kmer size utilized for the kat filter method, default is 27
         """
+        self.result_files = {"sect":{"cvg":"", "tsv":""}, "filter":{"jf27":"", "filtered_fastq":[]}, "hist":{"png_file":"", "json_file":""}}
         self.input_path = input_path
         self.ref_path = ref_path
         self.out_path = out_path
@@ -116,7 +117,25 @@ class KatRunner:
             bool:
                 returns True if the generated output file is found and not empty, False otherwise
         """
-        input_fastq = self.input_path.out_files
+        kat_hist_cmd = " ".join(self.hist_command(self.input_path.files))
+        (self.stdout, self.stderr) = run_command(kat_hist_cmd)
+        self.status = self.check_files([self.result_files["hist"]["png_file"], self.result_files["hist"]["json_file"]])
+        if self.status == False:
+            self.error_messages = "one or more files was not created or was empty, check error message\n{}".format(self.stderr)
+            raise ValueError(str(self.error_messages))
+
+    def hist_command(self, input_files):
+        """
+        Builds the kat hist command and sets its result files
+
+        Arguments:
+            input_files: list
+                sequence files to count the kmers of, named pipes are read like files
+
+        Returns:
+            list:
+                arguments of the kat hist command
+        """
         out_file_hist = os.path.join(self.out_path, f"{self.out_prefix}_histogram_file")
         png_file = os.path.join(self.out_path, f"{self.out_prefix}_histogram_file.png")
         json_file = os.path.join(self.out_path, f"{self.out_prefix}_histogram_file.dist_analysis.json")
@@ -124,12 +143,7 @@ class KatRunner:
         self.result_files["hist"]["png_file"] = png_file
         self.result_files["hist"]["json_file"] = json_file
 
-        kat_hist_cmd = f"kat hist -t {self.threads} -m {self.kmersize} -o {out_file_hist} {input_fastq}"
-        (self.stdout, self.stderr) = run_command(kat_hist_cmd)
-        self.status = self.check_files([png_file, json_file])
-        if self.status == False:
-            self.error_messages = "one or more files was not created or was empty, check error message\n{}".format(self.stderr)
-            raise ValueError(str(self.error_messages))
+        return ["kat", "hist", "-t", f"{self.threads}", "-m", f"{self.kmersize}", "-o", out_file_hist] + list(input_files)
 
     def check_files(self, files_to_check):
         """
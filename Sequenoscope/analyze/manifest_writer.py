@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+import os
+from Sequenoscope.constant import ManifestFormats
+
+MANIFEST_FIELD_TYPES = {
+    'sample_id':'category', 'read_id':'string', 'read_len':'int', 'read_qscore':'float32', 'channel':'int32',
+    'start_time':'float', 'end_time':'float', 'decision':'category', 'fastp_status':'bool', 'is_mapped':'bool',
+    'is_uniq':'bool', 'contig_id':'category', 'est_genome_size':'float', 'est_kmer_coverage_depth':'float',
+    'total_bases':'int', 'total_fastp_bases':'int', 'mean_read_length':'float', 'mean_read_length_reverse':'float',
+    'taxon_id':'category', 'taxon_length':'int', 'taxon_covered_bases':'int', 'taxon_%_covered_bases':'float',
+    'taxon_mean_read_length':'float',
+}
+
+NULL_VALUES = ['', 'None', 'N/A']
+
+
+def manifest_path(out_dir, out_prefix, manifest_format=ManifestFormats.text):
+    """
+    Returns the path of a manifest file for an output format
+
+    Arguments:
+        out_dir: str
+            a designation of the output directory
+        out_prefix: str
+            a designation of what the output files will be named
+        manifest_format: str
+            'text' or 'parquet'
+
+    Returns:
+        str:
+            path of the manifest file
+    """
+    if manifest_format == ManifestFormats.parquet:
+        return os.path.join(out_dir, f"{out_prefix}.parquet")
+    return os.path.join(out_dir, f"{out_prefix}.txt")
+
+def create_manifest_writer(path, fields, manifest_format=ManifestFormats.text):
+    """
+    Creates the writer of a manifest file for an output format
+
+    Arguments:
+        path: str
+            path of the manifest file
+        fields: list
+            names of the manifest columns
+        manifest_format: str
+            'text' or 'parquet'
+
+    Returns:
+        ManifestTextWriter or ManifestParquetWriter:
+            open manifest writer
+    """
+    if manifest_format == ManifestFormats.parquet:
+        return ManifestParquetWriter(path, fields)
+    if manifest_format == ManifestFormats.text:
+        return ManifestTextWriter(path, fields)
+    raise ValueError(f"Error manifest format {manifest_format} is not supported")
+
+
+class ManifestTextWriter:
+    path = None
+    fields = None
+    fout = None
+
+    def __init__(self, path, fields, delim="\t"):
+        """
+        Initalize the class with the path and the columns of a tab delimited manifest and write its header
+
+        Arguments:
+            path: str
+                path of the manifest file
+            fields: list
+                names of the manifest columns
+            delim: str
+                a string that designates the delimiter of the columns. default is tab delimiter
+        """
+        self.path = path
+        self.fields = list(fields)
+        self.delim = delim
+        self.fout = open(path, 'w')
+        self.fout.write("{}\n".format(self.delim.join(self.fields)))
+
+    def write_rows(self, rows):
+        """
+        Writes a batch of rows
+
+        Arguments:
+            rows: list
+                tuples of string values in the order of the fields
+        """
+        if len(rows) == 0:
+            return
+        self.fout.write("\n".join(map(self.delim.join, rows)))
+        self.fout.write("\n")
+
+    def write_columns(self, columns):
+        """
+        Writes a batch of rows given as columns
+
+        Arguments:
+            columns: list
+                one iterable of string values per field, all of the same length
+        """
+        self.write_rows(list(zip(*columns)))
+
+    def close(self):
+        """
+        Closes the manifest file
+        """
+        self.fout.close()
+
+
+class ManifestParquetWriter:
+    path = None
+    fields = None
+    schema = None
+    writer = None
+
+    def __init__(self, path, fields):
+        """
+        Initalize the class with the path and the columns of a Parquet manifest. Every batch of rows is written
+        as its own row group, so the manifest is streamed to disk. Columns are typed from MANIFEST_FIELD_TYPES:
+        flags are booleans, repeated labels such as the decision and contig_id are dictionary encoded, qscores
+        are float32, empty and N/A values are stored as nulls. pyarrow is an optional dependency and is only
+        imported when a Parquet manifest is requested.
+
+        Arguments:
+            path: str
+                path of the manifest file
+            fields: list
+                names of the manifest columns
+        """
+        try:
+            import pyarrow
+            import pyarrow.compute
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError("Error writing Parquet manifests requires pyarrow, install it with pip install pyarrow")
+        self.pa = pyarrow
+        self.pc = pyarrow.compute
+        self.path = path
+        self.fields = list(fields)
+        self.arrow_types = {
+            'string': pyarrow.string(), 'category': pyarrow.dictionary(pyarrow.int32(), pyarrow.string()),
+            'bool': pyarrow.bool_(), 'int': pyarrow.int64(), 'int32': pyarrow.int32(),
+            'float': pyarrow.float64(), 'float32': pyarrow.float32(),
+        }
+        self.field_types = [MANIFEST_FIELD_TYPES.get(field_id, 'string') for field_id in self.fields]
+        self.schema = pyarrow.schema([pyarrow.field(field_id, self.arrow_types[field_type])
+                                      for field_id, field_type in zip(self.fields, self.field_types)])
+        self.null_values = pyarrow.array(NULL_VALUES, type=pyarrow.string())
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression='zstd')
+
+    def arrow_column(self, values, field_type):
+        """
+        Converts the string values of a column into an arrow array of its manifest type
+
+        Arguments:
+            values: list
+                string values of the column
+            field_type: str
+                type of the column, see MANIFEST_FIELD_TYPES
+
+        Returns:
+            pyarrow Array:
+                typed column
+        """
+        array = self.pa.array(values, type=self.pa.string())
+        if field_type == 'string':
+            return array
+        if field_type == 'bool':
+            return self.pc.equal(array, 'True')
+        null_string = self.pa.scalar(None, type=self.pa.string())
+        if field_type == 'category':
+            array = self.pc.if_else(self.pc.equal(array, ''), null_string, array)
+            return self.pc.dictionary_encode(array).cast(self.arrow_types[field_type])
+        array = self.pc.if_else(self.pc.is_in(array, value_set=self.null_values), null_string, array)
+        return self.pc.cast(array, self.arrow_types[field_type])
+
+    def write_rows(self, rows):
+        """
+        Writes a batch of rows as one row group
+
+        Arguments:
+            rows: list
+                tuples of string values in the order of the fields
+        """
+        if len(rows) == 0:
+            return
+        self.write_columns(list(zip(*rows)))
+
+    def write_columns(self, columns):
+        """
+        Writes a batch of rows given as columns as one row group
+
+        Arguments:
+            columns: list
+                one iterable of string values per field, all of the same length
+        """
+        arrays = []
+        for values, field_type in zip(columns, self.field_types):
+            arrays.append(self.arrow_column(list(values), field_type))
+        if len(arrays) == 0 or len(arrays[0]) == 0:
+            return
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        """
+        Closes the manifest file
+        """
+        self.writer.close()
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 
 import os
-from Sequenoscope.constant import DefaultValues
+from Sequenoscope.constant import DefaultValues, Minimap2Presets
 from Sequenoscope.utils.__init__ import run_command
 
 
@@ -10,14 +10,16 @@ class Minimap2Runner:
     out_dir = None
     out_prefix = None
     ref_database = None
+    ref_index = None
     threads = 1
     kmer_size = 15
     status = False
     error_messages = None
-    result_files =  {"sam_output_file":""}
+    result_files = None
     paired = False
 
-    def __init__(self, read_set, out_dir, ref_database, out_prefix, threads=1, kmer_size=DefaultValues.minimap2_kmer_size):
+    def __init__(self, read_set, out_dir, ref_database, out_prefix, threads=1, kmer_size=DefaultValues.minimap2_kmer_size,
+                 ref_index=None):
         """
         Initalize the class with read_set, out_dir, ref_database, and out_prefix
 
@@ -34,13 +36,18 @@ class Minimap2Runner:
                 an integer representing the number of threads utilized for the operation, default is 1
             kmersize: int
                 an integer representing the kmer size utilized for the kat filter method, default is 15
+            ref_index: str
+                a string to the path of a prebuilt minimap2 index of the reference, built with the kmer size and
+                preset of the runner, see ReferenceIndexCache. default is None to index the reference on every run
         """
+        self.result_files = {"sam_output_file":""}
         self.read_set = read_set
         self.out_dir = out_dir
         self.out_prefix = out_prefix
         self.ref_database = ref_database
         self.threads = threads
         self.kmer_size = kmer_size
+        self.ref_index = ref_index
         self.paired = self.read_set.is_paired
 
     def run_minimap2(self):
@@ -55,13 +62,7 @@ class Minimap2Runner:
         
         self.result_files["sam_output_file"] = sam_file
 
-        cmd = ["minimap2", "-ax", "-t", f"{self.threads}", "-k", f"{self.kmer_size}", self.ref_database, 
-        self.read_set.out_files, ">", sam_file]
-        
-        if self.paired:
-            cmd.insert(2, "sr")
-        else:
-            cmd.insert(2, "map-ont")
+        cmd = self.build_command(self.read_set.files) + [">", sam_file]
 
         cmd_string = " ".join(cmd)
 
@@ -71,6 +72,37 @@ class Minimap2Runner:
             self.error_messages = "one or more files was not created or was empty, check error message\n{}".format(self.stderr)
             raise ValueError(str(self.error_messages))
     
+    def build_command(self, input_files):
+        """
+        Builds the minimap2 command writing the alignments as sam to stdout
+
+        Arguments:
+            input_files: list
+                fastq files to map, '-' reads the reads from stdin. An interleaved stream of paired reads is
+                mapped as pairs by the short read preset
+
+        Returns:
+            list:
+                arguments of the minimap2 command
+        """
+        reference = self.ref_database
+        if self.ref_index is not None:
+            reference = self.ref_index
+        return ["minimap2", "-ax", self.preset(), "-t", f"{self.threads}", "-k", f"{self.kmer_size}",
+                reference] + list(input_files)
+
+    def preset(self):
+        """
+        Returns the minimap2 preset of the reads, 'sr' for paired-end short reads and 'map-ont' otherwise
+
+        Returns:
+            str:
+                name of the preset
+        """
+        if self.paired:
+            return Minimap2Presets.short_reads
+        return Minimap2Presets.nanopore
+
     def check_files(self, files_to_check):
         """
         check if the output file exists and is not empty
@@ -11,7 +11,7 @@ class SamBamProcessor:
     threads = 1
     status = False
     error_messages = None
-    result_files = {"bam_output":"", "fastq_output":"", "bam_output":"", "coverage_tsv":""}
+    result_files = None
     
     
     def __init__(self, file, out_dir, ref_database, out_prefix, thread=1):
@@ -30,6 +30,7 @@ class SamBamProcessor:
             threads: int
                 an integer representing the number of threads utilized for the operation, default is 1
         """
+        self.result_files = {"bam_output":"", "fastq_output":"", "bam_output":"", "coverage_tsv":""}
         self.file = file
         self.out_dir = out_dir
         self.ref_database = ref_database
@@ -52,9 +53,7 @@ class SamBamProcessor:
         
         self.result_files["bam_output"] = bam_output
         
-        cmd = ["samtools", "view", "-S", "-b", self.file, "|",
-               "samtools", "sort", "-@", f"{self.threads}", "-T", self.out_prefix, "--reference", self.ref_database,
-               "-o", bam_output]
+        cmd = ["samtools", "view", "-S", "-b", self.file, "|"] + self.sort_command(bam_output)
 
         cmd_string = " ".join(cmd)
 
@@ -64,6 +63,23 @@ class SamBamProcessor:
             self.error_messages = "one or more files was not created or was empty, check error message\n{}".format(self.stderr)
             raise ValueError(str(self.error_messages))
 
+    def sort_command(self, bam_output, input_file='-'):
+        """
+        Builds the samtools sort command that sorts alignments into a bam file
+
+        Arguments:
+            bam_output: str
+                path of the sorted bam file
+            input_file: str
+                sam or bam file to sort, default is '-' to read the alignments from stdin
+
+        Returns:
+            list:
+                arguments of the samtools sort command
+        """
+        return ["samtools", "sort", "-@", f"{self.threads}", "-T", self.out_prefix, "--reference", self.ref_database,
+                "-o", bam_output, input_file]
+
     def run_samtools_fastq(self):
         """
         Run the samtools fastq command to convert the designated bam file to a fastq file
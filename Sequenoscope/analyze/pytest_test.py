@@ -6,10 +6,37 @@ from Sequenoscope.analyze.fastP import FastPRunner
 from Sequenoscope.analyze.minimap2 import Minimap2Runner
 from Sequenoscope.analyze.processing import SamBamProcessor
 from Sequenoscope.analyze.bam import BamProcessor
+from Sequenoscope.analyze.coverage import CoverageEngine, RunLengthCoverageEngine
+from Sequenoscope.utils.qscore import calc_mean_qscore, calc_mean_qscores
+from Sequenoscope.utils.read_stats import ReadStatsAccumulator
 from Sequenoscope.analyze.seq_manifest import SeqManifest
 from Sequenoscope.analyze.fastq_extractor import FastqExtractor
+from Sequenoscope.analyze.fastq_scanner import FastqScanner
 from Sequenoscope.utils.parser import FastqPairedEndRenamer
+from Sequenoscope.utils.parser import fastq_parser
+from Sequenoscope.utils.compressed import open_input, detect_compression
+from pysam.libcbgzf import BGZFile
+import pysam
+import gzip
 from Sequenoscope.analyze.seq_manifest import SeqManifestSummary
+import numpy as np
+import pytest
+from Sequenoscope.analyze.manifest_writer import create_manifest_writer
+from Sequenoscope.utils.read_store import ReadStore, MemoryBudget
+from Sequenoscope.utils.read_registry import ReadRegistry, encode_read_ids, hash_read_ids
+from Sequenoscope.utils import read_registry
+from Sequenoscope.utils.read_id_index import write_read_ids, load_read_ids, mate_read_id
+from Sequenoscope.constant import ReadRecords, DefaultValues, CoverageModes, BamProcessingModes
+from Sequenoscope.analyze.stream import copy_stream, open_fifo_writer
+from Sequenoscope.analyze.scheduler import StageScheduler, split_threads
+from Sequenoscope.analyze.checkpoint import StageCheckpoints
+from Sequenoscope.analyze.reference_index import ReferenceIndexCache
+from Sequenoscope.analyze import reference_index
+from concurrent.futures import ThreadPoolExecutor
+from Sequenoscope.utils.__init__ import compute_fingerprint
+import os
+import sys
+import subprocess
 
 path_ref_file = "/home/ameknas/sequenoscope-1/Sequenoscope/analyze/test_sequences/lambda_genome_reference.fasta"
 path_enriched_test_file = "/home/ameknas/sequenoscope-1/Sequenoscope/analyze/test_sequences/Test_br1_sal_lam_enriched.fastq"
@@ -185,3 +212,457 @@ def test_run_seq_manifest_no_sum():
 #     assert seq_summary_run.status == True
 #     pass
     
+
+def test_coverage_engine():
+    engine = CoverageEngine({"contig_1": 10, "contig_2": 0})
+    engine.add_intervals("contig_1", [0, 2, 8], [4, 6, 15])
+    engine.add_intervals("contig_2", [0], [5])
+    depth = engine.get_depth("contig_1")
+    assert list(depth) == [1, 1, 2, 2, 1, 1, 0, 0, 1, 1]
+    assert engine.mean_cov("contig_1") == 1.0
+    assert engine.covered_bases("contig_1") == 8
+    assert engine.covered_bases("contig_1", min_value=2) == 2
+    assert engine.mean_cov("contig_2") == 0
+    pass
+
+def test_calc_mean_qscores():
+    assert round(calc_mean_qscore(bytes([10, 10, 10])), 6) == 10.0
+    assert round(calc_mean_qscore("+++", offset=33), 6) == 10.0
+    assert calc_mean_qscore(None) == 0
+    qscores = calc_mean_qscores(["+++", "", "55"], offset=33)
+    assert [round(q, 6) for q in qscores] == [10.0, 0.0, 20.0]
+    pass
+
+def test_read_stats_accumulator():
+    forward = ReadStatsAccumulator()
+    reverse = ReadStatsAccumulator()
+    for length, qscore in [(100, 10.0), (400, 20.0), (300, 12.0)]:
+        forward.add(length, qscore)
+    reverse.add(200, 14.0)
+    forward.merge(reverse)
+    assert forward.num_reads == 4
+    assert forward.mean_length() == 250
+    assert forward.median_length() == 250
+    assert forward.n50() == 200
+    assert round(forward.mean_qscore(), 6) == 14.0
+    assert round(forward.median_qscore(), 6) == 13.0
+    assert ReadStatsAccumulator().n50() == 0
+    pass
+
+def test_run_length_coverage_engine():
+    engine = RunLengthCoverageEngine({"contig_1": 10}, compact_threshold=2)
+    engine.add_intervals("contig_1", [0, 2], [4, 6])
+    engine.add_intervals("contig_1", [8], [15])
+    assert list(engine.get_depth("contig_1")) == [1, 1, 2, 2, 1, 1, 0, 0, 1, 1]
+    assert engine.mean_cov("contig_1") == 1.0
+    assert engine.covered_bases("contig_1") == 8
+    assert list(engine.binned_depth("contig_1", 4)) == [1.5, 0.5, 1.0]
+    pass
+
+def test_instance_state_is_isolated():
+    first_extractor = FastqExtractor(None, "first", "first_dir")
+    second_extractor = FastqExtractor(None, "second", "second_dir")
+    first_extractor.result_files["read_list_file"] = "first_read_list.txt"
+    assert second_extractor.result_files["read_list_file"] == ""
+    paired_summary = SeqManifestSummary("paired", None, "paired", "out_dir", paired=True)
+    single_summary = SeqManifestSummary("single", None, "single", "out_dir")
+    assert "mean_read_length_reverse" in paired_summary.fields
+    assert "mean_read_length_reverse" not in single_summary.fields
+    assert "mean_read_length_reverse" not in SeqManifestSummary.fields
+    pass
+
+def test_bam_read_index():
+    bam_processor = BamProcessor("missing.bam")
+    bam_processor.index_reads("contig_1", {"read_1": (100, 10.0), "read_2": (50, 12.0)})
+    bam_processor.index_reads("contig_2", {"read_1": (0, 0)})
+    bam_processor.index_reads("contig_2", {"read_1": (0, 0)})
+    bam_processor.index_reads("*", {"read_3": (80, 9.0)})
+    assert bam_processor.read_index["read_1"] == (("contig_1", "contig_2"), 0, 0)
+    assert bam_processor.read_index["read_2"] == (("contig_1",), 50, 12.0)
+    assert bam_processor.read_index["read_3"] == ((), 80, 9.0)
+    pass
+
+def test_manifest_join_reads():
+    manifest = SeqManifest("sample", "missing.bam", "manifest", "out_dir")
+    manifest.filtered_reads = {"read_1": [100, 10.0]}
+    header = ["read_id", "channel"]
+    rows = [["read_1", "5"], ["read_2", "7"], ["read_3"]]
+    mapped = {"read_1": ("contig_1", "contig_2"), "read_3": ("contig_1",)}
+    join_row = lambda row, lookups: ([row[0], "100"], lookups["mapped"].get(row[0], ()), row[0]) if row[0] != "read_2" else None
+    joined = list(manifest.join_reads(rows, header, ["read_id", "read_len"], join_row, {"mapped": mapped}))
+    assert joined[0] == ("", "read_1", "100", "", "5", "", "", "", "True", "True", "False", "contig_1")
+    assert joined[1][-1] == "contig_2"
+    assert joined[2] == ("", "read_3", "100", "", "", "", "", "", "False", "True", "True", "contig_1")
+    assert len(joined) == 3
+    pass
+
+def test_manifest_join_contigs_columnar():
+    manifest = SeqManifest("sample", "missing.bam", "manifest", "out_dir")
+    manifest.bam_obj = BamProcessor("missing.bam")
+    manifest.bam_obj.index_reads("contig_1", {"read_1": (100, 10.0), "read_3": (80, 9.5)})
+    manifest.bam_obj.index_reads("contig_2", {"read_1": (100, 10.0)})
+    mapping = manifest.load_mapping_table()
+    read_ids = np.array(["read_1", "read_2", "read_3"], dtype=object)
+    (positions, num_contigs, rows, contig_ids) = manifest.join_contigs(mapping, read_ids)
+    assert list(num_contigs) == [2, 0, 1]
+    assert list(rows) == [0, 0, 1, 2]
+    assert list(contig_ids) == ["contig_1", "contig_2", "", "contig_1"]
+    assert list(mapping["read_len"][positions[[0, 2]]]) == ["100", "80"]
+    pass
+
+def test_read_registry():
+    registry = ReadRegistry(ReadRecords.mapping)
+    registry.update_many({"read_1": (("contig_1",), 100, 10.5), "read_2": ((), 50, 0)})
+    registry["read_3"] = (("contig_2", "contig_1"), 80, 9.0)
+    registry["read_1"] = (("contig_1", "contig_2"), 100, 10.5)
+    assert registry.get_many(["read_1", "read_2", "read_4"]) == {"read_1": (("contig_1", "contig_2"), 100, 10.5),
+                                                                "read_2": ((), 50, 0)}
+    assert str(registry["read_2"][2]) == "0"
+    assert list(registry.items())[2] == ("read_3", (("contig_2", "contig_1"), 80, 9.0))
+    registry.merge_recent()
+    del registry["read_2"]
+    assert "read_2" not in registry and "read_3" in registry
+    assert list(registry) == ["read_1", "read_3"]
+    registry["read_2"] = ((), 60, 8.0)
+    assert len(registry) == 3 and registry["read_2"] == ((), 60, 8.0)
+    registry = ReadRegistry(ReadRecords.stats)
+    registry.update_many({"a": (10, 12), "b": (10, np.float32(9.5)), "c": (10, 0.0)})
+    assert registry.get_many(["a", "b", "c"]) == {"a": (10, 12.0), "b": (10, 9.5), "c": (10, 0.0)}
+    assert str(registry["c"][1]) == "0.0"
+    with pytest.raises(ValueError):
+        registry["d"] = (10, None)
+    hashes = hash_read_ids(encode_read_ids(["read_1", "read_10", "read_1"]))
+    assert hashes[0] == hashes[2] and hashes[0] != hashes[1]
+    assert hash_read_ids(encode_read_ids(["ab"]))[0] == hash_read_ids(encode_read_ids(["ab", "x" * 20]))[0]
+    pass
+
+def test_read_registry_collisions(monkeypatch):
+    monkeypatch.setattr(read_registry, "hash_read_ids", lambda encoded: np.zeros(len(encoded), dtype=np.uint64))
+    registry = ReadRegistry()
+    registry.update_many({"read_1": True, "read_2": True})
+    registry.merge_recent()
+    registry["read_3"] = True
+    assert len(registry.collisions) == 2
+    assert registry.get_many(["read_3", "read_1", "read_4", "read_2"]) == {"read_3": True, "read_1": True, "read_2": True}
+    assert list(registry) == ["read_1", "read_2", "read_3"]
+    pass
+
+def test_read_id_index(tmp_path):
+    read_ids = ["read_%d" % i for i in range(1000)] + ["a_much_longer_read_id_%d" % i for i in range(10)] + ["read_5"]
+    index_file = str(tmp_path / "reads.ridx")
+    assert write_read_ids(index_file, [read_ids[:600], read_ids[600:]]) == len(read_ids)
+    index = load_read_ids(index_file)
+    assert index.mapped is not None
+    assert len(index) == len(read_ids)
+    assert list(index) == read_ids
+    assert list(index.contains_many(["read_5", "read_1000", "a_much_longer_read_id_3", "read"])) == [True, False, True, False]
+    assert "read_999" in index and "read_-1" not in index
+    index.close()
+    text_file = tmp_path / "reads.txt"
+    text_file.write_text("read_id\n" + "\n".join(read_ids) + "\n")
+    index = load_read_ids(str(text_file))
+    assert list(index) == read_ids
+    assert "a_much_longer_read_id_9" in index
+    pass
+
+def test_read_store_spill(tmp_path):
+    budget = MemoryBudget(1000000)
+    store = ReadStore(budget, str(tmp_path), ReadRecords.stats)
+    store.update_many({"read_1": (100, 10.0), "read_2": (80, 9.5)})
+    assert store.spilled == False
+    assert budget.used_bytes == store.used_bytes > 0
+    budget.max_bytes = budget.used_bytes
+    store["read_3"] = (120, 11.0)
+    assert store.spilled == True
+    assert budget.used_bytes == 0
+    store["read_4"] = (60, 8.0)
+    store["read_2"] = (81, 9.0)
+    store.update_many({"read_5": (90, 7.5)})
+    assert len(store) == 5
+    assert list(store) == ["read_1", "read_2", "read_3", "read_4", "read_5"]
+    assert store.get_many(["read_2", "read_5", "read_6"]) == {"read_2": (81, 9.0), "read_5": (90, 7.5)}
+    assert "read_3" in store and "read_6" not in store
+    assert len(list(tmp_path.iterdir())) == 1
+    store.close()
+    assert len(list(tmp_path.iterdir())) == 0
+    assert len(store) == 0
+    pass
+
+def test_fastq_parse_batches(tmp_path):
+    four_line = tmp_path / "four_line.fastq"
+    four_line.write_bytes(b"@read_1 runid=1\nACGT\n+\nIIII\n@read_2\r\nAC\r\n+\r\n#I\r\n@read_3\nA\n+\n@")
+    multi_line = tmp_path / "multi_line.fastq"
+    multi_line.write_bytes(b"@read_1 runid=1\nAC\nGT\n+\nII\nII\n\n@read_2\nAC\n+read_2\n#I\n@read_3\nA\n+\n@\n")
+    for path in [four_line, multi_line]:
+        for chunk_size in [5, 1024]:
+            batches = list(fastq_parser(str(path)).parse_batches(chunk_size))
+            assert [read_id for batch in batches for read_id in batch.read_ids()] == ["read_1", "read_2", "read_3"]
+            assert [length for batch in batches for length in batch.lengths().tolist()] == [4, 2, 1]
+            records = [record for batch in batches for record in batch.records()]
+            assert [(bytes(record.seq), bytes(record.qual)) for record in records] == [(b"ACGT", b"IIII"), (b"AC", b"#I"), (b"A", b"@")]
+            qscores = np.concatenate([batch.mean_qscores() for batch in batches])
+            assert list(qscores) == list(calc_mean_qscores(["IIII", "#I", "@"], offset=33))
+    truncated = tmp_path / "truncated.fastq"
+    truncated.write_bytes(b"@read_1\nACGT\n+\nIIII\n@read_2\nAC\n")
+    with pytest.raises(ValueError):
+        list(fastq_parser(str(truncated)).parse_batches())
+    pass
+
+def test_open_compressed_input(tmp_path):
+    records = b"".join(b"@read_%d\nACGT\n+\nIIII\n" % i for i in range(2000))
+    plain = tmp_path / "reads.fastq"
+    plain.write_bytes(records)
+    gzipped = tmp_path / "reads.fastq.gz"
+    gzipped.write_bytes(gzip.compress(records[:30000]) + gzip.compress(records[30000:]))
+    bgzipped = tmp_path / "reads.fastq.bgz"
+    writer = BGZFile(str(bgzipped), "wb")
+    writer.write(records)
+    writer.close()
+    assert [detect_compression(str(path)) for path in [plain, gzipped, bgzipped]] == ["none", "gzip", "bgzf"]
+    for path in [plain, gzipped, bgzipped]:
+        with open_input(str(path), "rb") as f:
+            assert f.read() == records
+        with open_input(str(path), "r") as f:
+            assert f.readline() == "@read_0\n"
+        assert Sequence("ONT", [str(path)]).files == [str(path)]
+        read_ids = [read_id for batch in fastq_parser(str(path)).parse_batches() for read_id in batch.read_ids()]
+        assert len(read_ids) == 2000 and read_ids[-1] == "read_1999"
+    truncated = tmp_path / "truncated.fastq.gz"
+    truncated.write_bytes(gzip.compress(records)[:-100])
+    with pytest.raises(EOFError):
+        with open_input(str(truncated), "rb") as f:
+            f.read()
+    pass
+
+def test_fastq_scanner(tmp_path):
+    fastq = tmp_path / "reads.fastq"
+    fastq.write_text("@read_1 ch=1\nACGT\n+\nIIII\n@read_2\nGGCCAA\n+\n++++++\n")
+    scanner = FastqScanner(Sequence("ONT", [str(fastq)]), "sample", str(tmp_path))
+    assert scanner.scan() == True
+    assert list(load_read_ids(scanner.result_files["read_list_file"])) == ["read_1", "read_2"]
+    with open(scanner.result_files["read_stats_file"]) as f:
+        assert f.read() == "read_id\tread_len\tread_qscore\nread_1\t4\t40.0\nread_2\t6\t10.0\n"
+    stats = GeneralSeqParser(scanner.result_files["stats_json"], "json").parsed_file
+    assert stats["num_reads"] == 2 and stats["total_bases"] == 10
+    assert stats["n50"] == 4
+    assert stats["gc_content"] == pytest.approx(0.6)
+    assert stats["length_hist"] == {"4": 1, "6": 1}
+    empty = tmp_path / "empty_qual.fastq"
+    empty.write_text("@read_3\n\n+\n\n@read_4\nAC\n+\nII\n")
+    scanner = FastqScanner(Sequence("ONT", [str(empty)]), "empty", str(tmp_path))
+    scanner.scan()
+    with open(scanner.result_files["read_stats_file"]) as f:
+        assert f.read() == "read_id\tread_len\tread_qscore\nread_3\t0\t0\nread_4\t2\t40.0\n"
+    pass
+
+def test_paired_end_mates(tmp_path):
+    assert mate_read_id("read_1/1", 1) == "read_11" and mate_read_id("read_1", 2) == "read_12"
+    assert mate_read_id("read_1/1", 0) == "read_1/1"
+    for mate in [1, 2]:
+        (tmp_path / f"reads_{mate}.fastq").write_text(f"@read_1/{mate}\nACGT\n+\nIIII\n@read_2/{mate}\nAC\n+\nII\n")
+    read_set = Sequence("ONT", [str(tmp_path / "reads_1.fastq"), str(tmp_path / "reads_2.fastq")])
+    scanner = FastqScanner(read_set, "sample", str(tmp_path), paired=True)
+    scanner.scan()
+    assert list(load_read_ids(scanner.result_files["read_list_file"])) == ["read_11", "read_21", "read_12", "read_22"]
+    header = {"HD": {"VN": "1.6", "SO": "coordinate"}, "SQ": [{"SN": "contig_1", "LN": 100}]}
+    bam_file = str(tmp_path / "paired.bam")
+    with pysam.AlignmentFile(bam_file, "wb", header=header) as out:
+        for (flag, start) in [(0x41, 10), (0x81, 50)]:
+            read = pysam.AlignedSegment()
+            read.query_name = "read_1"
+            read.query_sequence = "ACGT"
+            read.query_qualities = pysam.qualitystring_to_array("IIII")
+            read.flag = flag
+            read.reference_id = 0
+            read.reference_start = start
+            read.cigarstring = "4M"
+            out.write(read)
+    pysam.index(bam_file)
+    bam = BamProcessor(bam_file, paired=True)
+    read_index = dict(bam.read_index.items())
+    assert sorted(read_index) == ["read_11", "read_12"]
+    assert read_index["read_11"][:2] == (("contig_1",), 4)
+    bam.close()
+    pass
+
+def write_test_bam(bam_file):
+    header = {"HD": {"VN": "1.6", "SO": "coordinate"},
+              "SQ": [{"SN": "contig_1", "LN": 200}, {"SN": "contig_2", "LN": 80}]}
+    records = [("read_1", 0, 10, "4M", "IIII"), ("read_2", 0, 45, "10M", "5555555555"),
+               ("read_3", 0, 98, "6M", "++++++"), ("read_4", 0, 120, "5M10D5M", "IIIII+++++"),
+               ("read_3", 1, 0, "6M", "@@@@@@"), ("read_5", 1, 70, "8M", "IIII####"), ("read_6", -1, -1, None, "IIII")]
+    with pysam.AlignmentFile(bam_file, "wb", header=header) as out:
+        for (read_id, reference_id, start, cigar, qual) in records:
+            read = pysam.AlignedSegment()
+            read.query_name = read_id
+            read.query_sequence = "A" * len(qual)
+            read.query_qualities = pysam.qualitystring_to_array(qual)
+            read.reference_id = reference_id
+            read.reference_start = start
+            if cigar is None:
+                read.flag = 0x4
+            else:
+                read.cigarstring = cigar
+            out.write(read)
+    pysam.index(bam_file)
+
+def test_bam_processing_modes(tmp_path, monkeypatch):
+    bam_file = str(tmp_path / "reads.bam")
+    write_test_bam(bam_file)
+    monkeypatch.setattr(DefaultValues, "bam_region_size", 50)
+    results = []
+    for (threads, processing_mode) in [(1, BamProcessingModes.fetch), (4, BamProcessingModes.fetch),
+                                       (1, BamProcessingModes.scan)]:
+        bam = BamProcessor(bam_file, threads=threads, processing_mode=processing_mode)
+        assert bam.status == True
+        results.append((bam.ref_stats, dict(bam.read_index.items())))
+        bam.close()
+    assert results[0] == results[1] == results[2]
+    (ref_stats, read_index) = results[0]
+    assert sorted(ref_stats) == ["*", "contig_1", "contig_2"]
+    assert ref_stats["contig_1"]["num_reads"] == 4 and ref_stats["contig_1"]["covered_bases"] == 30
+    assert ref_stats["*"]["unmapped"] == 1
+    assert read_index["read_3"][0] == ("contig_1", "contig_2") and read_index["read_6"][0] == ()
+    pass
+
+def test_bam_coverage_modes(tmp_path):
+    bam_file = str(tmp_path / "reads.bam")
+    write_test_bam(bam_file)
+    depths = {}
+    for coverage_mode in [CoverageModes.interval, CoverageModes.blocks]:
+        bam = BamProcessor(bam_file, coverage_mode=coverage_mode, per_base_coverage=True)
+        depths[coverage_mode] = np.asarray(bam.ref_coverage["contig_1"])
+        bam.close()
+    assert list(depths[CoverageModes.blocks][120:140]) == [1] * 5 + [0] * 10 + [1] * 5
+    assert list(depths[CoverageModes.interval][120:140]) == [1] * 10 + [0] * 10
+    pass
+
+def test_stream_copy(tmp_path):
+    fifo = str(tmp_path / "reads.fifo")
+    os.mkfifo(fifo)
+    reader = subprocess.Popen([sys.executable, "-c", "import sys; sys.stdout.write(open(sys.argv[1]).read())", fifo],
+                              stdout=subprocess.PIPE)
+    source = subprocess.Popen([sys.executable, "-c", "print('@read_1\\nACGT\\n+\\nIIII')"], stdout=subprocess.PIPE)
+    errors = []
+    copy_stream(source.stdout, [open(str(tmp_path / "reads.fastq"), 'wb'), open_fifo_writer(fifo, reader)], errors)
+    assert errors == [] and source.wait() == 0
+    assert reader.communicate()[0] == b"@read_1\nACGT\n+\nIIII\n"
+    assert (tmp_path / "reads.fastq").read_bytes() == b"@read_1\nACGT\n+\nIIII\n"
+    failed = subprocess.Popen([sys.executable, "-c", "pass"])
+    failed.wait()
+    with pytest.raises(ValueError):
+        open_fifo_writer(fifo, failed)
+    pass
+
+def test_stage_scheduler():
+    assert split_threads(8, [1, 3]) == [2, 6]
+    assert split_threads(1, [1, 1]) == [1, 1]
+    runs = []
+    scheduler = StageScheduler(threads=8)
+    scheduler.add_stage("scan", lambda threads: runs.append(("scan", threads)), outputs=["read_list"], max_threads=1)
+    scheduler.add_stage("fastp", lambda threads: runs.append(("fastp", threads)), outputs=["fastq"])
+    scheduler.add_stage("minimap2", lambda threads: runs.append(("minimap2", threads)), inputs=["fastq"],
+                        outputs=["bam"], weight=3)
+    scheduler.add_stage("kat", lambda threads: runs.append(("kat", threads)), inputs=["fastq"], outputs=["kat"])
+    scheduler.add_stage("manifest", lambda threads: runs.append(("manifest", threads)),
+                        inputs=["bam", "kat", "read_list"])
+    assert scheduler.run() == True
+    assert sorted(runs[:2]) == [("fastp", 7), ("scan", 1)]
+    assert runs[-1] == ("manifest", 8)
+    def fail(threads):
+        raise ValueError("fastp failed")
+    scheduler = StageScheduler(threads=2)
+    scheduler.add_stage("fastp", fail, outputs=["fastq"])
+    scheduler.add_stage("minimap2", lambda threads: runs.append(("minimap2", threads)), inputs=["fastq"])
+    with pytest.raises(ValueError):
+        scheduler.run()
+    assert scheduler.stages[1].status == False
+    scheduler = StageScheduler()
+    scheduler.add_stage("a", lambda threads: None, inputs=["y"], outputs=["x"])
+    scheduler.add_stage("b", lambda threads: None, inputs=["x"], outputs=["y"])
+    with pytest.raises(ValueError):
+        scheduler.run()
+    pass
+
+def test_stage_checkpoints(tmp_path):
+    reads = tmp_path / "reads.fastq"
+    reads.write_bytes(b"@read_1\nACGT\n+\nIIII\n" * 100000)
+    assert compute_fingerprint(str(reads)) == compute_fingerprint(str(reads))
+    runs = []
+    def run_filter(threads):
+        runs.append("filter")
+        (tmp_path / "filtered.fastq").write_text("@read_1\nACGT\n+\nIIII\n")
+        return {"fastq": str(tmp_path / "filtered.fastq")}
+    def run_map(threads):
+        runs.append("map")
+        (tmp_path / "mapped.bam").write_text("bam")
+        return {"bam": str(tmp_path / "mapped.bam")}
+    def create_scheduler(min_len):
+        checkpoints = StageCheckpoints(str(tmp_path / "checkpoints.json"))
+        scheduler = StageScheduler(threads=2, checkpoints=checkpoints)
+        scheduler.add_stage("filter", run_filter, outputs=["fastq"], params={"min_len": min_len},
+                            input_files=[str(reads)])
+        scheduler.add_stage("map", run_map, inputs=["fastq"], outputs=["bam"])
+        return scheduler
+    create_scheduler(15).run()
+    assert runs == ["filter", "map"]
+    scheduler = create_scheduler(15)
+    scheduler.run()
+    assert runs == ["filter", "map"] and scheduler.stages[1].skipped == True
+    (tmp_path / "mapped.bam").write_text("truncated")
+    create_scheduler(15).run()
+    assert runs == ["filter", "map", "map"]
+    create_scheduler(20).run()
+    assert runs == ["filter", "map", "map", "filter"]
+    checkpoints = StageCheckpoints(str(tmp_path / "waiting.json"))
+    keyed = []
+    stage_key = checkpoints.stage_key
+    checkpoints.stage_key = lambda name, params, input_files: keyed.append(name) or stage_key(name, params, input_files)
+    scheduler = StageScheduler(threads=1, checkpoints=checkpoints)
+    for name in ["a", "b", "c"]:
+        scheduler.add_stage(name, lambda threads: {})
+    scheduler.run()
+    assert sorted(keyed) == ["a", "b", "c"]
+    pass
+
+def test_reference_index_cache(tmp_path, monkeypatch):
+    reference = tmp_path / "reference.fasta"
+    reference.write_text(">contig_1\nACGTACGTACGT\n")
+    builds = []
+    def build(cmd):
+        args = cmd.split()
+        builds.append(args)
+        with open(args[args.index("-d") + 1], 'w') as index:
+            index.write("index")
+        return ("", "")
+    monkeypatch.setattr(reference_index, "run_command", build)
+    cache_dir = str(tmp_path / "cache")
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        paths = list(executor.map(lambda i: ReferenceIndexCache(cache_dir).get_index(str(reference), 15, "map-ont"),
+                                  range(8)))
+    assert len(builds) == 1 and len(set(paths)) == 1
+    assert paths[0].endswith("_k15_map-ont.mmi") and os.path.isfile(paths[0])
+    assert ReferenceIndexCache(cache_dir).get_index(str(reference), 15, "sr") != paths[0]
+    assert len(builds) == 2
+    pass
+
+def test_manifest_writers(tmp_path):
+    fields = ["read_id", "read_len", "read_qscore", "is_mapped", "contig_id"]
+    rows = [("read_1", "100", "10.5", "True", "contig_1"), ("read_2", "0", "0", "False", "")]
+    text_file = str(tmp_path / "manifest.txt")
+    writer = create_manifest_writer(text_file, fields, "text")
+    writer.write_rows(rows)
+    writer.close()
+    with open(text_file) as fin:
+        assert fin.read() == "read_id\tread_len\tread_qscore\tis_mapped\tcontig_id\nread_1\t100\t10.5\tTrue\tcontig_1\nread_2\t0\t0\tFalse\t\n"
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+    parquet_file = str(tmp_path / "manifest.parquet")
+    writer = create_manifest_writer(parquet_file, fields, "parquet")
+    writer.write_columns(list(zip(*rows)))
+    writer.close()
+    table = pyarrow_parquet.read_table(parquet_file)
+    assert table.column("read_len").to_pylist() == [100, 0]
+    assert table.column("is_mapped").to_pylist() == [True, False]
+    assert table.column("contig_id").to_pylist() == ["contig_1", None]
+    assert str(table.schema.field("read_qscore").type) == "float"
+    pass
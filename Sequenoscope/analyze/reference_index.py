@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+import os
+import fcntl
+from Sequenoscope.constant import DefaultValues, Minimap2Presets
+from Sequenoscope.utils.__init__ import run_command, compute_sha256
+
+
+class ReferenceIndexCache:
+    cache_dir = None
+    reference_hashes = None
+    status = False
+    error_messages = None
+
+    def __init__(self, cache_dir):
+        """
+        Initalize the class with the directory of the cache. The cache holds one minimap2 index per reference
+        content, kmer size and preset, so the minimizers of a reference are computed once and every later run
+        mapping to the same reference loads the prebuilt index instead.
+
+        Arguments:
+            cache_dir: str
+                a string to the path of the cache directory, created when missing. It can be shared by runs
+                on the same machine, an index is built by a single run while the others wait for it
+        """
+        self.cache_dir = cache_dir
+        self.reference_hashes = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def reference_hash(self, ref_database):
+        """
+        Returns the sha256 of the content of a reference, computed once per reference and cache object
+
+        Arguments:
+            ref_database: str
+                a string to the path of reference sequence file
+
+        Returns:
+            str:
+                hex digest of the reference
+        """
+        ref_database = os.path.abspath(ref_database)
+        if ref_database not in self.reference_hashes:
+            self.reference_hashes[ref_database] = compute_sha256(ref_database)
+        return self.reference_hashes[ref_database]
+
+    def index_path(self, ref_database, kmer_size=DefaultValues.minimap2_kmer_size, preset=Minimap2Presets.nanopore):
+        """
+        Returns the path of the cached index of a reference
+
+        Arguments:
+            ref_database: str
+                a string to the path of reference sequence file
+            kmer_size: int
+                kmer size of the minimizers, default is 15
+            preset: str
+                minimap2 preset the index is built with, 'map-ont' or 'sr'. default is map-ont
+
+        Returns:
+            str:
+                path of the index in the cache directory
+        """
+        return os.path.join(self.cache_dir,
+                            f"{self.reference_hash(ref_database)}_k{kmer_size}_{preset}.mmi")
+
+    def get_index(self, ref_database, kmer_size=DefaultValues.minimap2_kmer_size, preset=Minimap2Presets.nanopore,
+                  threads=1):
+        """
+        Returns the cached index of a reference and builds it when it is not cached yet. The index is built
+        under an exclusive lock on a lock file next to it and written to a temporary file that is renamed once
+        complete, so concurrent runs never build the same index twice or load a partial index.
+
+        Arguments:
+            ref_database: str
+                a string to the path of reference sequence file
+            kmer_size: int
+                kmer size of the minimizers, default is 15
+            preset: str
+                minimap2 preset the index is built with, 'map-ont' or 'sr'. default is map-ont
+            threads: int
+                an integer representing the number of threads utilized for building the index, default is 1
+
+        Returns:
+            str:
+                path of the index
+        """
+        index_file = self.index_path(ref_database, kmer_size, preset)
+        if self.check_files([index_file]):
+            self.status = True
+            return index_file
+
+        with open(f"{index_file}.lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if not self.check_files([index_file]):
+                    self.build_index(ref_database, index_file, kmer_size, preset, threads)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self.status = True
+        return index_file
+
+    def build_index(self, ref_database, index_file, kmer_size, preset, threads):
+        """
+        Runs minimap2 to build the index of a reference into a temporary file and moves it into place
+
+        Arguments:
+            ref_database: str
+                a string to the path of reference sequence file
+            index_file: str
+                path of the index
+            kmer_size: int
+                kmer size of the minimizers
+            preset: str
+                minimap2 preset the index is built with
+            threads: int
+                an integer representing the number of threads utilized for building the index
+        """
+        tmp_file = f"{index_file}.{os.getpid()}.tmp"
+        cmd = ["minimap2", "-x", preset, "-t", f"{threads}", "-k", f"{kmer_size}", "-d", tmp_file, ref_database]
+        (self.stdout, self.stderr) = run_command(" ".join(cmd))
+        if not self.check_files([tmp_file]):
+            if os.path.isfile(tmp_file):
+                os.remove(tmp_file)
+            self.status = False
+            self.error_messages = "one or more files was not created or was empty, check error message\n{}".format(self.stderr)
+            raise ValueError(str(self.error_messages))
+        os.replace(tmp_file, index_file)
+
+    def check_files(self, files_to_check):
+        """
+        check if the output file exists and is not empty
+
+        Arguments:
+            files_to_check: list
+                list of file paths
+
+        Returns:
+            bool:
+                returns True if the generated output file is found and not empty, False otherwise
+        """
+        if isinstance (files_to_check, str):
+            files_to_check = [files_to_check]
+        for f in files_to_check:
+            if not os.path.isfile(f):
+                return False
+            elif os.path.getsize(f) == 0:
+                return False
+        return True
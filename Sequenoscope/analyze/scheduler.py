@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+def split_threads(threads, weights):
+    """
+    Splits a thread budget across tools running at the same time in proportion to their weights. Every tool
+    gets at least one thread, the threads left over by rounding go to the heaviest tools first.
+
+    Arguments:
+        threads: int
+            number of threads to split
+        weights: list
+            relative share of each tool
+
+    Returns:
+        list:
+            number of threads of each tool
+    """
+    if len(weights) == 0:
+        return []
+    threads = max(threads, len(weights))
+    total_weight = sum(weights)
+    shares = [max(1, (threads * weight) // total_weight) for weight in weights]
+    order = sorted(range(len(weights)), key=lambda i: weights[i], reverse=True)
+    i = 0
+    while sum(shares) < threads:
+        shares[order[i % len(order)]] += 1
+        i += 1
+    while sum(shares) > threads:
+        j = max(order, key=lambda k: shares[k])
+        shares[j] -= 1
+    return shares
+
+
+class AnalyzeStage:
+    name = None
+    func = None
+    inputs = None
+    outputs = None
+    weight = 1
+    max_threads = None
+    params = None
+    input_files = None
+    restore = None
+    threads = 0
+    status = False
+    skipped = False
+
+    def __init__(self, name, func, inputs=(), outputs=(), weight=1, max_threads=None, params=None,
+                 input_files=(), restore=None):
+        """
+        Initalize the class with the name of the stage, the function running it and the names of the data
+        it consumes and produces.
+
+        Arguments:
+            name: str
+                name of the stage
+            func: function
+                runs the stage, called with the number of threads the stage was given. Returns the result files
+                of the stage, they are recorded in the checkpoint of the stage
+            inputs: list
+                names of the data the stage needs, data no stage produces is expected to exist already
+            outputs: list
+                names of the data the stage produces
+            weight: int
+                relative share of the thread budget the stage gets when it runs next to other stages. default is 1
+            max_threads: int
+                most threads the stage can use, 1 for stages running in the python interpreter. default is no limit
+            params: dict
+                parameters of the stage that change its outputs, part of the checkpoint key. default is None
+            input_files: list
+                files read by the stage that no stage produces, part of the checkpoint key. default is none
+            restore: function
+                called with the recorded result files instead of func when the stage is skipped. default is None
+        """
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.weight = weight
+        self.max_threads = max_threads
+        self.params = params
+        self.input_files = list(input_files)
+        self.restore = restore
+        self.threads = 0
+        self.status = False
+        self.skipped = False
+
+
+class StageScheduler:
+    threads = 1
+    stages = None
+    checkpoints = None
+    status = False
+    error_messages = None
+
+    def __init__(self, threads=1, checkpoints=None):
+        """
+        Initalize the class with the thread budget of the run. Stages are run as soon as every stage producing
+        one of their inputs finished. Stages ready at the same time run concurrently and split the threads that
+        are not used by the stages already running.
+
+        Arguments:
+            threads: int
+                total number of threads of the stages running at the same time, default is 1
+            checkpoints: StageCheckpoints
+                checkpoints of the stages, a stage whose checkpoint is still valid is skipped and every stage that
+                finished is recorded. default is None to always run every stage
+        """
+        self.threads = max(threads, 1)
+        self.checkpoints = checkpoints
+        self.stages = []
+        self.status = False
+
+    def add_stage(self, name, func, inputs=(), outputs=(), weight=1, max_threads=None, params=None,
+                  input_files=(), restore=None):
+        """
+        Adds a stage to the run, see AnalyzeStage for the arguments
+
+        Returns:
+            AnalyzeStage:
+                the added stage
+        """
+        stage = AnalyzeStage(name, func, inputs=inputs, outputs=outputs, weight=weight, max_threads=max_threads,
+                             params=params, input_files=input_files, restore=restore)
+        self.stages.append(stage)
+        return stage
+
+    def check_graph(self):
+        """
+        Checks that no two stages produce the same data and that the stages do not depend on each other in a cycle
+
+        Returns:
+            dict:
+                the stage producing each data name
+        """
+        producers = {}
+        for stage in self.stages:
+            for output in stage.outputs:
+                if output in producers:
+                    raise ValueError(f"Error {output} is produced by both stage {producers[output].name} and {stage.name}")
+                producers[output] = stage
+        done = set()
+        remaining = list(self.stages)
+        while len(remaining) > 0:
+            ready = [stage for stage in remaining
+                     if all(producers[i].name in done for i in stage.inputs if i in producers)]
+            if len(ready) == 0:
+                raise ValueError("Error stages {} depend on each other in a cycle".format(
+                    ", ".join(stage.name for stage in remaining)))
+            for stage in ready:
+                done.add(stage.name)
+                remaining.remove(stage)
+        return producers
+
+    def allocate(self, ready, free_threads):
+        """
+        Picks the ready stages to start with the free threads and sets the threads of each of them
+
+        Arguments:
+            ready: list
+                stages whose inputs are all available, in the order they were added
+            free_threads: int
+                threads not used by the running stages
+
+        Returns:
+            list:
+                stages to start
+        """
+        starting = ready[:max(free_threads, 1)]
+        free_threads = max(free_threads, len(starting))
+        shares = split_threads(free_threads, [stage.weight for stage in starting])
+        for (stage, share) in zip(starting, shares):
+            if stage.max_threads is not None:
+                share = min(share, stage.max_threads)
+            stage.threads = share
+        ## threads a capped stage cannot use go to the stages that can
+        spare = free_threads - sum(stage.threads for stage in starting)
+        uncapped = [stage for stage in starting if stage.max_threads is None]
+        for i in range(spare if len(uncapped) > 0 else 0):
+            uncapped[i % len(uncapped)].threads += 1
+        return starting
+
+    def stage_key(self, stage, producers):
+        """
+        Computes the checkpoint key of a stage from its parameters, its input files and the output files of the
+        stages producing its inputs
+
+        Arguments:
+            stage: AnalyzeStage
+                stage whose inputs are all available
+            producers: dict
+                the stage producing each data name
+
+        Returns:
+            str:
+                checkpoint key of the stage
+        """
+        input_files = list(stage.input_files)
+        for producer in set(producers[i] for i in stage.inputs if i in producers):
+            input_files += self.checkpoints.outputs(producer.name)
+        return self.checkpoints.stage_key(stage.name, stage.params, input_files)
+
+    def skip_stage(self, stage, key):
+        """
+        Skips a stage whose checkpoint is still valid and restores its recorded result
+
+        Arguments:
+            stage: AnalyzeStage
+                stage whose inputs are all available
+            key: str
+                checkpoint key of the stage
+
+        Returns:
+            bool:
+                returns True if the stage was skipped
+        """
+        result = self.checkpoints.lookup(stage.name, key)
+        if result is None:
+            return False
+        if stage.restore is not None:
+            stage.restore(result)
+        print(f"Skipping stage {stage.name}, its inputs and outputs are unchanged since its last run")
+        stage.skipped = True
+        stage.status = True
+        return True
+
+    def run(self):
+        """
+        Runs every stage once its inputs are available, stages with a valid checkpoint are skipped. When a stage
+        fails no further stage is started, the running stages are waited for and the error of the failed stage
+        is raised.
+
+        Returns:
+            bool:
+                returns True if every stage ran
+        """
+        producers = self.check_graph()
+        pending = list(self.stages)
+        finished = set()
+        running = {}
+        keys = {}
+        errors = []
+        with ThreadPoolExecutor(max_workers=len(self.stages) or 1) as executor:
+            while len(pending) > 0 or len(running) > 0:
+                if len(errors) == 0:
+                    ready = [stage for stage in pending
+                             if all(producers[i].name in finished for i in stage.inputs if i in producers)]
+                    if self.checkpoints is not None:
+                        ## the key of a stage is computed once, when it first becomes ready
+                        for stage in [stage for stage in ready if stage.name not in keys]:
+                            keys[stage.name] = self.stage_key(stage, producers)
+                            if self.skip_stage(stage, keys[stage.name]):
+                                pending.remove(stage)
+                                ready.remove(stage)
+                                finished.add(stage.name)
+                            else:
+                                self.checkpoints.invalidate(stage.name)
+                        if len(ready) == 0 and len(running) == 0:
+                            continue
+                    used_threads = sum(stage.threads for stage in running.values())
+                    free_threads = self.threads - used_threads
+                    if len(ready) > 0 and (free_threads > 0 or len(running) == 0):
+                        for stage in self.allocate(ready, free_threads):
+                            pending.remove(stage)
+                            running[executor.submit(stage.func, stage.threads)] = stage
+                elif len(running) == 0:
+                    break
+                (done, not_done) = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        errors.append((stage, error))
+                    else:
+                        stage.status = True
+                        finished.add(stage.name)
+                        if self.checkpoints is not None:
+                            self.checkpoints.record(stage.name, keys[stage.name], future.result())
+
+        self.status = len(errors) == 0
+        if self.status == False:
+            self.error_messages = "\n".join(f"stage {stage.name} failed: {error}" for (stage, error) in errors)
+            raise errors[0][1]
+        return self.status
@@ -1,13 +1,41 @@
 #!/usr/bin/env python
 
 import os
-from math import log
-from Sequenoscope.constant import DefaultValues
+import csv
+from operator import itemgetter
+from itertools import repeat, islice, compress
+import numpy as np
+import pandas as pd
+from Sequenoscope.constant import DefaultValues, CoverageModes, BamProcessingModes, CoverageStores, ManifestEngines, ManifestFormats, ReadRecords
 from Sequenoscope.utils.parser import fastq_parser
 from Sequenoscope.analyze.bam import BamProcessor
+from Sequenoscope.analyze.manifest_writer import create_manifest_writer, manifest_path
+from Sequenoscope.utils.read_store import ReadStore, MemoryBudget
+from Sequenoscope.utils.read_id_index import ReadIdIndex, load_read_ids, mate_read_ids
 from Sequenoscope.utils.__init__ import is_non_zero_file
 
 
+def lookup_reads(store, read_ids):
+    """
+    Looks up a batch of read ids in a read store, plain dicts are returned as they are
+
+    Arguments:
+        store: ReadStore, ReadIdIndex or dict
+            read store to look the reads up in, read id indexes return the set of read ids they hold
+        read_ids: list
+            read ids to look up
+
+    Returns:
+        dict:
+            mapping that holds at least the read ids that were found and their values
+    """
+    if isinstance(store, ReadStore):
+        return store.get_many(read_ids)
+    if isinstance(store, ReadIdIndex):
+        return set(compress(read_ids, store.contains_many(read_ids).tolist()))
+    return store
+
+
 class SeqManifest:
     fields = [
         'sample_id','read_id','read_len','read_qscore','channel',
@@ -21,17 +49,24 @@ class SeqManifest:
     out_dir = ''
     bam_obj = None
     fastp_obj = None
-    fastp_fastq = []
+    fastp_fastq = None
     delim = "\t"
     status = False
     start_time = ''
     end_time = ''
-    filtered_reads = {}
-    raw_reads = {}
+    filtered_reads = None
+    raw_reads = None
+    memory_budget = None
+    paired = False
+    fastp_in_bam = False
     error_messages = None
 
     def __init__(self,sample_id,in_bam,out_prefix, out_dir, in_fastq=None, fastp_fastq=None,in_seq_summary=None,
-                  read_list=None,start_time=None,end_time=None,delim="\t"):
+                  read_list=None,start_time=None,end_time=None,delim="\t",coverage_mode=CoverageModes.interval,
+                  threads=1,bam_mode=BamProcessingModes.fetch,coverage_store=CoverageStores.rle,
+                  coverage_bin_size=DefaultValues.coverage_bin_size,per_base_coverage=False,
+                  manifest_engine=ManifestEngines.python,manifest_format=ManifestFormats.text,max_memory=None,
+                  read_stats=None,paired=False,fastp_in_bam=False):
         """
         Initalize the class with sample_id, in_bam, out_prefix, and out_dir. Analyze reads based on seq summary and 
         fastp fast availbility by producing manifest files.
@@ -57,6 +92,37 @@ class SeqManifest:
                 an integer representing the end time when seq summary isn't provided.
             delim: str
                 a string that designates the delimiter used to parse files. default is tab delimiter
+            coverage_mode: str
+                a designation of how read coverage is counted by the bam processor, 'interval' or 'blocks'. default is 'interval'
+            threads: int
+                an integer representing the number of processes used to analyze the bam file, default is 1
+            bam_mode: str
+                a designation of how the bam file is read, 'fetch' contig by contig or 'scan' in a single pass. default is 'fetch'
+            coverage_store: str
+                a designation of how coverage is stored by the bam processor, 'dense' or 'rle'. default is 'rle'
+            coverage_bin_size: int
+                an integer representing the window size of the binned coverage kept by the bam processor, default is 100
+            per_base_coverage: bool
+                a designation of wheather or not the bam processor keeps the exact per-base coverage, default is False
+            manifest_engine: str
+                a designation of how the manifest is built, 'python' streams and joins the rows one by one, 'pandas'
+                joins chunks of columns with vectorized operations. default is 'python'
+            manifest_format: str
+                a designation of the format of the manifest file, tab delimited 'text' or 'parquet'. default is 'text'
+            max_memory: int
+                an integer representing the approximate memory budget in megabytes of the per-read state, reads
+                spill to temporary databases in out_dir once it is exceeded. default is None meaning no limitation
+            read_stats: str
+                a designation of where the per read lengths and qscores of the original fastq written by the
+                fastq scanner are stored, they are used in place of parsing in_fastq again
+            paired: bool
+                a designation of wheather or not the files are the two mates of paired-end sequencing data. Reads
+                of the first and second fastq file and reads with the READ1 and READ2 flags in the bam file are
+                keyed on their name and their mate, see mate_read_id. default is False
+            fastp_in_bam: bool
+                a designation of wheather or not the reads that passed fastp are the reads of the bam file, which holds
+                every read minimap2 was given. Used when fastp streamed its reads straight into minimap2 and
+                fastp_fastq was not written. default is False
         """
         self.delim = delim
         self.out_prefix = out_prefix
@@ -68,106 +134,133 @@ class SeqManifest:
         self.start_time = start_time
         self.end_time = end_time
         self.read_list = read_list
-
+        self.read_stats = read_stats
+        self.paired = paired
+        self.fastp_in_bam = fastp_in_bam
+        self.coverage_mode = coverage_mode
+        self.threads = threads
+        self.bam_mode = bam_mode
+        self.coverage_store = coverage_store
+        self.coverage_bin_size = coverage_bin_size
+        self.per_base_coverage = per_base_coverage
+        self.manifest_engine = manifest_engine
+        self.manifest_format = manifest_format
+        self.max_memory = max_memory
+
+        if self.manifest_engine not in [ManifestEngines.python, ManifestEngines.pandas]:
+            self.status = False
+            self.error_msg = f"Error manifest engine {manifest_engine} is not supported"
+            return
+        if self.manifest_format not in [ManifestFormats.text, ManifestFormats.parquet]:
+            self.status = False
+            self.error_msg = f"Error manifest format {manifest_format} is not supported"
+            return
         if self.in_seq_summary is None:
             if self.start_time is None or self.end_time is None:
                 self.status = False
                 self.error_msg = 'Error no sequence summary specified, please specify a start and end datetime'
                 return
-            if self.in_fastq is None:
+            if self.in_fastq is None and self.read_stats is None:
                 self.status = False
                 self.error_msg = 'Error no sequence summary specified, please add a the intial fastq file for calculations'
                 return
-
-        self.bam_obj = BamProcessor(input_file=in_bam)
-
-        if self.fastp_fastq is not None:
-            self.process_fastq(self.fastp_fastq, self.filtered_reads)
-        if self.in_fastq is not None: 
-            self.process_fastq(self.in_fastq, self.raw_reads)
-
         if self.in_seq_summary is not None and not is_non_zero_file(self.in_seq_summary):
             self.status = False
             self.error_msg = f"Error specified seq summary file {self.in_seq_summary} does not exist"
             return
-        if self.in_seq_summary is not None:
+
+        if self.max_memory is not None:
+            self.memory_budget = MemoryBudget(self.max_memory * 1024 * 1024)
+        self.filtered_reads = ReadStore(self.memory_budget, self.out_dir, ReadRecords.stats)
+        self.raw_reads = ReadStore(self.memory_budget, self.out_dir, ReadRecords.stats)
+
+        self.bam_obj = BamProcessor(input_file=in_bam, coverage_mode=self.coverage_mode, threads=self.threads,
+                                    processing_mode=self.bam_mode, coverage_store=self.coverage_store,
+                                    coverage_bin_size=self.coverage_bin_size, per_base_coverage=self.per_base_coverage,
+                                    memory_budget=self.memory_budget, spill_dir=self.out_dir, paired=self.paired)
+        self.bam_obj.close()
+
+        if self.fastp_in_bam:
+            self.filtered_reads.close()
+            self.filtered_reads = self.bam_obj.read_index
+        elif self.fastp_fastq is not None:
+            self.process_fastq(self.fastp_fastq, self.filtered_reads)
+        if self.in_seq_summary is None and self.read_stats is not None:
+            self.load_read_stats(self.read_stats, self.raw_reads)
+        elif self.in_seq_summary is None:
+            self.process_fastq(self.in_fastq, self.raw_reads)
+
+        if self.in_seq_summary is not None and self.manifest_engine == ManifestEngines.pandas:
+            self.create_manifest_with_sum_columnar()
+        elif self.in_seq_summary is not None:
             self.create_manifest_with_sum()
+        elif self.manifest_engine == ManifestEngines.pandas:
+            self.create_manifest_no_sum_columnar()
         else:
             self.create_manifest_no_sum()
     
-    def error_prob_list_tab(n):
+    def process_fastq(self, fastq_file_list, read_dict):
         """
-        generate a list of error rates for qualities less than or equal to n.
-        source: github.com/wdecoster/nanoget/blob/master/nanoget/utils.py
-
-        Arguments: 
-            n: error probability threshold
+        Process the fastq file and extract reads, quality, and qscores. The fastq files are parsed in
+        binary chunks and the qscores of every chunk are calculated at once with the shared qscore kernel.
+        In paired mode the reads of the first and second file are keyed on their mate.
 
-        Returns:
-            list:
-                list of error rates
+        Argument:
+            fastq_file_list:
+                list of fastq files
+            read_dict:
+                dictonary to store reads
         """
-        return [10**(q / -10) for q in range(n+1)]
+        for (file_num, fastq_file) in enumerate(fastq_file_list):
+            mate = file_num + 1 if self.paired else 0
+            for batch in fastq_parser(fastq_file).parse_batches():
+                self.add_fastq_batch(read_dict, mate_read_ids(batch.read_ids(), mate), batch.lengths().tolist(),
+                                     batch.qscore_values())
 
-    def calc_mean_qscores(self,qual,tab=error_prob_list_tab(DefaultValues.nanoget_threshold)):
+    def add_fastq_batch(self, read_dict, read_ids, seq_lens, qscores):
         """
-        Calculates the mean quality score for a read where they have been converted to Phred.
-        Phred scores are first converted to probabilites, then the average error probability is calculated.
-        The average is then converted back to the Phred scale.
+        Stores the lengths and qscores of a batch of fastq reads
 
         Arguments:
-            qual: string
-                string of Phred 33 ints for quality calcualtions
-            
-            tab: list
-                list of error rates for qaulties specified
-
-        Returns:
-            float:
-                mean qscore
+            read_dict: dict
+                dictonary to store reads
+            read_ids: list
+                read ids of the batch
+            seq_lens: list
+                sequence lengths of the batch
+            qscores: list
+                mean qscores of the batch, see FastqBatch.qscore_values
         """
-        if qual:
-            phred_score = -10 * log(sum([tab[q] for q in qual]) / len(qual) , 10)
-            return phred_score
+        if len(read_ids) == 0:
+            return
+        batch = {}
+        for read_id, seq_len, qscore in zip(read_ids, seq_lens, qscores):
+            batch[read_id] = (seq_len,qscore)
+        if isinstance(read_dict, ReadStore):
+            read_dict.update_many(batch)
         else:
-            return 0
+            read_dict.update(batch)
 
-    def convert_qscores(self,qual_string):
+    def load_read_stats(self, read_stats_file, read_dict):
         """
-        Calculates the mean quality score for a read where they have been converted to Phred
-
-        Arguments
-            qual_string: string of phred 33 ints for quality
+        Loads the per read lengths and qscores written by the fastq scanner
 
-        Returns:
-            float:
-                mean qscore
-        """
-        qual_values = []
-        for c in qual_string:
-            qual_values.append(ord(c) - DefaultValues.phred_33_encoding_value)
-
-        return qual_values
-
-    def process_fastq(self, fastq_file_list, read_dict):
-        """
-        Process the fastq file and extract reads, quality, and qscores
-
-        Argument:
-            fastq_file_list:
-                list of fastq files
+        Arguments:
+            read_stats_file: str
+                path of the per read statistics file
             read_dict:
                 dictonary to store reads
         """
-        for fastq_file in fastq_file_list:
-            fastq_obj = fastq_parser(fastq_file)
-            for record in fastq_obj.parse():
-                read_id = fastq_obj.read_id_from_record
-                seq = record[1]
-                seq_len = len(seq)
-                qual = self.convert_qscores(record[3])
-                qscore = self.calc_mean_qscores(qual)
-                read_dict[read_id] = [seq_len,qscore]
+        with open(read_stats_file, 'r') as f:
+            next(f)
+            batch = {}
+            for line in f:
+                (read_id, read_len, read_qscore) = line.rstrip('\n').split('\t')
+                batch[read_id] = (int(read_len), 0 if read_qscore == '0' else float(read_qscore))
+                if len(batch) >= DefaultValues.read_store_batch_size:
+                    read_dict.update_many(batch)
+                    batch = {}
+            read_dict.update_many(batch)
 
     def create_row(self):
         """
@@ -182,191 +275,522 @@ class SeqManifest:
             out_row[field_id] = ''
         return out_row
 
+    def load_read_list(self):
+        """
+        Loads the read list, binary read id indexes are memory mapped and checked with a binary search of
+        their hashes, see Sequenoscope.utils.read_id_index
+
+        Returns:
+            ReadIdIndex:
+                read ids of the read list, without the read_id header
+        """
+        return load_read_ids(self.read_list)
+
+    def create_row_getter(self, computed_fields, header):
+        """
+        Creates a getter that arranges a joined row in the order of self.fields. A joined row is the list of
+        computed values followed by the columns of the input row, fields that are neither computed nor
+        found in the header of the input are left empty.
+
+        Arguments:
+            computed_fields: list
+                names of the fields computed by the join, in the order they precede the input columns
+            header: list
+                column names of the input file
+
+        Returns:
+            operator.itemgetter:
+                getter returning the values of a joined row in the order of self.fields
+        """
+        positions = {}
+        for i in range(0,len(header)):
+            positions[header[i]] = len(computed_fields) + i + 1
+        for i in range(0,len(computed_fields)):
+            positions[computed_fields[i]] = i + 1
+        return itemgetter(*[positions.get(field_id, 0) for field_id in self.fields])
+
+    def write_rows(self, writer, rows):
+        """
+        Writes manifest rows in batches of DefaultValues.manifest_batch_size rows
+
+        Arguments:
+            writer: ManifestTextWriter or ManifestParquetWriter
+                open manifest writer
+            rows: iterable
+                tuples of string values in the order of self.fields
+        """
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= DefaultValues.manifest_batch_size:
+                writer.write_rows(batch)
+                batch = []
+        writer.write_rows(batch)
+
+    def join_reads(self, rows, header, computed_fields, join_row, stores):
+        """
+        Streams the rows of an input file and joins them on read_id with the fastp survivors and the bam read index.
+        One manifest row is produced per mapped contig of a read, or a single row with an empty contig_id when
+        the read did not map. Rows are joined in batches of DefaultValues.manifest_batch_size, the read stores
+        are looked up once per batch so stores that spilled to disk are queried with batched index lookups.
+
+        Arguments:
+            rows: iterable
+                rows of the input file split into columns
+            header: list
+                column names of the input file
+            computed_fields: list
+                names of the fields returned by join_row, followed by fastp_status, is_mapped, is_uniq and contig_id
+            join_row: function
+                called with a row and the lookups of its batch, returns the values of computed_fields for the row,
+                the mapped contigs and the read_id of the row, or None to skip the row
+            stores: dict
+                names of the read stores join_row looks reads up in and the stores, see lookup_reads
+
+        Yields:
+            tuple:
+                string values of a manifest row in the order of self.fields
+        """
+        computed_fields = computed_fields + ['fastp_status','is_mapped','is_uniq','contig_id']
+        get_row = self.create_row_getter(computed_fields, header)
+        num_columns = len(header)
+        read_id_col = header.index('read_id')
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, DefaultValues.manifest_batch_size))
+            if len(batch) == 0:
+                break
+            read_ids = [row[read_id_col] for row in batch]
+            lookups = {}
+            for name, store in stores.items():
+                lookups[name] = lookup_reads(store, read_ids)
+            filtered_reads = lookup_reads(self.filtered_reads, read_ids)
+            for row in batch:
+                joined = join_row(row, lookups)
+                if joined is None:
+                    continue
+                (values, mapped_contigs, read_id) = joined
+                if len(row) < num_columns:
+                    row = row + [''] * (num_columns - len(row))
+                values = [''] + values + [str(read_id in filtered_reads), str(len(mapped_contigs) > 0),
+                                          str(len(mapped_contigs) <= 1), '']
+                contig_pos = len(values) - 1
+                values.extend(row)
+                if len(mapped_contigs) == 0:
+                    yield get_row(values)
+                for contig_id in mapped_contigs:
+                    values[contig_pos] = contig_id
+                    yield get_row(values)
+
     def create_manifest_with_sum(self):
         """
-        Create a manifest file with various statistics when a sequencing summary is present
+        Create a manifest file with various statistics when a sequencing summary is present. The sequencing
+        summary is streamed and hash joined on read_id with the read list, the fastp survivors and the bam hits.
 
         Returns: 
             bool: 
                 True if the summary manifest file was created, False otherwise.
         """
-        manifest_file = os.path.join(self.out_dir,f"{self.out_prefix}.txt")
-        fout = open(manifest_file,'w')
-        fout.write("{}\n".format("\t".join(self.fields)))
-
-        fin = open(self.in_seq_summary,'r')
-        header = next(fin).strip().split(self.delim)
-        
-        read_list = []
-
-        with open(self.read_list, 'r') as file:
-            lines = file.readlines()
-
-        for line in lines:
-            line = line.strip()
-            if line != 'read_id':
-                read_list.append(line)
-
-        for line in fin:
-            row = line.strip().split(self.delim)
-            row_data = {}
-            for i in range(0,len(row)) :
-                row_data[header[i]] = row[i]
-
-            read_id = row_data['read_id']
-
-            if read_id not in read_list:
-              continue
-
-            #if read_id not in self.filtered_reads.keys():
-            #   continue
-
-            read_len = row_data['sequence_length_template']
-            read_qual = row_data['mean_qscore_template']
-            is_uniq = True
-            is_mapped = False
-            start_time = row_data['start_time']
-            end_time = ''
-            duration = row_data['duration']
-            if start_time == '':
-                start_time = self.start_time
-                end_time = self.end_time
-            else:
-                start_time = float(start_time)
-                if duration != '':
-                    end_time = start_time + float(duration)
-
-            out_row = self.create_row()
-            for field_id in self.fields:
-                if field_id in row_data:
-                    out_row[field_id] = row_data[field_id]
-            mapped_contigs = []
-            for contig_id in self.bam_obj.ref_stats:
-                if read_id in self.bam_obj.ref_stats[contig_id]['reads']:
-                    pass
-                    if contig_id != '*':
-                        mapped_contigs.append(contig_id)
-
-            if len(mapped_contigs) > 0:
-                is_mapped = True
-            if len(mapped_contigs) > 1:
-                is_uniq = False
-
-            fastp_status = False
-            if read_id in self.filtered_reads:
-                fastp_status = True
-            out_row['fastp_status'] = fastp_status
-            out_row['sample_id'] = self.sample_id
-            out_row['read_id'] = read_id
-            out_row['is_mapped'] = is_mapped
-            out_row['is_uniq'] = is_uniq
-            out_row['read_len'] = read_len
-            out_row['read_qscore'] = read_qual
-            out_row['start_time'] = start_time
-            out_row['end_time'] = end_time
-            out_row['decision'] = row_data['end_reason']
-
-
-            if len(mapped_contigs) == 0:
-                out_row['contig_id'] = ''
-                fout.write("{}\n".format("\t".join([str(x) for x in out_row.values()])))
-
-            for contig_id in mapped_contigs:
-                out_row['contig_id'] = contig_id
-                fout.write("{}\n".format("\t".join([str(x) for x in out_row.values()])))
+        manifest_file = manifest_path(self.out_dir, self.out_prefix, self.manifest_format)
+        read_list = self.load_read_list()
+        read_index = self.bam_obj.read_index
+        default_start_time = str(self.start_time)
+        default_end_time = str(self.end_time)
+
+        with open(self.in_seq_summary,'r') as fin:
+            header = next(fin).strip().split(self.delim)
+            read_id_col = header.index('read_id')
+            read_len_col = header.index('sequence_length_template')
+            read_qual_col = header.index('mean_qscore_template')
+            start_time_col = header.index('start_time')
+            duration_col = header.index('duration')
+            decision_col = header.index('end_reason')
+
+            def join_row(row, lookups):
+                read_id = row[read_id_col]
+                if read_id not in lookups['read_list']:
+                    return None
+                start_time = row[start_time_col]
+                end_time = ''
+                duration = row[duration_col]
+                if start_time == '':
+                    start_time = default_start_time
+                    end_time = default_end_time
+                else:
+                    start_time = float(start_time)
+                    if duration != '':
+                        end_time = str(start_time + float(duration))
+                    start_time = str(start_time)
+                mapped_contigs = ()
+                if read_id in lookups['read_index']:
+                    mapped_contigs = lookups['read_index'][read_id][0]
+                return ([self.sample_id, read_id, row[read_len_col], row[read_qual_col], start_time, end_time,
+                         row[decision_col]], mapped_contigs, read_id)
+
+            computed_fields = ['sample_id','read_id','read_len','read_qscore','start_time','end_time','decision']
+            rows = (line.strip().split(self.delim) for line in fin)
+            writer = create_manifest_writer(manifest_file, self.fields, self.manifest_format)
+            try:
+                self.write_rows(writer, self.join_reads(rows, header, computed_fields, join_row,
+                                                        {'read_list': read_list, 'read_index': read_index}))
+            finally:
+                writer.close()
+                read_list.close()
+                self.filtered_reads.close()
+                self.raw_reads.close()
 
         self.status = self.check_files([manifest_file])
         if self.status == False:
             self.error_messages = "one or more files was not created or was empty"
             raise ValueError(str(self.error_messages))
-        
-        fin.close()
-        fout.close()
 
     def create_manifest_no_sum(self):
         """
         Create a manifest file with various statistics when a sequencing summary is NOT present. Uses read list 
-        file instead.
+        instead, whose read ids are streamed and hash joined with the raw reads, the fastp survivors and the bam hits.
 
         Returns: 
             file object: 
                 seq manifest text file
         """
-        
-        manifest_file = os.path.join(self.out_dir,f"{self.out_prefix}.txt")
-        fout = open(manifest_file,'w')
-        fout.write("{}\n".format("\t".join(self.fields)))
-
-        fin = open(self.read_list,'r')
-        header = next(fin).strip().split(self.delim)
-
-        for line in fin:
-            row = line.strip().split(self.delim)
-            row_data = {}
-            for i in range(0,len(row)) :
-                row_data[header[i]] = row[i]
+        manifest_file = manifest_path(self.out_dir, self.out_prefix, self.manifest_format)
+        read_index = self.bam_obj.read_index
+        raw_reads = self.raw_reads
+        start_time = str(self.start_time)
+        end_time = str(self.end_time)
 
-            read_id = row_data['read_id']
+        read_list = self.load_read_list()
+        header = ['read_id']
 
+        def join_row(row, lookups):
+            read_id = row[0]
             read_len = 0
             read_qual = 0
-            if read_id in self.raw_reads:
-                read_len = self.raw_reads[read_id][0]
-                read_qual = self.raw_reads[read_id][1]
-
-            is_uniq = True
-            is_mapped = False
-            start_time = self.start_time
-            end_time = self.end_time
-
-            out_row = self.create_row()
-            for field_id in self.fields:
-                if field_id in row_data:
-                    out_row[field_id] = row_data[field_id]
-            mapped_contigs = []
-            for contig_id in self.bam_obj.ref_stats:
-                if read_id in self.bam_obj.ref_stats[contig_id]['reads']:
-                    read_len = self.bam_obj.ref_stats[contig_id]['reads'][read_id][0]
-                    read_qual = self.bam_obj.ref_stats[contig_id]['reads'][read_id][1]
-                    if contig_id != '*':
-                        mapped_contigs.append(contig_id)
-
-            if len(mapped_contigs) > 0:
-                is_mapped = True
-            if len(mapped_contigs) > 1:
-                is_uniq = False
-
-            fastp_status = False
-            if read_id in self.filtered_reads:
-                fastp_status = True
-            out_row['fastp_status'] = fastp_status
-            out_row['sample_id'] = self.sample_id
-            out_row['read_id'] = read_id
-            out_row['is_mapped'] = is_mapped
-            out_row['is_uniq'] = is_uniq
-            out_row['read_len'] = read_len
-            out_row['read_qscore'] = read_qual
-            out_row['start_time'] = start_time
-            out_row['end_time'] = end_time
-            out_row['decision'] = "N/A"
-            out_row['channel'] = "N/A"
-
-
-            if len(mapped_contigs) == 0:
-                out_row['contig_id'] = ''
-                fout.write("{}\n".format("\t".join([str(x) for x in out_row.values()])))
-
-            for contig_id in mapped_contigs:
-                out_row['contig_id'] = contig_id
-                fout.write("{}\n".format("\t".join([str(x) for x in out_row.values()])))
+            if read_id in lookups['raw_reads']:
+                read_len = lookups['raw_reads'][read_id][0]
+                read_qual = lookups['raw_reads'][read_id][1]
+            mapped_contigs = ()
+            if read_id in lookups['read_index']:
+                (mapped_contigs, read_len, read_qual) = lookups['read_index'][read_id]
+            return ([self.sample_id, read_id, str(read_len), str(read_qual), start_time, end_time, "N/A", "N/A"],
+                    mapped_contigs, read_id)
+
+        computed_fields = ['sample_id','read_id','read_len','read_qscore','start_time','end_time','decision','channel']
+        rows = ([read_id] for read_id in read_list)
+        writer = create_manifest_writer(manifest_file, self.fields, self.manifest_format)
+        try:
+            self.write_rows(writer, self.join_reads(rows, header, computed_fields, join_row,
+                                                    {'raw_reads': raw_reads, 'read_index': read_index}))
+        finally:
+            writer.close()
+            read_list.close()
+            self.filtered_reads.close()
+            self.raw_reads.close()
+
+        self.status = self.check_files([manifest_file])
+        if self.status == False:
+            self.error_messages = "one or more files was not created or was empty"
+            raise ValueError(str(self.error_messages))
+
+    def load_mapping_table(self, read_index=None):
+        """
+        Loads the bam read index as a columnar table. The mapped contigs of all reads are flattened into one
+        array, num_contigs and offsets locate the contigs of each read, read lengths and qscores are kept
+        as their manifest strings.
+
+        Arguments:
+            read_index: dict
+                read ids and their (mapped contigs, length, qscore), default is the read index of the bam file
+
+        Returns:
+            dict:
+                index of the read ids and the num_contigs, offsets, contigs, read_len and read_qual arrays
+        """
+        if read_index is None:
+            read_index = self.bam_obj.read_index
+        num_contigs = np.fromiter((len(entry[0]) for entry in read_index.values()), dtype=np.int64, count=len(read_index))
+        offsets = np.zeros(len(read_index) + 1, dtype=np.int64)
+        np.cumsum(num_contigs, out=offsets[1:])
+        contigs = np.empty(int(offsets[-1]), dtype=object)
+        contigs[:] = [contig_id for entry in read_index.values() for contig_id in entry[0]]
+        return {'index': pd.Index(list(read_index), dtype=object),
+                'num_contigs': num_contigs,
+                'offsets': offsets,
+                'contigs': contigs,
+                'read_len': np.array([str(entry[1]) for entry in read_index.values()], dtype=object),
+                'read_qual': np.array([str(entry[2]) for entry in read_index.values()], dtype=object)}
+
+    def load_raw_table(self, raw_reads):
+        """
+        Loads raw reads as a columnar table with their lengths and qscores as manifest strings
+
+        Arguments:
+            raw_reads: dict
+                read ids and their [length, qscore]
+
+        Returns:
+            dict:
+                index of the read ids and the read_len and read_qual arrays
+        """
+        return {'index': pd.Index(list(raw_reads), dtype=object),
+                'read_len': np.array([str(values[0]) for values in raw_reads.values()], dtype=object),
+                'read_qual': np.array([str(values[1]) for values in raw_reads.values()], dtype=object)}
+
+    def key_index(self, reads):
+        """
+        Loads the read ids of a read store as a pandas index for vectorized membership checks
+
+        Arguments:
+            reads: dict
+                read ids and their values
+
+        Returns:
+            pandas Index:
+                read ids
+        """
+        return pd.Index(list(reads), dtype=object)
+
+    def store_table(self, name, store, read_ids, build_table, tables):
+        """
+        Returns the columnar table of a read store for a chunk of read ids. Stores held in memory are converted
+        once and reused for every chunk, stores that spilled to disk only load the reads of the chunk.
+
+        Arguments:
+            name: str
+                name the table is cached under
+            store: ReadStore or dict
+                read store to convert
+            read_ids: numpy array
+                read ids of the chunk
+            build_table: function
+                converts a dict of reads into the table
+            tables: dict
+                cache of the tables of the stores held in memory
+
+        Returns:
+            table produced by build_table
+        """
+        if isinstance(store, ReadStore) and store.spilled:
+            return build_table(store.get_many(read_ids.tolist()))
+        if name not in tables:
+            tables[name] = build_table(store)
+        return tables[name]
+
+    def join_contigs(self, mapping, read_ids):
+        """
+        Joins a column of read ids with the mapping table and expands every read into one row per mapped contig,
+        reads without a mapped contig keep a single row with an empty contig_id
+
+        Arguments:
+            mapping: dict
+                mapping table produced by load_mapping_table
+            read_ids: numpy array
+                read ids to join
+
+        Returns:
+            tuple:
+                positions of the reads in the mapping table (-1 when absent), number of mapped contigs per read,
+                input row of every output row and contig_id of every output row
+        """
+        positions = mapping['index'].get_indexer(read_ids)
+        found = positions >= 0
+        num_contigs = np.zeros(len(read_ids), dtype=np.int64)
+        num_contigs[found] = mapping['num_contigs'][positions[found]]
+        repeats = np.maximum(num_contigs, 1)
+        rows = np.repeat(np.arange(len(read_ids)), repeats)
+        ranks = np.arange(len(rows)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+        contig_ids = np.full(len(rows), '', dtype=object)
+        mapped_rows = num_contigs[rows] > 0
+        contig_pos = mapping['offsets'][positions[rows[mapped_rows]]] + ranks[mapped_rows]
+        contig_ids[mapped_rows] = mapping['contigs'][contig_pos]
+        return (positions, num_contigs, rows, contig_ids)
+
+    def write_frame(self, writer, columns, rows, contig_ids):
+        """
+        Writes a chunk of manifest rows from per read columns
+
+        Arguments:
+            writer: ManifestTextWriter or ManifestParquetWriter
+                open manifest writer
+            columns: dict
+                field ids and their per read string arrays or constant strings, missing fields are left empty
+            rows: numpy array
+                read of every output row
+            contig_ids: numpy array
+                contig_id of every output row
+        """
+        if len(rows) == 0:
+            return
+        frame = []
+        for field_id in self.fields:
+            if field_id == 'contig_id':
+                frame.append(contig_ids.tolist())
+            elif field_id not in columns:
+                frame.append(repeat('', len(rows)))
+            elif isinstance(columns[field_id], str):
+                frame.append(repeat(columns[field_id], len(rows)))
+            else:
+                frame.append(columns[field_id][rows].tolist())
+        writer.write_columns(frame)
+
+    def bool_column(self, values):
+        """
+        Formats a boolean array as manifest strings
+
+        Arguments:
+            values: numpy array
+                boolean values
+
+        Returns:
+            numpy array:
+                'True' or 'False' for every value
+        """
+        return np.where(values, 'True', 'False').astype(object)
+
+    def read_columns(self, path, usecols, float_columns=[]):
+        """
+        Reads the columns of a delimited file in chunks of DefaultValues.manifest_batch_size rows. Values are kept
+        as the strings of the file, except for float_columns which are parsed with round trip precision and
+        hold NaN where the file is empty.
+
+        Arguments:
+            path: str
+                path of the delimited file
+            usecols: list
+                columns to load
+            float_columns: list
+                columns of usecols to parse as floats
+
+        Returns:
+            pandas TextFileReader:
+                iterator over the chunks of the file
+        """
+        dtypes = {}
+        for column in usecols:
+            dtypes[column] = np.float64 if column in float_columns else object
+        return pd.read_csv(path, sep=self.delim, usecols=usecols, dtype=dtypes, keep_default_na=False,
+                           na_values={column:[''] for column in float_columns}, quoting=csv.QUOTE_NONE,
+                           float_precision='round_trip', skip_blank_lines=False,
+                           chunksize=DefaultValues.manifest_batch_size)
+
+    def create_manifest_with_sum_columnar(self):
+        """
+        Create a manifest file with the columnar engine when a sequencing summary is present. The sequencing summary
+        is read in chunks of columns, which are joined with the read list, the fastp survivors and the bam hits
+        and formatted with vectorized operations. The output is identical to create_manifest_with_sum.
+
+        Returns: 
+            bool: 
+                True if the summary manifest file was created, False otherwise.
+        """
+        manifest_file = manifest_path(self.out_dir, self.out_prefix, self.manifest_format)
+        read_list = self.load_read_list()
+        tables = {}
+        with open(self.in_seq_summary,'r') as fin:
+            header = next(fin).strip().split(self.delim)
+        computed_fields = ['sample_id','read_id','read_len','read_qscore','start_time','end_time','decision',
+                           'fastp_status','is_mapped','is_uniq','contig_id']
+        passthrough_fields = [field_id for field_id in self.fields if field_id in header and field_id not in computed_fields]
+        usecols = ['read_id','sequence_length_template','mean_qscore_template','start_time','duration','end_reason']
+        usecols = usecols + [field_id for field_id in passthrough_fields if field_id not in usecols]
+
+        writer = create_manifest_writer(manifest_file, self.fields, self.manifest_format)
+        try:
+            for chunk in self.read_columns(self.in_seq_summary, usecols, ['start_time','duration']):
+                read_ids = chunk['read_id'].to_numpy(dtype=object)
+                chunk = chunk[read_list.contains_many(read_ids)]
+                read_ids = chunk['read_id'].to_numpy(dtype=object)
+                filtered_reads = self.store_table('filtered_reads', self.filtered_reads, read_ids, self.key_index, tables)
+                mapping = self.store_table('read_index', self.bam_obj.read_index, read_ids, self.load_mapping_table, tables)
+                start_time = chunk['start_time'].to_numpy()
+                duration = chunk['duration'].to_numpy()
+                has_start = ~np.isnan(start_time)
+                has_end = has_start & ~np.isnan(duration)
+                start_col = np.full(len(read_ids), str(self.start_time), dtype=object)
+                start_col[has_start] = start_time[has_start].astype(str)
+                end_col = np.full(len(read_ids), str(self.end_time), dtype=object)
+                end_col[has_start] = ''
+                end_col[has_end] = (start_time[has_end] + duration[has_end]).astype(str)
+                (positions, num_contigs, rows, contig_ids) = self.join_contigs(mapping, read_ids)
+
+                columns = {'sample_id': str(self.sample_id),
+                           'read_id': read_ids,
+                           'read_len': chunk['sequence_length_template'].to_numpy(dtype=object),
+                           'read_qscore': chunk['mean_qscore_template'].to_numpy(dtype=object),
+                           'start_time': start_col,
+                           'end_time': end_col,
+                           'decision': chunk['end_reason'].to_numpy(dtype=object),
+                           'fastp_status': self.bool_column(filtered_reads.get_indexer(read_ids) >= 0),
+                           'is_mapped': self.bool_column(num_contigs > 0),
+                           'is_uniq': self.bool_column(num_contigs <= 1)}
+                for field_id in passthrough_fields:
+                    columns[field_id] = chunk[field_id].to_numpy(dtype=object)
+                self.write_frame(writer, columns, rows, contig_ids)
+        finally:
+            writer.close()
+            read_list.close()
+            self.filtered_reads.close()
+            self.raw_reads.close()
+
+        self.status = self.check_files([manifest_file])
+        if self.status == False:
+            self.error_messages = "one or more files was not created or was empty"
+            raise ValueError(str(self.error_messages))
+
+    def create_manifest_no_sum_columnar(self):
+        """
+        Create a manifest file with the columnar engine when a sequencing summary is NOT present. The read list
+        is read in chunks and joined with the raw reads, the fastp survivors and the bam hits with vectorized
+        operations. The output is identical to create_manifest_no_sum.
+
+        Returns: 
+            file object: 
+                seq manifest text file
+        """
+        manifest_file = manifest_path(self.out_dir, self.out_prefix, self.manifest_format)
+        read_list = self.load_read_list()
+        tables = {}
+
+        writer = create_manifest_writer(manifest_file, self.fields, self.manifest_format)
+        try:
+            for read_ids in read_list.iter_batches(DefaultValues.manifest_batch_size):
+                read_ids = np.array(read_ids, dtype=object)
+                filtered_reads = self.store_table('filtered_reads', self.filtered_reads, read_ids, self.key_index, tables)
+                raw_reads = self.store_table('raw_reads', self.raw_reads, read_ids, self.load_raw_table, tables)
+                mapping = self.store_table('read_index', self.bam_obj.read_index, read_ids, self.load_mapping_table, tables)
+                read_len = np.full(len(read_ids), '0', dtype=object)
+                read_qual = np.full(len(read_ids), '0', dtype=object)
+                raw_positions = raw_reads['index'].get_indexer(read_ids)
+                found = raw_positions >= 0
+                read_len[found] = raw_reads['read_len'][raw_positions[found]]
+                read_qual[found] = raw_reads['read_qual'][raw_positions[found]]
+                (positions, num_contigs, rows, contig_ids) = self.join_contigs(mapping, read_ids)
+                found = positions >= 0
+                read_len[found] = mapping['read_len'][positions[found]]
+                read_qual[found] = mapping['read_qual'][positions[found]]
+
+                columns = {'sample_id': str(self.sample_id),
+                           'read_id': read_ids,
+                           'read_len': read_len,
+                           'read_qscore': read_qual,
+                           'channel': "N/A",
+                           'start_time': str(self.start_time),
+                           'end_time': str(self.end_time),
+                           'decision': "N/A",
+                           'fastp_status': self.bool_column(filtered_reads.get_indexer(read_ids) >= 0),
+                           'is_mapped': self.bool_column(num_contigs > 0),
+                           'is_uniq': self.bool_column(num_contigs <= 1)}
+                self.write_frame(writer, columns, rows, contig_ids)
+        finally:
+            writer.close()
+            read_list.close()
+            self.filtered_reads.close()
+            self.raw_reads.close()
 
         self.status = self.check_files([manifest_file])
         if self.status == False:
             self.error_messages = "one or more files was not created or was empty"
             raise ValueError(str(self.error_messages))
-        
-        fin.close()
-        fout.close()
 
     def check_files(self, files_to_check):
         """
@@ -405,7 +829,7 @@ class SeqManifestSummary:
     error_messages = None
 
     def __init__(self,sample_id, bam_obj, out_prefix, out_dir, kmer_json_file=None,
-                  fastp_json_file=None, paired=False):
+                  fastp_json_file=None, paired=False, manifest_format=ManifestFormats.text):
         """
         Initalize the class with sample_id, bam_obj, out_prefix, and out_dir. Extract sequencing
         statisitics from various files and append to a summary file
@@ -425,6 +849,8 @@ class SeqManifestSummary:
                 a designation to the path of the json file generated from fastp.
             paired: bool
                 a designation of wheather or not the files specified belong to paired-end sequencing data
+            manifest_format: str
+                a designation of the format of the summary file, tab delimited 'text' or 'parquet'. default is 'text'
         """
         self.sample_id = sample_id
         self.kmer_json_file = kmer_json_file
@@ -433,6 +859,8 @@ class SeqManifestSummary:
         self.out_prefix = out_prefix
         self.out_dir = out_dir
         self.paired = paired
+        self.manifest_format = manifest_format
+        self.fields = list(self.fields)
         if self.paired:
             self.fields.insert(6, "mean_read_length_reverse")
         pass
@@ -458,9 +886,8 @@ class SeqManifestSummary:
             bool: 
                 True if the summary manifest file was created, False otherwise.
         """
-        summary_manifest_file = os.path.join(self.out_dir,f"{self.out_prefix}.txt")
-        fout = open(summary_manifest_file,'w')
-        fout.write("{}\n".format("\t".join(self.fields)))
+        summary_manifest_file = manifest_path(self.out_dir, self.out_prefix, self.manifest_format)
+        rows = []
 
         out_row = self.create_row()
         for contig_id in self.bam_obj.ref_stats:
@@ -482,14 +909,18 @@ class SeqManifestSummary:
             if self.paired:
                 out_row["mean_read_length_reverse"] = self.fastp_json_file["summary"]["after_filtering"]["read2_mean_length"]
 
-            fout.write("{}\n".format("\t".join([str(x) for x in out_row.values()])))
+            rows.append(tuple([str(x) for x in out_row.values()]))
+
+        writer = create_manifest_writer(summary_manifest_file, self.fields, self.manifest_format)
+        try:
+            writer.write_rows(rows)
+        finally:
+            writer.close()
         
         self.status = self.check_files([summary_manifest_file])
         if self.status == False:
             self.error_messages = "one or more files was not created or was empty"
             raise ValueError(str(self.error_messages))
-        
-        fout.close()
 
     def check_files(self, files_to_check):
         """
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+
+import os
+import errno
+import shutil
+import tempfile
+import threading
+import time
+from subprocess import Popen, PIPE
+from Sequenoscope.constant import DefaultValues
+from Sequenoscope.analyze.scheduler import split_threads
+
+
+def copy_stream(source, sinks, errors):
+    """
+    Copies a stream into every sink until the end of the stream, then closes the sinks. When a sink fails
+    the error is recorded and the source is closed, so the process writing it stops on a broken pipe
+    instead of blocking on a full pipe.
+
+    Arguments:
+        source: file object
+            stream to copy, usually the stdout of a process
+        sinks: list
+            file objects the stream is written to
+        errors: list
+            errors raised while copying are appended to it
+    """
+    try:
+        source_fd = source.fileno()
+        while True:
+            chunk = os.read(source_fd, DefaultValues.stream_buffer_size)
+            if len(chunk) == 0:
+                break
+            for sink in sinks:
+                sink.write(chunk)
+    except Exception as error:
+        errors.append(error)
+    finally:
+        for sink in sinks:
+            try:
+                sink.close()
+            except Exception as error:
+                errors.append(error)
+        source.close()
+
+def open_fifo_writer(path, reader):
+    """
+    Opens a named pipe for writing once its reader opened it. The pipe is polled rather than opened
+    blocking, so a reader that fails before opening the pipe is reported instead of hanging the run.
+
+    Arguments:
+        path: str
+            path of the named pipe
+        reader: Popen
+            process reading the pipe
+
+    Returns:
+        file object:
+            binary writer of the pipe
+    """
+    while True:
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+            break
+        except OSError as error:
+            if error.errno != errno.ENXIO:
+                raise
+        if reader.poll() is not None:
+            raise ValueError(f"Error {reader.args[0]} exited before reading {path}")
+        time.sleep(DefaultValues.stream_poll_interval)
+    os.set_blocking(fd, True)
+    return os.fdopen(fd, 'wb')
+
+
+class StreamingAligner:
+    fastp_runner = None
+    minimap2_runner = None
+    sam_bam_processor = None
+    kat_runner = None
+    keep_intermediates = False
+    out_dir = None
+    processes = None
+    status = False
+    error_messages = None
+    result_files = None
+
+    def __init__(self, fastp_runner, minimap2_runner, sam_bam_processor, kat_runner=None, keep_intermediates=False):
+        """
+        Initalize the class with the runners of the filtering, mapping and sorting steps. The steps are run at
+        the same time and connected through pipes: the reads filtered by fastp are streamed into minimap2 and
+        a named pipe read by kat hist, the alignments of minimap2 are streamed into samtools sort. Neither the
+        filtered fastq nor the sam file are written unless keep_intermediates is set.
+
+        Arguments:
+            fastp_runner: FastPRunner
+                runner holding the fastp settings and input reads
+            minimap2_runner: Minimap2Runner
+                runner holding the minimap2 settings and reference
+            sam_bam_processor: SamBamProcessor
+                processor holding the samtools settings, the sorted bam is named after its out_prefix
+            kat_runner: KatRunner
+                runner holding the kat settings, kat hist counts the kmers of the filtered reads when given
+            keep_intermediates: bool
+                also write the filtered reads and the alignments to the files the step by step run produces,
+                paired reads are written interleaved into a single fastq. default is False
+        """
+        self.result_files = {"bam_output":"", "sam_output_file":"", "output_files_fastp":[]}
+        self.fastp_runner = fastp_runner
+        self.minimap2_runner = minimap2_runner
+        self.sam_bam_processor = sam_bam_processor
+        self.kat_runner = kat_runner
+        self.keep_intermediates = keep_intermediates
+        self.out_dir = sam_bam_processor.out_dir
+        self.processes = []
+
+    def set_threads(self, threads):
+        """
+        Splits a thread budget across the tools of the pipeline, minimap2 gets the largest share
+
+        Arguments:
+            threads: int
+                total number of threads of the pipeline
+        """
+        runners = [self.fastp_runner, self.minimap2_runner, self.sam_bam_processor]
+        weights = [1, 4, 1]
+        if self.kat_runner is not None:
+            runners.append(self.kat_runner)
+            weights.append(1)
+        for (runner, share) in zip(runners, split_threads(threads, weights)):
+            runner.threads = share
+
+    def start(self, name, cmd, stdin=None, stdout=None):
+        """
+        Starts a step of the pipeline, its stderr is kept in a temporary file for the error messages
+
+        Arguments:
+            name: str
+                name of the step
+            cmd: list
+                arguments of the command
+            stdin: file object or int
+                stdin of the process
+            stdout: file object or int
+                stdout of the process
+
+        Returns:
+            Popen:
+                started process
+        """
+        stderr = tempfile.TemporaryFile()
+        process = Popen(cmd, stdin=stdin, stdout=stdout, stderr=stderr)
+        self.processes.append((name, process, stderr))
+        return process
+
+    def run(self):
+        """
+        Runs fastp, minimap2, samtools sort and kat hist connected through pipes
+
+        Returns:
+            bool:
+                returns True if the generated output files are found and not empty, False otherwise
+        """
+        bam_output = os.path.join(self.out_dir, f"{self.sam_bam_processor.out_prefix}.bam")
+        self.result_files["bam_output"] = bam_output
+        self.sam_bam_processor.result_files["bam_output"] = bam_output
+        fastp_cmd = ["fastp"] + self.fastp_runner.build_command(stream=True)
+        output_files = [self.fastp_runner.result_files["json"], self.fastp_runner.result_files["html"], bam_output]
+        pipe_dir = None
+        copies = []
+        errors = []
+        self.processes = []
+        try:
+            fastp = self.start("fastp", fastp_cmd, stdout=PIPE)
+            minimap2 = self.start("minimap2", self.minimap2_runner.build_command(['-']), stdin=PIPE, stdout=PIPE)
+            if self.keep_intermediates:
+                samtools = self.start("samtools sort", self.sam_bam_processor.sort_command(bam_output), stdin=PIPE)
+                sam_file = os.path.join(self.out_dir, f"{self.minimap2_runner.out_prefix}.sam")
+                self.result_files["sam_output_file"] = sam_file
+                self.minimap2_runner.result_files["sam_output_file"] = sam_file
+                output_files.append(sam_file)
+                copies.append((minimap2.stdout, [samtools.stdin, open(sam_file, 'wb')]))
+            else:
+                samtools = self.start("samtools sort", self.sam_bam_processor.sort_command(bam_output),
+                                      stdin=minimap2.stdout)
+                minimap2.stdout.close()
+
+            read_sinks = [minimap2.stdin]
+            if self.keep_intermediates:
+                fastq_file = os.path.join(self.out_dir, f"{self.fastp_runner.out_prefix}.fastp.fastq")
+                self.result_files["output_files_fastp"] = [fastq_file]
+                self.fastp_runner.result_files["output_files_fastp"] = [fastq_file]
+                output_files.append(fastq_file)
+                read_sinks.append(open(fastq_file, 'wb'))
+            if self.kat_runner is not None:
+                pipe_dir = tempfile.mkdtemp(prefix=f"{self.fastp_runner.out_prefix}_pipes_", dir=self.out_dir)
+                fifo = os.path.join(pipe_dir, f"{self.fastp_runner.out_prefix}.fastp.fastq")
+                os.mkfifo(fifo)
+                kat = self.start("kat hist", self.kat_runner.hist_command([fifo]))
+                output_files += [self.kat_runner.result_files["hist"]["png_file"],
+                                 self.kat_runner.result_files["hist"]["json_file"]]
+                read_sinks.append(open_fifo_writer(fifo, kat))
+            copies.insert(0, (fastp.stdout, read_sinks))
+
+            threads = [threading.Thread(target=copy_stream, args=(source, sinks, errors), daemon=True)
+                       for (source, sinks) in copies]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            for (name, process, stderr) in self.processes:
+                process.wait()
+        finally:
+            for (name, process, stderr) in self.processes:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+            if pipe_dir is not None:
+                shutil.rmtree(pipe_dir, ignore_errors=True)
+
+        failed = []
+        for (name, process, stderr) in self.processes:
+            stderr.seek(0)
+            message = stderr.read().decode('utf-8', errors='replace')
+            stderr.close()
+            if process.returncode != 0:
+                failed.append(f"{name} exited with code {process.returncode}\n{message}")
+        self.status = len(failed) == 0 and self.check_files(output_files)
+        if self.status == False:
+            self.error_messages = "one or more files was not created or was empty, check error message\n{}".format(
+                "\n".join(failed + [str(error) for error in errors]))
+            raise ValueError(str(self.error_messages))
+        return self.status
+
+    def check_files(self, files_to_check):
+        """
+        check if the output file exists and is not empty
+
+        Arguments:
+            files_to_check: list
+                list of file paths
+
+        Returns:
+            bool:
+                returns True if the generated output file is found and not empty, False otherwise
+        """
+        if isinstance (files_to_check, str):
+            files_to_check = [files_to_check]
+        for f in files_to_check:
+            if not os.path.isfile(f):
+                return False
+            elif os.path.getsize(f) == 0:
+                return False
+        return True
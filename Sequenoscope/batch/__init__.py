@@ -0,0 +1,3 @@
+#!/usr/bin/env python
+
+from Sequenoscope.batch.sample_sheet import read_sample_sheet
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+import argparse as ap
+import os
+import csv
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from Sequenoscope.constant import SequenceTypes, Minimap2Presets, ManifestFormats
+from Sequenoscope.version import __version__
+from Sequenoscope.batch.sample_sheet import read_sample_sheet
+from Sequenoscope.analyze import analyze
+from Sequenoscope.analyze.reference_index import ReferenceIndexCache
+from Sequenoscope.analyze.manifest_writer import manifest_path, create_manifest_writer
+
+def parse_args():
+    parser = ap.ArgumentParser(prog="sequenoscope",
+                               usage="sequenoscope batch --sample_sheet <samples.tsv> --input_reference <ref.fasta> -o <out> -seq_type <SE>[options] [analyze options]\nFor help use: sequenoscope batch -h or sequenoscope batch --help",
+                                description="%(prog)s version {}: analyze many samples against one reference. Arguments that are not listed below are passed to sequenoscope analyze for every sample.".format(__version__),
+                                formatter_class= ap.RawTextHelpFormatter, allow_abbrev=False)
+
+    parser._optionals.title = "Arguments"
+
+    parser.add_argument("--sample_sheet", metavar="", required=True, help="[REQUIRED] Path to a tab delimited (or .csv) sample sheet with the columns sample_id, fastq_1 and optionally fastq_2 and sequencing_summary")
+    parser.add_argument("--input_reference", metavar="", required=True, help="[REQUIRED] Path to reference database to process")
+    parser.add_argument("-o", "--output", metavar="", required=True, help="[REQUIRED] Output directory designation, every sample is written to a directory named after its sample_id")
+    parser.add_argument("-o_pre", "--output_prefix", metavar="", default= "batch", help="Prefix of the combined summary and status files. default is [batch]")
+    parser.add_argument("-seq_type", "--sequencing_type", required=True, metavar="", type= str, choices=['SE', 'PE'], help="A designation of the type of sequencing utilized for the input fastq files of every sample")
+    parser.add_argument("-t", "--threads", default= 1, metavar="", type=int, help="A designation of the total number of threads of the samples running at the same time")
+    parser.add_argument("--workers", default= 1, metavar="", type=int, help="A designation of the number of samples analyzed at the same time. default is 1")
+    parser.add_argument("--threads_per_sample", default= None, metavar="", type=int, help="A designation of the number of threads of each sample, fewer samples run at the same time if the total number of threads would be exceeded. default is the total number of threads divided by the number of workers")
+    parser.add_argument('--minimap2_kmer', default= 15, metavar="", type=int, help="A designation of the kmer size when running minimap2")
+    parser.add_argument('--minimap2_index_cache', default= None, metavar="", type=str, help="Path to a directory of prebuilt minimap2 reference indexes. default is a reference_index directory in the output directory")
+    parser.add_argument('--force', required=False, help='Force overwite of existing results directories', action='store_true')
+    parser.add_argument('--resume', required=False, help='Reuse existing results directories and skip every step of a sample whose inputs, parameters and outputs are unchanged', action='store_true')
+    parser.add_argument('-v', '--version', action='version', version="%(prog)s " + __version__)
+    return parser.parse_known_args()
+
+def plan_workers(threads, workers, threads_per_sample=None):
+    """
+    Splits the total number of threads across the samples running at the same time
+
+    Arguments:
+        threads: int
+            total number of threads
+        workers: int
+            requested number of samples running at the same time
+        threads_per_sample: int
+            threads of each sample, default is None to split the threads evenly across the workers
+
+    Returns:
+        tuple:
+            number of samples running at the same time and threads of each sample
+    """
+    threads = max(threads, 1)
+    workers = max(workers, 1)
+    if threads_per_sample is None:
+        threads_per_sample = max(1, threads // workers)
+    threads_per_sample = max(threads_per_sample, 1)
+    workers = max(1, min(workers, threads // threads_per_sample))
+    return (workers, threads_per_sample)
+
+def sample_arguments(sample, args, analyze_args, threads_per_sample):
+    """
+    Builds the arguments of sequenoscope analyze for a sample
+
+    Arguments:
+        sample: dict
+            sample of the sample sheet, see read_sample_sheet
+        args: argparse Namespace
+            arguments of the batch command
+        analyze_args: list
+            arguments passed on to sequenoscope analyze
+        threads_per_sample: int
+            threads of the sample
+
+    Returns:
+        list:
+            arguments of sequenoscope analyze
+    """
+    argv = ["--input_fastq"] + sample["fastq_files"] + [
+            "--input_reference", args.input_reference,
+            "-o", os.path.join(args.output, sample["sample_id"]),
+            "-o_pre", sample["sample_id"],
+            "-seq_type", args.sequencing_type,
+            "-t", f"{threads_per_sample}",
+            "--minimap2_kmer", f"{args.minimap2_kmer}"]
+    if sample["sequencing_summary"] is not None:
+        argv += ["-seq_sum", sample["sequencing_summary"]]
+    if args.force:
+        argv.append("--force")
+    if args.resume:
+        argv.append("--resume")
+    return argv + list(analyze_args)
+
+def run_sample(sample_id, sample_args, ref_index):
+    """
+    Runs the analysis of one sample and reports its outcome instead of raising, so a failed sample does not
+    stop the other samples of the batch
+
+    Arguments:
+        sample_id: str
+            name of the sample
+        sample_args: argparse Namespace
+            arguments of sequenoscope analyze for the sample
+        ref_index: str
+            path of the prebuilt minimap2 index of the reference
+
+    Returns:
+        dict:
+            sample_id, status and error message of the sample
+    """
+    try:
+        analyze.run_analyze(sample_args, ref_index=ref_index)
+    except SystemExit:
+        return {"sample_id":sample_id, "status":"failed", "error":"analyze exited before finishing, see its output"}
+    except Exception as error:
+        traceback.print_exc()
+        return {"sample_id":sample_id, "status":"failed", "error":str(error).replace("\n", " ")}
+    return {"sample_id":sample_id, "status":"done", "error":""}
+
+def combine_summaries(summary_files, out_file, manifest_format):
+    """
+    Combines the manifest summaries of the samples into a single table, the rows of every sample keep their
+    sample_id
+
+    Arguments:
+        summary_files: list
+            paths of the manifest summaries, missing files are skipped
+        out_file: str
+            path of the combined summary
+        manifest_format: str
+            format of the summaries and of the combined summary, 'text' or 'parquet'
+    """
+    if manifest_format == ManifestFormats.parquet:
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError("Error reading Parquet manifests requires pyarrow, install it with pip install pyarrow")
+    writer = None
+    try:
+        for summary_file in summary_files:
+            if not os.path.isfile(summary_file):
+                continue
+            if manifest_format == ManifestFormats.parquet:
+                table = pyarrow.parquet.read_table(summary_file)
+                fields = table.column_names
+                rows = [tuple('' if value is None else str(value) for value in row.values())
+                        for row in table.to_pylist()]
+            else:
+                with open(summary_file, newline='') as f:
+                    reader = csv.reader(f, delimiter="\t")
+                    fields = next(reader)
+                    rows = [tuple(row) for row in reader]
+            if writer is None:
+                writer = create_manifest_writer(out_file, fields, manifest_format)
+            writer.write_rows(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+
+def run():
+    (args, analyze_args) = parse_args()
+    out_directory = args.output
+    seq_class = args.sequencing_type.upper()
+
+    print("-"*40)
+    print(f"Sequenoscope batch version {__version__}: analyzing the samples of {args.sample_sheet}")
+    print("-"*40)
+
+    try:
+        samples = read_sample_sheet(args.sample_sheet, seq_class)
+    except ValueError as error:
+        print(error)
+        sys.exit()
+
+    if not os.path.isdir(out_directory):
+        os.mkdir(out_directory, 0o755)
+    elif not args.force and not args.resume:
+        print(f"Error directory {out_directory} already exists, if you want to overwrite existing results then specify --force, if you want to continue a previous run then specify --resume")
+        sys.exit()
+
+    (workers, threads_per_sample) = plan_workers(args.threads, args.workers, args.threads_per_sample)
+
+    ## the arguments of every sample are checked before any sample is started
+
+    sample_args = {}
+    for sample in samples:
+        sample_args[sample["sample_id"]] = analyze.parse_args(sample_arguments(sample, args, analyze_args,
+                                                                               threads_per_sample))
+
+    ## indexing the reference once, every sample maps against the same prebuilt index
+
+    print("-"*40)
+    print("Indexing the reference....")
+    print("-"*40)
+
+    cache_dir = args.minimap2_index_cache
+    if cache_dir is None:
+        cache_dir = os.path.join(out_directory, "reference_index")
+    preset = Minimap2Presets.nanopore
+    if seq_class == SequenceTypes.paired_end:
+        preset = Minimap2Presets.short_reads
+    ref_index = ReferenceIndexCache(cache_dir).get_index(args.input_reference, kmer_size=args.minimap2_kmer,
+                                                         preset=preset, threads=args.threads)
+
+    print("-"*40)
+    print(f"Analyzing {len(samples)} samples, {workers} at a time with {threads_per_sample} threads each....")
+    print("-"*40)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_sample, sample["sample_id"], sample_args[sample["sample_id"]], ref_index)
+                   for sample in samples]
+        results = [future.result() for future in futures]
+
+    ## combining the per sample outputs
+
+    status_file = os.path.join(out_directory, f"{args.output_prefix}_status.txt")
+    with open(status_file, 'w') as f:
+        f.write("sample_id\tstatus\tout_dir\terror\n")
+        for (sample, result) in zip(samples, results):
+            f.write("{}\t{}\t{}\t{}\n".format(sample["sample_id"], result["status"],
+                                              sample_args[sample["sample_id"]].output, result["error"]))
+
+    manifest_format = sample_args[samples[0]["sample_id"]].manifest_format
+    summary_files = [manifest_path(sample_args[sample["sample_id"]].output,
+                                   f"{sample['sample_id']}_manifest_summary", manifest_format)
+                     for (sample, result) in zip(samples, results) if result["status"] == "done"]
+    combine_summaries(summary_files, manifest_path(out_directory, f"{args.output_prefix}_summary", manifest_format),
+                      manifest_format)
+
+    failed = [result["sample_id"] for result in results if result["status"] != "done"]
+    print("-"*40)
+    if len(failed) > 0:
+        print(f"{len(failed)} of {len(samples)} samples failed: {', '.join(failed)}, see {status_file}")
+    else:
+        print("All Done!")
+    print("-"*40)
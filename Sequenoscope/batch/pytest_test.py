@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+import argparse
+import pytest
+from Sequenoscope.batch import read_sample_sheet
+from Sequenoscope.batch.batch import plan_workers, sample_arguments, combine_summaries
+from Sequenoscope.analyze import analyze
+
+
+def test_read_sample_sheet(tmp_path):
+    for name in ["barcode01.fastq", "barcode02.fastq", "summary.txt"]:
+        (tmp_path / name).write_text("@read_1\nACGT\n+\nIIII\n")
+    sheet = tmp_path / "samples.tsv"
+    sheet.write_text("sample_id\tfastq_1\tfastq_2\tsequencing_summary\n"
+                     "barcode01\tbarcode01.fastq\t\tsummary.txt\n"
+                     "barcode02\tbarcode02.fastq\t\t\n")
+    samples = read_sample_sheet(str(sheet), "SE")
+    assert [sample["sample_id"] for sample in samples] == ["barcode01", "barcode02"]
+    assert samples[0]["fastq_files"] == [str(tmp_path / "barcode01.fastq")]
+    assert samples[0]["sequencing_summary"] == str(tmp_path / "summary.txt")
+    assert samples[1]["sequencing_summary"] is None
+    with pytest.raises(ValueError):
+        read_sample_sheet(str(sheet), "PE")
+    sheet.write_text("sample_id\tfastq_1\nbarcode01\tbarcode01.fastq\nbarcode01\tbarcode02.fastq\n")
+    with pytest.raises(ValueError):
+        read_sample_sheet(str(sheet), "SE")
+    pass
+
+def test_plan_workers():
+    assert plan_workers(32, 4) == (4, 8)
+    assert plan_workers(32, 8, threads_per_sample=8) == (4, 8)
+    assert plan_workers(1, 4) == (1, 1)
+    pass
+
+def test_sample_arguments(tmp_path):
+    batch_args = argparse.Namespace(input_reference="ref.fasta", output=str(tmp_path), sequencing_type="SE",
+                                    minimap2_kmer=15, force=False, resume=True)
+    sample = {"sample_id":"barcode01", "fastq_files":["barcode01.fastq"], "sequencing_summary":None}
+    args = analyze.parse_args(sample_arguments(sample, batch_args, ["--bam_mode", "scan"], 8))
+    assert args.output == str(tmp_path / "barcode01") and args.output_prefix == "barcode01"
+    assert args.threads == 8 and args.bam_mode == "scan" and args.resume == True
+    pass
+
+def test_combine_summaries(tmp_path):
+    for sample_id in ["barcode01", "barcode02"]:
+        (tmp_path / f"{sample_id}.txt").write_text(f"sample_id\ttaxon_id\n{sample_id}\tcontig_1\n{sample_id}\tcontig_2\n")
+    combine_summaries([str(tmp_path / "barcode01.txt"), str(tmp_path / "missing.txt"), str(tmp_path / "barcode02.txt")],
+                      str(tmp_path / "batch_summary.txt"), "text")
+    lines = (tmp_path / "batch_summary.txt").read_text().splitlines()
+    assert lines == ["sample_id\ttaxon_id", "barcode01\tcontig_1", "barcode01\tcontig_2",
+                     "barcode02\tcontig_1", "barcode02\tcontig_2"]
+    pass
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+import os
+import csv
+from Sequenoscope.constant import SequenceTypes
+
+SAMPLE_SHEET_FIELDS = ['sample_id', 'fastq_1', 'fastq_2', 'sequencing_summary']
+
+
+def read_sample_sheet(sample_sheet, seq_type=SequenceTypes.single_end):
+    """
+    Reads a sample sheet with one sample per row. The sheet is tab delimited, or comma delimited when its
+    name ends with .csv, and has a header with the columns sample_id and fastq_1 and optionally fastq_2 for the
+    second mate of paired-end samples and sequencing_summary for the sequencing summary of nanopore samples.
+    Relative paths are relative to the directory of the sample sheet.
+
+    Arguments:
+        sample_sheet: str
+            path of the sample sheet
+        seq_type: str
+            sequencing type of every sample, 'SE' or 'PE'. default is 'SE'
+
+    Returns:
+        list:
+            one dict per sample with the sample_id, the list of fastq files and the sequencing summary or None
+    """
+    delim = "\t"
+    if sample_sheet.lower().endswith(".csv"):
+        delim = ","
+    sheet_dir = os.path.dirname(os.path.abspath(sample_sheet))
+    samples = []
+    sample_ids = set()
+    with open(sample_sheet, newline='') as f:
+        reader = csv.DictReader(f, delimiter=delim)
+        missing = [field for field in SAMPLE_SHEET_FIELDS[:2] if field not in (reader.fieldnames or [])]
+        if len(missing) > 0:
+            raise ValueError(f"Error sample sheet {sample_sheet} is missing the columns {', '.join(missing)}")
+        for (line_num, row) in enumerate(reader, start=2):
+            sample_id = (row.get('sample_id') or '').strip()
+            if sample_id == '':
+                continue
+            if sample_id in sample_ids:
+                raise ValueError(f"Error sample {sample_id} is listed more than once in {sample_sheet}")
+            sample_ids.add(sample_id)
+            fastq_files = []
+            for field in ['fastq_1', 'fastq_2']:
+                path = (row.get(field) or '').strip()
+                if path != '':
+                    fastq_files.append(os.path.join(sheet_dir, path))
+            seq_summary = (row.get('sequencing_summary') or '').strip()
+            if seq_summary == '':
+                seq_summary = None
+            else:
+                seq_summary = os.path.join(sheet_dir, seq_summary)
+
+            if seq_type == SequenceTypes.paired_end and len(fastq_files) != 2:
+                raise ValueError(f"Error sample {sample_id} on line {line_num} needs a fastq_1 and a fastq_2 file for paired-end sequencing")
+            if seq_type == SequenceTypes.single_end and len(fastq_files) != 1:
+                raise ValueError(f"Error sample {sample_id} on line {line_num} needs a single fastq_1 file for single-end sequencing")
+            for path in fastq_files + [seq_summary]:
+                if path is not None and not os.path.isfile(path):
+                    raise ValueError(f"Error file {path} of sample {sample_id} does not exist")
+            samples.append({"sample_id":sample_id, "fastq_files":fastq_files, "sequencing_summary":seq_summary})
+    if len(samples) == 0:
+        raise ValueError(f"Error sample sheet {sample_sheet} lists no samples")
+    return samples
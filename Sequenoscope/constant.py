@@ -7,6 +7,48 @@ class SequenceTypes:
     paired_end: str = 'PE'
     single_end: str = 'SE'
 
+@dataclass(frozen=True)
+class CoverageModes:
+    interval: str = 'interval'
+    blocks: str = 'blocks'
+
+@dataclass(frozen=True)
+class CoverageStores:
+    dense: str = 'dense'
+    rle: str = 'rle'
+
+@dataclass(frozen=True)
+class BamProcessingModes:
+    fetch: str = 'fetch'
+    scan: str = 'scan'
+
+@dataclass(frozen=True)
+class ManifestEngines:
+    python: str = 'python'
+    pandas: str = 'pandas'
+
+@dataclass(frozen=True)
+class ManifestFormats:
+    text: str = 'text'
+    parquet: str = 'parquet'
+
+@dataclass(frozen=True)
+class CompressionTypes:
+    none: str = 'none'
+    gzip: str = 'gzip'
+    bgzf: str = 'bgzf'
+
+@dataclass(frozen=True)
+class Minimap2Presets:
+    nanopore: str = 'map-ont'
+    short_reads: str = 'sr'
+
+@dataclass(frozen=True)
+class ReadRecords:
+    flag: tuple = ()
+    stats: tuple = ('length', 'qscore')
+    mapping: tuple = ('contigs', 'length', 'qscore')
+
 @dataclass(frozen=True)
 class DefaultValues:
     minimap2_kmer_size: int = 15
@@ -16,4 +58,27 @@ class DefaultValues:
     fastq_sample_row_number: int = 4
     fastq_line_starter: str = "@"
     phred_33_encoding_value: int = 33
-    max_nanopore_channel: int = 512
\ No newline at end of file
+    max_nanopore_channel: int = 512
+    coverage_batch_size: int = 100000
+    bam_region_size: int = 10000000
+    qscore_batch_size: int = 10000
+    fastq_chunk_size: int = 4194304
+    decompression_threads: int = 4
+    decompression_buffer_size: int = 1048576
+    decompression_queue_size: int = 16
+    gzip_read_size: int = 131072
+    bgzf_batch_size: int = 1048576
+    stream_buffer_size: int = 1048576
+    stream_poll_interval: float = 0.05
+    fingerprint_block_size: int = 65536
+    fingerprint_sample_count: int = 16
+    read_stats_exact_length_limit: int = 10000
+    read_stats_length_bin_error: float = 0.001
+    read_stats_qscore_resolution: float = 0.01
+    coverage_compact_events: int = 1000000
+    coverage_bin_size: int = 100
+    manifest_batch_size: int = 100000
+    read_store_batch_size: int = 100000
+    read_store_query_size: int = 900
+    read_registry_merge_size: int = 100000
+    read_registry_dict_entry_size: int = 100
\ No newline at end of file
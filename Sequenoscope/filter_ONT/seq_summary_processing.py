@@ -20,7 +20,7 @@ class SeqSummaryProcesser:
     status = False
     status_read_id = False
     error_messages = None
-    result_files = {"filtered_read_id_list":""}
+    result_files = None
     classes = {"stop_receiving":["signal_positive"], "unblocked":["data_service_unblock_mux_change"],
                "no_decision":["signal_negative", "unblock_mux_change"], "all":["signal_positive", "data_service_unblock_mux_change", "signal_negative", "unblock_mux_change"]}
 
@@ -60,6 +60,7 @@ class SeqSummaryProcesser:
             max_len = len
                 a designation that indicates the maximum length of a sequence for the reads in an ONT run
         """
+        self.result_files = {"filtered_read_id_list":""}
         self.parsed_report_object = parsed_report_object.parsed_file
         self.out_dir = out_dir
         self.out_prefix = out_prefix
@@ -8,7 +8,7 @@ class SeqtkRunner:
     out_prefix = None
     status = False
     error_messages = None
-    result_files = {"output_fastq":""}
+    result_files = None
     
     
     def __init__(self, read_set, csv_file, out_dir, out_prefix):
@@ -25,6 +25,7 @@ class SeqtkRunner:
             out_prefix: str
                 a designation of what the output files will be named
         """
+        self.result_files = {"output_fastq":""}
         self.read_set = read_set
         self.csv_file = csv_file
         self.out_dir = out_dir
@@ -4,12 +4,14 @@ import sys
 
 modules = {'analyze': 'map reads to a target and produce a report with sequencing statistics',
             'plot': 'generate plots based on fastq or kmer hash files',
-            'filter_ONT': 'filter reads from a fastq file based on a sequencing summary file'
+            'filter_ONT': 'filter reads from a fastq file based on a sequencing summary file',
+            'batch': 'analyze the samples of a sample sheet against one reference with a pool of workers'
             }
 
 module_ordered = ['analyze',
                 'plot',
-                'filter_ONT'
+                'filter_ONT',
+                'batch'
                 ]
 
 def print_usage_and_exit():
@@ -2,6 +2,7 @@
 from subprocess import Popen, PIPE
 import os
 import hashlib
+from Sequenoscope.constant import DefaultValues
 
 def run_command(command):
     p = Popen(command, shell=True, stdout=PIPE, stderr=PIPE)
@@ -18,4 +19,36 @@ def compute_sha256(file_name):
     with open(file_name, "rb") as f:
         for chunk in iter(lambda: f.read(5000), b""):
             hash_sha256.update(chunk)
-    return hash_sha256.hexdigest()  
\ No newline at end of file
+    return hash_sha256.hexdigest()  
+
+def compute_fingerprint(file_name, block_size=DefaultValues.fingerprint_block_size,
+                        sample_count=DefaultValues.fingerprint_sample_count):
+    """
+    Computes a sha256 fingerprint of a file from its size and evenly spaced sample blocks, which reads a
+    few megabytes instead of the whole file. Files smaller than the samples are hashed whole like
+    compute_sha256.
+
+    Arguments:
+        file_name: str
+            path of the file
+        block_size: int
+            size in bytes of each sample block
+        sample_count: int
+            number of sample blocks, the first and the last block are always sampled
+
+    Returns:
+        str:
+            hex digest of the fingerprint
+    """
+    size = os.path.getsize(file_name)
+    hash_sha256 = hashlib.sha256(str(size).encode())
+    with open(file_name, "rb") as f:
+        if size <= block_size * sample_count:
+            for chunk in iter(lambda: f.read(block_size), b""):
+                hash_sha256.update(chunk)
+        else:
+            step = (size - block_size) // (sample_count - 1)
+            for i in range(sample_count):
+                f.seek(i * step)
+                hash_sha256.update(f.read(block_size))
+    return hash_sha256.hexdigest()
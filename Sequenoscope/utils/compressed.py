@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+
+import io
+import zlib
+import queue
+import struct
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from Sequenoscope.constant import DefaultValues, CompressionTypes
+
+GZIP_MAGIC = b'\x1f\x8b'
+GZIP_WBITS = 31
+BGZF_HEADER_SIZE = 18
+
+
+def detect_compression(path):
+    """
+    Detects the compression of a file from its first bytes. BGZF files are gzip files whose members carry
+    the BC extra subfield holding the size of the block.
+
+    Arguments:
+        path: str
+            path of the file
+
+    Returns:
+        str:
+            'bgzf', 'gzip' or 'none'
+    """
+    with open(path, 'rb') as f:
+        header = f.read(BGZF_HEADER_SIZE)
+    if not header.startswith(GZIP_MAGIC):
+        return CompressionTypes.none
+    if bgzf_block_size(header) is not None:
+        return CompressionTypes.bgzf
+    return CompressionTypes.gzip
+
+def bgzf_block_size(data, start=0):
+    """
+    Reads the size of the BGZF block starting at start
+
+    Arguments:
+        data: bytes
+            buffer holding the block header
+        start: int
+            offset of the block in the buffer
+
+    Returns:
+        int:
+            total size of the block in bytes, None when the header is not a BGZF header
+    """
+    if len(data) < start + BGZF_HEADER_SIZE or data[start:start + 2] != GZIP_MAGIC or not data[start + 3] & 4:
+        return None
+    (extra_len,) = struct.unpack_from('<H', data, start + 10)
+    position = start + 12
+    extra_end = position + extra_len
+    if len(data) < extra_end:
+        return None
+    while position + 4 <= extra_end:
+        (subfield_len,) = struct.unpack_from('<H', data, position + 2)
+        if data[position:position + 2] == b'BC' and subfield_len == 2:
+            (block_size,) = struct.unpack_from('<H', data, position + 4)
+            return block_size + 1
+        position += 4 + subfield_len
+    return None
+
+def decompress_blocks(blocks):
+    """
+    Decompresses a batch of BGZF blocks, every block is a complete gzip member
+
+    Arguments:
+        blocks: list
+            compressed blocks
+
+    Returns:
+        bytes:
+            decompressed data of the blocks
+    """
+    return b''.join([zlib.decompress(block, GZIP_WBITS) for block in blocks])
+
+def open_input(path, mode='rb', threads=DefaultValues.decompression_threads):
+    """
+    Opens a possibly compressed input file for reading. BGZF files are decompressed block by block in a pool
+    of threads, other gzip files are decompressed by a background thread while the caller reads, plain files
+    are opened as they are. zlib releases the GIL, so the decompression runs next to the parsing.
+
+    Arguments:
+        path: str
+            path of the file
+        mode: str
+            'rb' for bytes, 'r' or 'rt' for text
+        threads: int
+            number of threads decompressing BGZF blocks
+
+    Returns:
+        file object:
+            readable binary or text stream
+    """
+    if mode not in ['rb', 'r', 'rt']:
+        raise ValueError(f"Error mode {mode} is not supported, inputs are opened with 'rb', 'r' or 'rt'")
+    compression = detect_compression(path)
+    if compression == CompressionTypes.none:
+        return open(path, mode)
+    if compression == CompressionTypes.bgzf:
+        raw = BgzfReader(path, threads)
+    else:
+        raw = ThreadedGzipReader(path)
+    stream = io.BufferedReader(raw, buffer_size=DefaultValues.decompression_buffer_size)
+    if mode == 'rb':
+        return stream
+    return io.TextIOWrapper(stream)
+
+
+class BgzfReader(io.RawIOBase):
+    fin = None
+    threads = 1
+    executor = None
+    pending = None
+    remainder = b''
+    buffer = b''
+    offset = 0
+    eof = False
+
+    def __init__(self, path, threads=DefaultValues.decompression_threads):
+        """
+        Initalize the class with the path of a BGZF file. The file is read in chunks of
+        DefaultValues.bgzf_batch_size bytes that are split into blocks from the block sizes of their headers,
+        the blocks of every chunk are decompressed as one batch in a thread pool while the earlier batches
+        are read.
+
+        Arguments:
+            path: str
+                path of the BGZF file
+            threads: int
+                number of decompression threads
+        """
+        self.fin = open(path, 'rb')
+        self.threads = max(threads, 1)
+        self.executor = ThreadPoolExecutor(max_workers=self.threads)
+        self.pending = deque()
+        self.remainder = b''
+        self.buffer = b''
+        self.offset = 0
+        self.eof = False
+
+    def readable(self):
+        return True
+
+    def read_blocks(self):
+        """
+        Reads the next chunk of the file and splits it into complete blocks
+
+        Returns:
+            list:
+                compressed blocks, empty at the end of the file
+        """
+        blocks = []
+        while len(blocks) == 0 and not self.eof:
+            chunk = self.fin.read(DefaultValues.bgzf_batch_size)
+            if len(chunk) == 0:
+                self.eof = True
+                if len(self.remainder) > 0:
+                    raise ValueError("Error: {} ends with a truncated BGZF block".format(self.fin.name))
+                break
+            data = self.remainder + chunk
+            start = 0
+            while True:
+                block_size = bgzf_block_size(data, start)
+                if block_size is None or start + block_size > len(data):
+                    if block_size is None and len(data) - start >= BGZF_HEADER_SIZE:
+                        raise ValueError("Error: {} is not a valid BGZF file".format(self.fin.name))
+                    break
+                blocks.append(data[start:start + block_size])
+                start += block_size
+            self.remainder = data[start:]
+        return blocks
+
+    def fill(self):
+        """
+        Queues batches of blocks for decompression until every thread has two batches ahead of the reader
+        """
+        while len(self.pending) < 2 * self.threads and not self.eof:
+            blocks = self.read_blocks()
+            if len(blocks) > 0:
+                self.pending.append(self.executor.submit(decompress_blocks, blocks))
+
+    def readinto(self, b):
+        while self.offset >= len(self.buffer):
+            self.fill()
+            if len(self.pending) == 0:
+                return 0
+            self.buffer = self.pending.popleft().result()
+            self.offset = 0
+        num_bytes = min(len(b), len(self.buffer) - self.offset)
+        b[:num_bytes] = self.buffer[self.offset:self.offset + num_bytes]
+        self.offset += num_bytes
+        return num_bytes
+
+    def close(self):
+        if not self.closed:
+            for future in self.pending:
+                future.cancel()
+            self.executor.shutdown(wait=True)
+            self.fin.close()
+        super().close()
+
+
+class ThreadedGzipReader(io.RawIOBase):
+    fin = None
+    chunks = None
+    thread = None
+    stopped = None
+    buffer = b''
+    offset = 0
+    done = False
+
+    def __init__(self, path):
+        """
+        Initalize the class with the path of a gzip file and start decompressing it in a background thread.
+        Decompressed chunks are handed over through a bounded queue, so at most
+        DefaultValues.decompression_queue_size chunks are held ahead of the reader. Concatenated gzip
+        members are read one after the other like gzip.open does.
+
+        Arguments:
+            path: str
+                path of the gzip file
+        """
+        self.fin = open(path, 'rb')
+        self.chunks = queue.Queue(maxsize=DefaultValues.decompression_queue_size)
+        self.stopped = threading.Event()
+        self.buffer = b''
+        self.offset = 0
+        self.done = False
+        self.thread = threading.Thread(target=self.decompress, daemon=True)
+        self.thread.start()
+
+    def readable(self):
+        return True
+
+    def put(self, item):
+        """
+        Hands an item over to the reader, gives up when the reader was closed
+
+        Arguments:
+            item: bytes, None or Exception
+                decompressed chunk, None at the end of the file or the error that stopped the decompression
+        """
+        while not self.stopped.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def decompress(self):
+        """
+        Decompresses the file chunk by chunk, runs in the background thread
+        """
+        try:
+            decompressor = zlib.decompressobj(GZIP_WBITS)
+            in_member = False
+            while not self.stopped.is_set():
+                data = self.fin.read(DefaultValues.gzip_read_size)
+                if len(data) == 0:
+                    break
+                while len(data) > 0:
+                    if not in_member:
+                        data = data.lstrip(b'\x00')
+                        if len(data) == 0:
+                            break
+                    in_member = True
+                    out = decompressor.decompress(data)
+                    if len(out) > 0:
+                        self.put(out)
+                    data = b''
+                    if decompressor.eof:
+                        data = decompressor.unused_data
+                        decompressor = zlib.decompressobj(GZIP_WBITS)
+                        in_member = False
+            if in_member and not self.stopped.is_set():
+                raise EOFError("Error: {} ends before the end of its last gzip member".format(self.fin.name))
+            self.put(None)
+        except Exception as error:
+            self.put(error)
+
+    def readinto(self, b):
+        while self.offset >= len(self.buffer):
+            if self.done:
+                return 0
+            item = self.chunks.get()
+            if item is None:
+                self.done = True
+                return 0
+            if isinstance(item, Exception):
+                self.done = True
+                raise item
+            self.buffer = item
+            self.offset = 0
+        num_bytes = min(len(b), len(self.buffer) - self.offset)
+        b[:num_bytes] = self.buffer[self.offset:self.offset + num_bytes]
+        self.offset += num_bytes
+        return num_bytes
+
+    def close(self):
+        if not self.closed:
+            self.stopped.set()
+            self.thread.join()
+            self.fin.close()
+        super().close()
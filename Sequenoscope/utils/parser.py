@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 from __future__ import print_function
 from Sequenoscope.utils.__init__ import is_non_zero_file
+from Sequenoscope.utils.qscore import calc_mean_qscores_buffer
+from Sequenoscope.utils.compressed import open_input
+from Sequenoscope.constant import DefaultValues
+import numpy as np
 import pandas as pd
 import json
-import re
 import os
 import sys
 
@@ -54,25 +57,50 @@ class GeneralSeqParser:
         return True
     
 class fastq_parser:
-    REGEX_GZIPPED = re.compile(r'^.+\.gz$')
     f = None
     read_id_from_record = None
     def __init__(self,filepath):
         self.filepath = filepath
 
     def parse(self):
-        filepath  = self.filepath
-        if self.REGEX_GZIPPED.match(filepath):
-            # using os.popen with zcat since it is much faster than gzip.open or gzip.open(io.BufferedReader)
-            # http://aripollak.com/pythongzipbenchmarks/
-            # assumes Linux os with zcat installed
-            with os.popen('zcat < {}'.format(filepath)) as f:
-                yield from self.parse_fastq(f)
-        else:
-            with open(filepath, 'r') as f:
-                yield from self.parse_fastq(f)
+        # gzip and BGZF inputs are decompressed in-process, see open_input
+        with open_input(self.filepath, 'r') as f:
+            yield from self.parse_fastq(f)
         return
 
+    def parse_batches(self, chunk_size=DefaultValues.fastq_chunk_size):
+        """
+        Parses the fastq file in binary chunks and yields the complete records of every chunk as a batch.
+        Record boundaries are found with vectorized newline searches over the chunk, the incomplete record at
+        the end of a chunk is carried over to the next one. Multi-line fastq records are accepted and
+        normalized to four lines.
+
+        Arguments:
+            chunk_size: int
+                number of bytes read at a time
+
+        Yields:
+            FastqBatch:
+                records of a chunk
+        """
+        filepath = self.filepath
+        with open_input(filepath, 'rb') as f:
+            remainder = b''
+            while True:
+                chunk = f.read(chunk_size)
+                final = len(chunk) == 0
+                buffer = remainder + chunk
+                if final and not buffer.endswith(b'\n'):
+                    buffer += b'\n'
+                (batch, consumed) = index_fastq_chunk(buffer, final)
+                if len(batch) > 0:
+                    yield batch
+                remainder = buffer[consumed:]
+                if final:
+                    if len(remainder.strip()) > 0:
+                        raise ValueError("Error: the last record of {} is truncated".format(filepath))
+                    return
+
 
     def parse_fastq(self,f):
 
@@ -87,12 +115,236 @@ class fastq_parser:
                 n = 0
                 record = []
 
+class FastqRecord:
+    __slots__ = ('read_id', 'seq', 'qual')
+
+    def __init__(self, read_id, seq, qual):
+        """
+        Initalize the class with the parts of a fastq record
+
+        Arguments:
+            read_id: str
+                read id, the header up to the first space
+            seq: memoryview
+                sequence, a slice of the buffer of its batch
+            qual: memoryview
+                Phred 33 qualities, a slice of the buffer of its batch
+        """
+        self.read_id = read_id
+        self.seq = seq
+        self.qual = qual
+
+
+class FastqBatch:
+    __slots__ = ('buffer', 'header_starts', 'header_ends', 'seq_starts', 'seq_ends', 'qual_starts', 'qual_ends')
+
+    def __init__(self, buffer, header_starts, header_ends, seq_starts, seq_ends, qual_starts, qual_ends):
+        """
+        Initalize the class with a buffer of four line fastq records and the offsets of the header, sequence and
+        quality of every record in the buffer. The records are not copied out of the buffer.
+
+        Arguments:
+            buffer: bytes
+                buffer holding the records
+            header_starts, header_ends: numpy array
+                offsets of the header lines, including the leading @
+            seq_starts, seq_ends: numpy array
+                offsets of the sequences
+            qual_starts, qual_ends: numpy array
+                offsets of the qualities
+        """
+        self.buffer = buffer
+        self.header_starts = header_starts
+        self.header_ends = header_ends
+        self.seq_starts = seq_starts
+        self.seq_ends = seq_ends
+        self.qual_starts = qual_starts
+        self.qual_ends = qual_ends
+
+    def __len__(self):
+        return len(self.seq_starts)
+
+    def read_ids(self):
+        """
+        Returns:
+            list:
+                read ids of the batch, the headers without the @ up to the first space
+        """
+        if len(self) == 0:
+            return []
+        buffer = self.buffer
+        find = buffer.find
+        read_ids = []
+        for (start, end) in zip(self.header_starts.tolist(), self.header_ends.tolist()):
+            space = find(b' ', start, end)
+            if space < 0:
+                space = end
+            read_ids.append(buffer[start + 1:space])
+        return b'\n'.join(read_ids).decode().split('\n')
+
+    def lengths(self):
+        """
+        Returns:
+            numpy array:
+                sequence length of every record
+        """
+        return self.seq_ends - self.seq_starts
+
+    def mean_qscores(self, offset=DefaultValues.phred_33_encoding_value):
+        """
+        Calculates the mean qscore of every record straight from the buffer
+
+        Arguments:
+            offset: int
+                encoding offset of the qualities, default is Phred+33
+
+        Returns:
+            numpy array:
+                mean qscore of every record, 0 for records without qualities
+        """
+        return calc_mean_qscores_buffer(self.buffer, self.qual_starts, self.qual_ends, offset)
+
+    def qscore_values(self, offset=DefaultValues.phred_33_encoding_value):
+        """
+        Calculates the mean qscore of every record as python values, see mean_qscores
+
+        Arguments:
+            offset: int
+                encoding offset of the qualities, default is Phred+33
+
+        Returns:
+            list:
+                mean qscore of every record, the integer 0 for records without qualities like calc_mean_qscore
+        """
+        qscores = self.mean_qscores(offset).tolist()
+        for i in np.flatnonzero(self.qual_ends == self.qual_starts).tolist():
+            qscores[i] = 0
+        return qscores
+
+    def records(self):
+        """
+        Yields:
+            FastqRecord:
+                records of the batch with memoryview slices of the buffer as sequence and qualities
+        """
+        view = memoryview(self.buffer)
+        for (read_id, seq_start, seq_end, qual_start, qual_end) in zip(self.read_ids(), self.seq_starts.tolist(),
+                                                                        self.seq_ends.tolist(),
+                                                                        self.qual_starts.tolist(),
+                                                                        self.qual_ends.tolist()):
+            yield FastqRecord(read_id, view[seq_start:seq_end], view[qual_start:qual_end])
+
+
+def index_fastq_chunk(buffer, final=False):
+    """
+    Finds the complete fastq records of a chunk. The chunk is first read as four line records from the
+    positions of its newlines; when a record does not look like a four line record (header not starting
+    with @, separator not starting with +, or sequence and qualities of different lengths) the chunk is
+    normalized with normalize_fastq_chunk and indexed again.
+
+    Arguments:
+        buffer: bytes
+            chunk starting at the beginning of a record
+        final: bool
+            True when the chunk is the end of the file
+
+    Returns:
+        tuple:
+            FastqBatch of the complete records and the number of bytes of the chunk they take
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    newlines = np.flatnonzero(data == 10)
+    num_records = len(newlines) // 4
+    line_ends = newlines[:num_records * 4]
+    line_starts = np.empty(len(line_ends), dtype=np.int64)
+    if len(line_ends) > 0:
+        line_starts[0] = 0
+        line_starts[1:] = line_ends[:-1] + 1
+        carriage = data[np.maximum(line_ends - 1, 0)] == 13
+        line_ends = line_ends - (carriage & (line_ends > line_starts))
+    header_starts = line_starts[0::4]
+    valid = (data[header_starts] == 64).all() and (data[line_starts[2::4]] == 43).all()
+    valid = valid and ((line_ends[1::4] - line_starts[1::4]) == (line_ends[3::4] - line_starts[3::4])).all()
+    if not valid:
+        (buffer, consumed) = normalize_fastq_chunk(buffer, final)
+        (batch, normalized) = index_fastq_chunk(buffer)
+        return (batch, consumed)
+    batch = FastqBatch(buffer, header_starts, line_ends[0::4], line_starts[1::4], line_ends[1::4],
+                       line_starts[3::4], line_ends[3::4])
+    if num_records == 0:
+        return (batch, 0)
+    return (batch, int(newlines[num_records * 4 - 1]) + 1)
+
+def normalize_fastq_chunk(buffer, final=False):
+    """
+    Rewrites the complete records of a chunk as four line records. Like FastqPairedEndRenamer, sequence lines
+    are read up to the line starting with + and quality lines until there are as many qualities as bases,
+    so quality lines starting with @ are not mistaken for headers. Empty lines between records are skipped.
+
+    Arguments:
+        buffer: bytes
+            chunk starting at the beginning of a record
+        final: bool
+            True when the chunk is the end of the file
+
+    Returns:
+        tuple:
+            bytes of the four line records and the number of bytes of the chunk they were read from
+    """
+    lines = buffer.split(b'\n')
+    if not final or len(lines[-1]) == 0:
+        lines.pop()
+    out = []
+    consumed = 0
+    position = 0
+    line_id = 0
+    for line in lines:
+        position += len(line) + 1
+        if line.endswith(b'\r'):
+            line = line[:-1]
+        if line_id == 0:
+            if len(line) == 0:
+                consumed = position
+                continue
+            if line[:1] != b'@':
+                raise ValueError("Error: file is not in FASTQ format, expected a header at {}".format(line[:50]))
+            header = line
+            data = []
+            data_len = 0
+            qual = []
+            qual_len = 0
+            line_id = 1
+        elif line_id == 1:
+            if line[:1] == b'+':
+                line_id = 2
+                if data_len == 0:
+                    line_id = 0
+                    out.extend((header, b'', b'+', b''))
+                    consumed = position
+            else:
+                data.append(line)
+                data_len += len(line)
+        else:
+            qual.append(line)
+            qual_len += len(line)
+            if qual_len >= data_len:
+                if qual_len != data_len:
+                    raise ValueError("Error: file is not in FASTQ format, {} has more qualities than bases".format(header))
+                out.extend((header, b''.join(data), b'+', b''.join(qual)))
+                consumed = position
+                line_id = 0
+    if len(out) == 0:
+        return (b'', consumed)
+    out.append(b'')
+    return (b'\n'.join(out), consumed)
+
+
 class FastqPairedEndRenamer:
     out_prefix = None
     out_dir = None
     read_set = None
     status = False
-    result_files = {"fastq_file_renamed":[]}
+    result_files = None
 
     def __init__(self, read_set, read_file, out_dir, out_prefix):
         """
@@ -108,20 +360,12 @@ class FastqPairedEndRenamer:
             out_dir: str
                 a string to the path where the output files will be stored
         """
+        self.result_files = {"fastq_file_renamed":[]}
         self.out_prefix = out_prefix
         self.out_dir = out_dir
         self.read_set = read_set
         self.read_file = read_file
         self.read_list = set()
-        self.read_id_list()
-
-    def read_id_list(self):
-        """
-        Extracts all read ids from the read file into a set
-        """
-        with open(self.read_file, 'r') as f:
-            for read_id in f:
-                self.read_list.add(read_id)
 
     def rename(self):
         """
@@ -141,7 +385,7 @@ class FastqPairedEndRenamer:
             out_file = open(f"{self.out_dir}/{self.out_prefix}_{file_num+1}.fastq", "w")
             fastq_out_file = os.path.join(self.out_dir,"{}_{}.fastq".format(self.out_prefix, file_num+1))
             self.result_files["fastq_file_renamed"].append(fastq_out_file)
-            with open(self.read_set.files[file_num], 'r') as f:
+            with open_input(self.read_set.files[file_num], 'r') as f:
                 for line in f:
                     if (line_id == 0):
                         if (valid):
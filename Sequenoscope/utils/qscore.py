@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+import numpy as np
+from math import log
+from Sequenoscope.constant import DefaultValues
+
+
+def error_prob_table(n=DefaultValues.nanoget_threshold, offset=0):
+    """
+    generate a lookup table of error rates indexed by the raw byte value of a quality.
+    Qualities above n are capped to n.
+    source: github.com/wdecoster/nanoget/blob/master/nanoget/utils.py
+
+    Arguments:
+        n: int
+            error probability threshold
+        offset: int
+            encoding offset of the qualities, 0 for raw Phred values and 33 for Phred+33 strings
+
+    Returns:
+        numpy array:
+            array of 256 error rates
+    """
+    phred = np.clip(np.arange(256) - offset, 0, n)
+    return 10 ** (phred / -10)
+
+ERROR_PROB_TABLES = {
+    0: error_prob_table(offset=0),
+    DefaultValues.phred_33_encoding_value: error_prob_table(offset=DefaultValues.phred_33_encoding_value),
+}
+
+def get_error_prob_table(offset):
+    """
+    Returns the precomputed error rate table for a quality encoding offset
+
+    Arguments:
+        offset: int
+            encoding offset of the qualities
+
+    Returns:
+        numpy array:
+            array of 256 error rates
+    """
+    if offset not in ERROR_PROB_TABLES:
+        ERROR_PROB_TABLES[offset] = error_prob_table(offset=offset)
+    return ERROR_PROB_TABLES[offset]
+
+def quality_array(qual):
+    """
+    Views a quality buffer as a numpy uint8 array without copying it where possible
+
+    Arguments:
+        qual: array, bytes, bytearray, memoryview, str or list
+            qualities of one read
+
+    Returns:
+        numpy array:
+            uint8 array of the qualities
+    """
+    if isinstance(qual, str):
+        qual = qual.encode('latin-1')
+    if isinstance(qual, list):
+        return np.asarray(qual, dtype=np.uint8)
+    return np.frombuffer(qual, dtype=np.uint8)
+
+def calc_mean_qscore(qual, offset=0):
+    """
+    Calculates the mean quality score for a read. Phred scores are first converted to probabilites,
+    then the average error probability is calculated. The average is then converted back to the Phred scale.
+
+    Arguments:
+        qual: array, bytes, bytearray, memoryview, str or list
+            qualities of one read, e.g. pysam query_qualities or a fastq quality string
+        offset: int
+            encoding offset of the qualities, 0 for raw Phred values and 33 for Phred+33 strings
+
+    Returns:
+        float:
+            mean qscore, 0 when the read has no qualities
+    """
+    if qual is None or len(qual) == 0:
+        return 0
+    probs = get_error_prob_table(offset)[quality_array(qual)]
+    return -10 * log(float(probs.mean()), 10)
+
+def calc_mean_qscores(quals, offset=0):
+    """
+    Calculates the mean quality score of a batch of reads with a single table lookup over
+    the concatenated qualities and a segmented sum per read
+
+    Arguments:
+        quals: list
+            list of quality buffers, see calc_mean_qscore
+        offset: int
+            encoding offset of the qualities, 0 for raw Phred values and 33 for Phred+33 strings
+
+    Returns:
+        numpy array:
+            mean qscore of every read, 0 for reads without qualities
+    """
+    lengths = np.fromiter((0 if q is None else len(q) for q in quals), dtype=np.int64, count=len(quals))
+    qscores = np.zeros(len(quals), dtype=np.float64)
+    has_qual = lengths > 0
+    if not has_qual.any():
+        return qscores
+    if all(isinstance(q, str) for q in quals):
+        values = quality_array(''.join(quals))
+    else:
+        values = np.concatenate([quality_array(q) for q in quals if q is not None and len(q) > 0])
+    probs = get_error_prob_table(offset)[values]
+    starts = np.cumsum(lengths) - lengths
+    sums = np.add.reduceat(probs, starts[has_qual])
+    qscores[has_qual] = -10 * np.log10(sums / lengths[has_qual])
+    return qscores
+
+def calc_mean_qscores_buffer(buffer, starts, ends, offset=0):
+    """
+    Calculates the mean quality score of a batch of reads whose qualities are slices of one buffer,
+    the slices are joined into one quality string for calc_mean_qscores
+
+    Arguments:
+        buffer: bytes
+            buffer holding the qualities
+        starts: numpy array
+            start offset of the qualities of every read in the buffer
+        ends: numpy array
+            end offset of the qualities of every read in the buffer
+        offset: int
+            encoding offset of the qualities, 0 for raw Phred values and 33 for Phred+33 strings
+
+    Returns:
+        numpy array:
+            mean qscore of every read, 0 for reads without qualities
+    """
+    lengths = ends - starts
+    qscores = np.zeros(len(lengths), dtype=np.float64)
+    has_qual = lengths > 0
+    if not has_qual.any():
+        return qscores
+    values = quality_array(b''.join([buffer[start:end] for (start, end) in zip(starts.tolist(), ends.tolist())]))
+    probs = get_error_prob_table(offset)[values]
+    offsets = np.cumsum(lengths) - lengths
+    sums = np.add.reduceat(probs, offsets[has_qual])
+    qscores[has_qual] = -10 * np.log10(sums / lengths[has_qual])
+    return qscores
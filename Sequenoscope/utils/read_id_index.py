@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+
+import numpy as np
+from Sequenoscope.constant import DefaultValues
+from Sequenoscope.utils.read_registry import encode_read_ids, decode_read_ids, hash_read_ids
+
+READ_ID_INDEX_MAGIC = b'SQRIDX01'
+READ_ID_INDEX_HEADER = np.dtype([('magic', 'S8'), ('num_reads', '<u8'), ('width', '<u8')])
+MATE_SUFFIXES = ('/1', '/2')
+
+
+def mate_read_id(read_id, mate):
+    """
+    Keys a paired-end read on its name and its mate. A /1 or /2 suffix of the name is dropped, as minimap2
+    does for paired reads, and the mate number is appended, which gives the ids the paired-end reads had
+    when their fastq files were rewritten with renamed headers.
+
+    Arguments:
+        read_id: str
+            read name
+        mate: int
+            1 for the first mate, 2 for the second mate, 0 when the read is not paired
+
+    Returns:
+        str:
+            read id of the mate
+    """
+    if mate == 0:
+        return read_id
+    if read_id.endswith(MATE_SUFFIXES):
+        read_id = read_id[:-2]
+    return f"{read_id}{mate}"
+
+def mate_read_ids(read_ids, mate):
+    """
+    Keys a batch of paired-end reads on their names and their mate, see mate_read_id
+
+    Arguments:
+        read_ids: list
+            read names
+        mate: int
+            1 for the first mate, 2 for the second mate, 0 when the reads are not paired
+
+    Returns:
+        list:
+            read ids of the mates
+    """
+    if mate == 0:
+        return read_ids
+    return [mate_read_id(read_id, mate) for read_id in read_ids]
+
+def write_read_ids(path, read_id_batches):
+    """
+    Writes read ids as a binary read id index, see ReadIdIndexWriter
+
+    Arguments:
+        path: str
+            path of the index file
+        read_id_batches: iterable
+            lists of read ids as strings, in the order they are iterated
+
+    Returns:
+        int:
+            number of read ids written
+    """
+    writer = ReadIdIndexWriter(path)
+    for read_ids in read_id_batches:
+        writer.add(read_ids)
+    return writer.close()
+
+def is_read_id_index(path):
+    """
+    Checks if a file is a binary read id index
+
+    Arguments:
+        path: str
+            path of the file
+
+    Returns:
+        bool:
+            True if the file starts with the read id index header, False otherwise
+    """
+    with open(path, 'rb') as f:
+        return f.read(len(READ_ID_INDEX_MAGIC)) == READ_ID_INDEX_MAGIC
+
+def load_read_ids(path):
+    """
+    Loads a read list. Binary read id indexes are memory mapped without parsing, text read lists with a
+    read_id header are read once and indexed in memory.
+
+    Arguments:
+        path: str
+            path of the read id index or the text read list
+
+    Returns:
+        ReadIdIndex:
+            read ids of the read list
+    """
+    if is_read_id_index(path):
+        return ReadIdIndex.from_file(path)
+    read_ids = []
+    with open(path, 'r') as f:
+        read_id_col = 0
+        for line in f:
+            row = line.strip().split('\t')
+            if 'read_id' in row:
+                read_id_col = row.index('read_id')
+                continue
+            read_ids.append(row[read_id_col] if len(row) > read_id_col else '')
+    encoded = encode_read_ids(read_ids)
+    hashes = hash_read_ids(encoded)
+    positions = np.argsort(hashes, kind='stable')
+    return ReadIdIndex(hashes[positions], positions, encoded)
+
+
+class ReadIdIndexWriter:
+    path = None
+    batches = None
+
+    def __init__(self, path):
+        """
+        Initalize the class with the path of the index file. Read ids are encoded as they are added and the
+        index is written on close: a header with the number of reads and the width of the read ids, the sorted
+        64-bit hashes of the read ids, the position of the read id of every hash and the read ids themselves as
+        fixed width bytes in the order they were added. Every section is 8-byte aligned so that load_read_ids
+        maps them straight into numpy arrays.
+
+        Arguments:
+            path: str
+                path of the index file
+        """
+        self.path = path
+        self.batches = []
+
+    def add(self, read_ids):
+        """
+        Adds a batch of read ids
+
+        Arguments:
+            read_ids: list
+                read ids as strings
+        """
+        if len(read_ids) > 0:
+            self.batches.append(encode_read_ids(read_ids))
+
+    def close(self):
+        """
+        Writes the index file
+
+        Returns:
+            int:
+                number of read ids written
+        """
+        width = max([batch.dtype.itemsize for batch in self.batches], default=1)
+        width = -(-width // 8) * 8
+        read_ids = np.zeros(0, dtype=f"S{width}")
+        if len(self.batches) > 0:
+            read_ids = np.concatenate([batch.astype(f"S{width}") for batch in self.batches])
+        self.batches = []
+        hashes = hash_read_ids(read_ids)
+        positions = np.argsort(hashes, kind='stable').astype('<u8')
+        header = np.array([(READ_ID_INDEX_MAGIC, len(read_ids), width)], dtype=READ_ID_INDEX_HEADER)
+        with open(self.path, 'wb') as f:
+            header.tofile(f)
+            hashes[positions].astype('<u8').tofile(f)
+            positions.tofile(f)
+            read_ids.tofile(f)
+        return len(read_ids)
+
+
+class ReadIdIndex:
+    hashes = None
+    positions = None
+    read_ids = None
+    mapped = None
+
+    def __init__(self, hashes, positions, read_ids, mapped=None):
+        """
+        Initalize the class with the sections of a read id index. Membership is checked with a binary search
+        of the sorted hashes followed by a comparison of the read ids, iteration reads the read ids in their
+        original order.
+
+        Arguments:
+            hashes: numpy array
+                sorted hashes of the read ids, see hash_read_ids
+            positions: numpy array
+                position of the read id of every hash
+            read_ids: numpy array
+                bytes array of the read ids in their original order
+            mapped: numpy memmap
+                memory map of the index file the sections are views of, None for in-memory indexes
+        """
+        self.hashes = hashes
+        self.positions = positions
+        self.read_ids = read_ids
+        self.mapped = mapped
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Maps a binary read id index written by write_read_ids
+
+        Arguments:
+            path: str
+                path of the index file
+
+        Returns:
+            ReadIdIndex:
+                index whose sections are views of the mapped file
+        """
+        header = np.fromfile(path, dtype=READ_ID_INDEX_HEADER, count=1)
+        if len(header) == 0 or header['magic'][0] != READ_ID_INDEX_MAGIC:
+            raise ValueError(f"Error {path} is not a read id index")
+        num_reads = int(header['num_reads'][0])
+        width = int(header['width'][0])
+        start = READ_ID_INDEX_HEADER.itemsize
+        if num_reads == 0:
+            return cls(np.zeros(0, dtype='<u8'), np.zeros(0, dtype='<u8'), np.zeros(0, dtype=f"S{width}"))
+        mapped = np.memmap(path, dtype=np.uint8, mode='r')
+        if len(mapped) != start + num_reads * (16 + width):
+            raise ValueError(f"Error read id index {path} is truncated")
+        hashes = mapped[start:start + 8 * num_reads].view('<u8')
+        start += 8 * num_reads
+        positions = mapped[start:start + 8 * num_reads].view('<u8')
+        start += 8 * num_reads
+        read_ids = mapped[start:start + width * num_reads].view(f"S{width}")
+        return cls(hashes, positions, read_ids, mapped)
+
+    def __len__(self):
+        return len(self.read_ids)
+
+    def __contains__(self, read_id):
+        return bool(self.contains_many([read_id])[0])
+
+    def __iter__(self):
+        for read_ids in self.iter_batches():
+            yield from read_ids
+
+    def iter_batches(self, batch_size=DefaultValues.read_store_batch_size):
+        """
+        Iterates over the read ids in their original order
+
+        Arguments:
+            batch_size: int
+                number of read ids decoded at once
+
+        Returns:
+            iterable:
+                lists of read ids as strings
+        """
+        for start in range(0, len(self.read_ids), batch_size):
+            yield decode_read_ids(self.read_ids[start:start + batch_size])
+
+    def contains_many(self, read_ids):
+        """
+        Checks the membership of a batch of read ids
+
+        Arguments:
+            read_ids: list
+                read ids to look up
+
+        Returns:
+            numpy array:
+                True for every read id of the index, False otherwise
+        """
+        found = np.zeros(len(read_ids), dtype=bool)
+        if len(read_ids) == 0 or len(self.read_ids) == 0:
+            return found
+        encoded = encode_read_ids(list(read_ids))
+        hashes = hash_read_ids(encoded)
+        # sorted needles let the binary searches walk the hashes in order instead of jumping around
+        order = np.argsort(hashes)
+        first = np.empty(len(hashes), dtype=np.int64)
+        last = np.empty(len(hashes), dtype=np.int64)
+        first[order] = np.searchsorted(self.hashes, hashes[order], side='left')
+        last[order] = np.searchsorted(self.hashes, hashes[order], side='right')
+        candidates = np.flatnonzero(first < last)
+        found[candidates] = self.read_ids[self.positions[first[candidates]]] == encoded[candidates]
+        for i in candidates[~found[candidates] & (last[candidates] - first[candidates] > 1)].tolist():
+            positions = self.positions[first[i]:last[i]]
+            found[i] = bool((self.read_ids[positions] == encoded[i]).any())
+        return found
+
+    def close(self):
+        """
+        Releases the memory map of the index file
+        """
+        self.hashes = None
+        self.positions = None
+        self.read_ids = np.zeros(0, dtype='S1')
+        if self.mapped is not None:
+            self.mapped._mmap.close()
+            self.mapped = None
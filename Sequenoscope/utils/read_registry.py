@@ -0,0 +1,436 @@
+#!/usr/bin/env python
+
+import numpy as np
+from collections.abc import MutableMapping
+from Sequenoscope.constant import DefaultValues, ReadRecords
+
+HASH_SEED = np.uint64(0x9E3779B97F4A7C15)
+HASH_PRIME = np.uint64(0x100000001B3)
+HASH_SHIFT = np.uint64(29)
+
+
+def encode_read_ids(read_ids):
+    """
+    Encodes read ids into a fixed width bytes array
+
+    Arguments:
+        read_ids: list
+            read ids as strings
+
+    Returns:
+        numpy array:
+            bytes array of the read ids, as wide as the longest read id
+    """
+    try:
+        return np.array(read_ids, dtype=np.bytes_)
+    except UnicodeEncodeError:
+        return np.array([read_id.encode('utf-8') for read_id in read_ids], dtype=np.bytes_)
+
+def decode_read_ids(encoded):
+    """
+    Decodes a bytes array of read ids back into strings
+
+    Arguments:
+        encoded: numpy array
+            bytes array of read ids, see encode_read_ids
+
+    Returns:
+        list:
+            read ids as strings
+    """
+    try:
+        return encoded.astype(np.str_).tolist()
+    except UnicodeDecodeError:
+        return [read_id.decode('utf-8') for read_id in encoded.tolist()]
+
+def hash_read_ids(encoded):
+    """
+    Hashes read ids into 64-bit integers. The bytes of the read ids are read as little endian 64-bit
+    words and folded with a multiply and xorshift step per word, so a batch of read ids is hashed with
+    a handful of vectorized operations. Only the words holding bytes of a read id are folded, its hash
+    does not depend on the width of the batch and can be stored. The hash is not cryptographic, callers
+    check the read ids of matching hashes.
+
+    Arguments:
+        encoded: numpy array
+            bytes array of read ids, see encode_read_ids
+
+    Returns:
+        numpy array:
+            uint64 hash of every read id
+    """
+    width = max(encoded.dtype.itemsize, 1)
+    padded = -(-width // 8) * 8
+    if padded != encoded.dtype.itemsize:
+        encoded = encoded.astype(f"S{padded}")
+    words = np.ascontiguousarray(encoded).view('<u8').reshape(len(encoded), padded // 8)
+    num_words = (np.char.str_len(encoded) + 7) // 8
+    hashes = np.full(len(encoded), HASH_SEED, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for col in range(words.shape[1]):
+            mixed = (hashes ^ words[:, col]) * HASH_PRIME
+            mixed ^= mixed >> HASH_SHIFT
+            hashes = np.where(num_words > col, mixed, hashes)
+    return hashes
+
+def grow_array(array, size, dtype=None):
+    """
+    Returns an array holding the values of array with room for at least size values, the capacity
+    is doubled so that appending stays amortized constant time
+
+    Arguments:
+        array: numpy array
+            array to grow
+        size: int
+            number of values the array has to hold
+        dtype: numpy dtype
+            dtype of the grown array, default is the dtype of array
+
+    Returns:
+        numpy array:
+            array itself when it is large enough, otherwise a larger copy
+    """
+    if dtype is None:
+        dtype = array.dtype
+    if size <= len(array) and dtype == array.dtype:
+        return array
+    grown = np.zeros(max(size, 2 * len(array), 1024), dtype=dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class ReadRegistry(MutableMapping):
+    fields = ReadRecords.flag
+    size = 0
+    read_ids = None
+    present = None
+    sorted_hashes = None
+    sorted_slots = None
+    recent = None
+    collisions = None
+    lengths = None
+    qscores = None
+    no_quality = None
+    contigs = None
+    extra_contigs = None
+    contig_names = None
+    contig_codes = None
+
+    def __init__(self, fields=ReadRecords.flag):
+        """
+        Initalize the class with the fields of its records. The registry behaves like a dict of read ids and
+        their records but interns every read id once in a bytes array and keeps the fields in parallel typed
+        arrays, a record takes tens of bytes instead of the hundreds of a dict entry holding a tuple.
+        Read ids are found through their 64-bit hash: hashes are kept in a sorted array searched in batches,
+        hashes added since the last merge wait in a small dict. Read ids whose hash is taken by another read
+        id are kept in a separate dict keyed on the read id. Lookups and updates are best done in batches
+        with get_many and update_many.
+
+        Arguments:
+            fields: tuple
+                fields of the records, see ReadRecords. A registry without fields maps every read id to True,
+                'contigs' is a tuple of contig ids, 'length' an int and 'qscore' a float (or 0 for reads
+                without qualities)
+        """
+        self.fields = tuple(fields)
+        self.size = 0
+        self.read_ids = np.zeros(0, dtype='S1')
+        self.present = np.zeros(0, dtype=bool)
+        self.sorted_hashes = np.zeros(0, dtype=np.uint64)
+        self.sorted_slots = np.zeros(0, dtype=np.int64)
+        self.recent = {}
+        self.collisions = {}
+        self.lengths = np.zeros(0, dtype=np.int32)
+        self.qscores = np.zeros(0, dtype=np.float64)
+        self.no_quality = np.zeros(0, dtype=bool)
+        self.contigs = np.zeros(0, dtype=np.int32)
+        self.extra_contigs = {}
+        self.contig_names = []
+        self.contig_codes = {}
+
+    def __getitem__(self, read_id):
+        found = self.get_many([read_id])
+        if read_id not in found:
+            raise KeyError(read_id)
+        return found[read_id]
+
+    def __setitem__(self, read_id, value):
+        self.update_many({read_id: value})
+
+    def __delitem__(self, read_id):
+        slot = self.find_slots([read_id])[0][0]
+        if slot < 0 or not self.present[slot]:
+            raise KeyError(read_id)
+        self.present[slot] = False
+        self.extra_contigs.pop(int(slot), None)
+
+    def __contains__(self, read_id):
+        slot = self.find_slots([read_id])[0][0]
+        return slot >= 0 and bool(self.present[slot])
+
+    def __len__(self):
+        return int(np.count_nonzero(self.present[:self.size]))
+
+    def __iter__(self):
+        return iter(decode_read_ids(self.read_ids[:self.size][self.present[:self.size]]))
+
+    def items(self):
+        """
+        Returns:
+            iterable:
+                read ids and their records in insertion order
+        """
+        slots = np.flatnonzero(self.present[:self.size])
+        for start in range(0, len(slots), DefaultValues.read_store_batch_size):
+            batch = slots[start:start + DefaultValues.read_store_batch_size]
+            yield from zip(decode_read_ids(self.read_ids[batch]), self.records(batch))
+
+    def values(self):
+        """
+        Returns:
+            iterable:
+                records in insertion order
+        """
+        return (value for (read_id, value) in self.items())
+
+    @property
+    def nbytes(self):
+        """
+        Returns:
+            int:
+                number of bytes taken by the arrays and dicts of the registry
+        """
+        arrays = [self.read_ids, self.present, self.sorted_hashes, self.sorted_slots,
+                  self.lengths, self.qscores, self.no_quality, self.contigs]
+        num_bytes = sum(array.nbytes for array in arrays)
+        return num_bytes + DefaultValues.read_registry_dict_entry_size * (len(self.recent) + len(self.collisions) +
+                                                                           len(self.extra_contigs))
+
+    def find_slots(self, read_ids):
+        """
+        Finds the slots of a batch of read ids
+
+        Arguments:
+            read_ids: list
+                read ids to look up
+
+        Returns:
+            tuple:
+                slot of every read id (-1 when it was never added, deleted reads keep their slot), the encoded
+                read ids and their hashes
+        """
+        encoded = encode_read_ids(read_ids)
+        hashes = hash_read_ids(encoded)
+        slots = np.full(len(read_ids), -1, dtype=np.int64)
+        if len(self.sorted_hashes) > 0:
+            positions = np.searchsorted(self.sorted_hashes, hashes)
+            positions[positions == len(self.sorted_hashes)] = 0
+            hits = self.sorted_hashes[positions] == hashes
+            slots[hits] = self.sorted_slots[positions[hits]]
+        if len(self.recent) > 0:
+            recent = self.recent
+            misses = np.flatnonzero(slots < 0)
+            slots[misses] = [recent.get(read_hash, -1) for read_hash in hashes[misses].tolist()]
+        found = np.flatnonzero(slots >= 0)
+        mismatched = found[self.read_ids[slots[found]] != encoded[found]]
+        if len(mismatched) > 0:
+            slots[mismatched] = [self.collisions.get(read_id, -1) for read_id in encoded[mismatched].tolist()]
+        return (slots, encoded, hashes)
+
+    def get_many(self, read_ids):
+        """
+        Looks up a batch of read ids
+
+        Arguments:
+            read_ids: list
+                read ids to look up
+
+        Returns:
+            dict:
+                the read ids that were found and their records
+        """
+        read_ids = list(read_ids)
+        if len(read_ids) == 0 or self.size == 0:
+            return {}
+        slots = self.find_slots(read_ids)[0]
+        found = np.flatnonzero(slots >= 0)
+        found = found[self.present[slots[found]]]
+        return dict(zip([read_ids[i] for i in found.tolist()], self.records(slots[found])))
+
+    def update_many(self, reads):
+        """
+        Adds a batch of reads, the records of reads already in the registry are replaced
+
+        Arguments:
+            reads: dict
+                read ids and their records
+        """
+        if len(reads) == 0:
+            return
+        read_ids = list(reads)
+        (slots, encoded, hashes) = self.find_slots(read_ids)
+        new = np.flatnonzero(slots < 0)
+        if len(new) > 0:
+            slots[new] = self.add_slots(encoded[new], hashes[new])
+        self.set_records(slots, list(reads.values()))
+
+    def add_slots(self, encoded, hashes):
+        """
+        Interns read ids that are not in the registry yet
+
+        Arguments:
+            encoded: numpy array
+                bytes array of the new read ids
+            hashes: numpy array
+                hashes of the new read ids
+
+        Returns:
+            numpy array:
+                slots of the new read ids
+        """
+        start = self.size
+        self.size += len(encoded)
+        slots = np.arange(start, self.size, dtype=np.int64)
+        dtype = self.read_ids.dtype
+        if encoded.dtype.itemsize > dtype.itemsize:
+            dtype = encoded.dtype
+        self.read_ids = grow_array(self.read_ids, self.size, dtype)
+        self.read_ids[start:self.size] = encoded
+        self.present = grow_array(self.present, self.size)
+        self.present[start:self.size] = True
+        if 'length' in self.fields or 'qscore' in self.fields:
+            self.lengths = grow_array(self.lengths, self.size)
+            self.qscores = grow_array(self.qscores, self.size)
+            self.no_quality = grow_array(self.no_quality, self.size)
+        if 'contigs' in self.fields:
+            self.contigs = grow_array(self.contigs, self.size)
+        taken = np.zeros(len(encoded), dtype=bool)
+        if len(self.sorted_hashes) > 0:
+            positions = np.searchsorted(self.sorted_hashes, hashes)
+            positions[positions == len(self.sorted_hashes)] = 0
+            taken = self.sorted_hashes[positions] == hashes
+        recent = self.recent
+        for (read_id, read_hash, slot, is_taken) in zip(encoded.tolist(), hashes.tolist(), slots.tolist(),
+                                                        taken.tolist()):
+            if is_taken or read_hash in recent:
+                self.collisions[read_id] = slot
+            else:
+                recent[read_hash] = slot
+        if len(recent) > max(DefaultValues.read_registry_merge_size, len(self.sorted_hashes) // 16):
+            self.merge_recent()
+        return slots
+
+    def merge_recent(self):
+        """
+        Moves the hashes added since the last merge into the sorted hash array. The sorted array and the
+        sorted recent hashes are two runs, so the stable sort merges them in linear time.
+        """
+        if len(self.recent) == 0:
+            return
+        recent_hashes = np.fromiter(self.recent.keys(), dtype=np.uint64, count=len(self.recent))
+        recent_slots = np.fromiter(self.recent.values(), dtype=np.int64, count=len(self.recent))
+        order = np.argsort(recent_hashes)
+        hashes = np.concatenate([self.sorted_hashes, recent_hashes[order]])
+        slots = np.concatenate([self.sorted_slots, recent_slots[order]])
+        order = np.argsort(hashes, kind='stable')
+        self.sorted_hashes = hashes[order]
+        self.sorted_slots = slots[order]
+        self.recent = {}
+
+    def contig_code(self, contig_id):
+        """
+        Returns the code of a contig id, new contig ids are given the next code
+
+        Arguments:
+            contig_id: str
+                contig id
+
+        Returns:
+            int:
+                code of the contig id
+        """
+        code = self.contig_codes.get(contig_id)
+        if code is None:
+            code = len(self.contig_names)
+            self.contig_codes[contig_id] = code
+            self.contig_names.append(contig_id)
+        return code
+
+    def set_records(self, slots, records):
+        """
+        Writes the records of a batch of slots into the field arrays. Qscores are stored as float64, reads
+        without qualities have the int qscore 0 and are flagged in no_quality so that they read back as 0.
+
+        Arguments:
+            slots: numpy array
+                slots to write
+            records: list
+                records of the slots, tuples in the order of self.fields
+        """
+        self.present[slots] = True
+        if 'length' in self.fields:
+            col = self.fields.index('length')
+            self.lengths[slots] = [record[col] for record in records]
+        if 'qscore' in self.fields:
+            col = self.fields.index('qscore')
+            qscores = [record[col] for record in records]
+            try:
+                self.qscores[slots] = [float(qscore) for qscore in qscores]
+            except (TypeError, ValueError):
+                raise ValueError("Error qscores must be numbers, got {}".format(
+                    ", ".join(sorted(set(type(qscore).__name__ for qscore in qscores)))))
+            self.no_quality[slots] = [isinstance(qscore, (int, np.integer)) and qscore == 0 for qscore in qscores]
+        if 'contigs' in self.fields:
+            col = self.fields.index('contigs')
+            codes = np.full(len(records), -1, dtype=np.int32)
+            extra_contigs = self.extra_contigs
+            for (i, slot, record) in zip(range(len(records)), slots.tolist(), records):
+                contigs = record[col]
+                if len(contigs) > 0:
+                    codes[i] = self.contig_code(contigs[0])
+                if len(contigs) > 1:
+                    extra_contigs[slot] = tuple(self.contig_code(contig_id) for contig_id in contigs[1:])
+                else:
+                    extra_contigs.pop(slot, None)
+            self.contigs[slots] = codes
+
+    def records(self, slots):
+        """
+        Builds the records of a batch of slots from the field arrays
+
+        Arguments:
+            slots: numpy array
+                slots to read
+
+        Returns:
+            list:
+                records of the slots, tuples in the order of self.fields or True when there are no fields
+        """
+        if len(self.fields) == 0:
+            return [True] * len(slots)
+        columns = []
+        for field_id in self.fields:
+            if field_id == 'length':
+                columns.append(self.lengths[slots].tolist())
+            elif field_id == 'qscore':
+                columns.append([0 if no_quality else qscore for (qscore, no_quality) in
+                                zip(self.qscores[slots].tolist(), self.no_quality[slots].tolist())])
+            elif field_id == 'contigs':
+                names = self.contig_names
+                extra_contigs = self.extra_contigs
+                contigs = []
+                for (slot, code) in zip(slots.tolist(), self.contigs[slots].tolist()):
+                    if code < 0:
+                        contigs.append(())
+                    elif slot in extra_contigs:
+                        contigs.append((names[code],) + tuple(names[extra] for extra in extra_contigs[slot]))
+                    else:
+                        contigs.append((names[code],))
+                columns.append(contigs)
+        return list(zip(*columns))
+
+    def close(self):
+        """
+        Drops every read of the registry
+        """
+        self.__init__(self.fields)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+import numpy as np
+from math import ceil, floor, log
+from Sequenoscope.constant import DefaultValues
+
+
+class ReadStatsAccumulator:
+    num_reads = 0
+    total_bases = 0
+    exact_length_limit = DefaultValues.read_stats_exact_length_limit
+    length_bin_error = DefaultValues.read_stats_length_bin_error
+    qscore_resolution = DefaultValues.read_stats_qscore_resolution
+
+    def __init__(self, exact_length_limit=DefaultValues.read_stats_exact_length_limit,
+                 length_bin_error=DefaultValues.read_stats_length_bin_error,
+                 qscore_resolution=DefaultValues.read_stats_qscore_resolution):
+        """
+        Initalize the class with the resolution of the histograms. Read lengths below exact_length_limit are
+        counted exactly, longer reads fall into log-scaled bins with a bounded relative error. Qscores are counted
+        in bins of qscore_resolution. Means are kept as running moments, so memory does not grow with the number of reads.
+
+        Arguments:
+            exact_length_limit: int
+                read lengths below this value are kept exactly
+            length_bin_error: float
+                relative width of the log-scaled length bins above exact_length_limit
+            qscore_resolution: float
+                width of the qscore bins
+        """
+        self.exact_length_limit = exact_length_limit
+        self.length_bin_error = length_bin_error
+        self.qscore_resolution = qscore_resolution
+        self.log_bin_width = log(1 + length_bin_error)
+        self.num_reads = 0
+        self.total_bases = 0
+        self.length_hist = {}
+        self.qscore_hist = {}
+        self.qscore_mean = 0.0
+        self.qscore_m2 = 0.0
+
+    def add(self, length, qscore):
+        """
+        Adds one read to the statistics
+
+        Arguments:
+            length: int
+                read length
+            qscore: float
+                mean qscore of the read
+        """
+        self.num_reads += 1
+        self.total_bases += length
+        length_bin = self.length_bin(length)
+        self.length_hist[length_bin] = self.length_hist.get(length_bin, 0) + 1
+        qscore_bin = int(round(qscore / self.qscore_resolution))
+        self.qscore_hist[qscore_bin] = self.qscore_hist.get(qscore_bin, 0) + 1
+        delta = qscore - self.qscore_mean
+        self.qscore_mean += delta / self.num_reads
+        self.qscore_m2 += delta * (qscore - self.qscore_mean)
+
+    def add_many(self, lengths, qscores):
+        """
+        Adds a batch of reads to the statistics, the histograms of the batch are counted with numpy and the
+        batch is merged like the results of a parallel worker
+
+        Arguments:
+            lengths: numpy array
+                read lengths
+            qscores: numpy array
+                mean qscores of the reads
+        """
+        lengths = np.asarray(lengths, dtype=np.int64)
+        qscores = np.asarray(qscores, dtype=np.float64)
+        if len(lengths) == 0:
+            return
+        batch = ReadStatsAccumulator(self.exact_length_limit, self.length_bin_error, self.qscore_resolution)
+        batch.num_reads = len(lengths)
+        batch.total_bases = int(lengths.sum())
+        length_bins = lengths.copy()
+        is_long = lengths >= self.exact_length_limit
+        length_bins[is_long] = [self.length_bin(length) for length in lengths[is_long].tolist()]
+        (values, counts) = np.unique(length_bins, return_counts=True)
+        batch.length_hist = dict(zip(values.tolist(), counts.tolist()))
+        (values, counts) = np.unique(np.round(qscores / self.qscore_resolution).astype(np.int64), return_counts=True)
+        batch.qscore_hist = dict(zip(values.tolist(), counts.tolist()))
+        batch.qscore_mean = float(qscores.mean())
+        batch.qscore_m2 = float(((qscores - batch.qscore_mean) ** 2).sum())
+        self.merge(batch)
+
+    def merge(self, other):
+        """
+        Merges the statistics of another accumulator with the same resolution into this one,
+        e.g. the results of parallel workers
+
+        Arguments:
+            other: ReadStatsAccumulator
+                accumulator to merge
+        """
+        if other.num_reads == 0:
+            return
+        num_reads = self.num_reads + other.num_reads
+        delta = other.qscore_mean - self.qscore_mean
+        self.qscore_mean += delta * other.num_reads / num_reads
+        self.qscore_m2 += other.qscore_m2 + delta * delta * self.num_reads * other.num_reads / num_reads
+        self.num_reads = num_reads
+        self.total_bases += other.total_bases
+        for length_bin, count in other.length_hist.items():
+            self.length_hist[length_bin] = self.length_hist.get(length_bin, 0) + count
+        for qscore_bin, count in other.qscore_hist.items():
+            self.qscore_hist[qscore_bin] = self.qscore_hist.get(qscore_bin, 0) + count
+
+    def length_bin(self, length):
+        """
+        Returns the histogram bin of a read length, lengths below exact_length_limit are their own bin
+
+        Arguments:
+            length: int
+                read length
+
+        Returns:
+            int:
+                bin of the length
+        """
+        if length < self.exact_length_limit:
+            return length
+        return self.exact_length_limit + int(floor(log(length / self.exact_length_limit) / self.log_bin_width))
+
+    def length_bin_value(self, length_bin):
+        """
+        Returns the representative read length of a histogram bin, the geometric middle for log-scaled bins
+
+        Arguments:
+            length_bin: int
+                histogram bin
+
+        Returns:
+            int:
+                read length of the bin
+        """
+        if length_bin < self.exact_length_limit:
+            return length_bin
+        offset = length_bin - self.exact_length_limit + 0.5
+        return int(round(self.exact_length_limit * (1 + self.length_bin_error) ** offset))
+
+    def hist_median(self, hist, value_func):
+        """
+        Calculates the median of a histogram, averaging the two middle values for an even number of reads
+
+        Arguments:
+            hist: dict
+                histogram of bin counts
+            value_func: function
+                converts a bin into its value
+
+        Returns:
+            float:
+                median value
+        """
+        if self.num_reads == 0:
+            return 0
+        lower_rank = (self.num_reads - 1) // 2
+        upper_rank = self.num_reads // 2
+        lower = None
+        seen = 0
+        for hist_bin in sorted(hist):
+            seen += hist[hist_bin]
+            if lower is None and seen > lower_rank:
+                lower = value_func(hist_bin)
+            if seen > upper_rank:
+                upper = value_func(hist_bin)
+                if lower_rank == upper_rank:
+                    return upper
+                return (lower + upper) / 2
+
+    def median_length(self):
+        """
+        Returns:
+            float:
+                median read length, exact for reads shorter than exact_length_limit
+        """
+        return self.hist_median(self.length_hist, self.length_bin_value)
+
+    def mean_length(self):
+        """
+        Returns:
+            float:
+                exact mean read length
+        """
+        if self.num_reads == 0:
+            return 0
+        return self.total_bases / self.num_reads
+
+    def median_qscore(self):
+        """
+        Returns:
+            float:
+                median qscore, within half a qscore_resolution of the exact value
+        """
+        return self.hist_median(self.qscore_hist, lambda qscore_bin: qscore_bin * self.qscore_resolution)
+
+    def mean_qscore(self):
+        """
+        Returns:
+            float:
+                mean qscore
+        """
+        if self.num_reads == 0:
+            return 0
+        return self.qscore_mean
+
+    def qscore_variance(self):
+        """
+        Returns:
+            float:
+                population variance of the qscores
+        """
+        if self.num_reads == 0:
+            return 0
+        return self.qscore_m2 / self.num_reads
+
+    def n50(self):
+        """
+        Calculates the N50 from the length histogram. Reads are walked from longest to shortest and the
+        length of the first read reached once half of the total bases were accumulated is returned.
+
+        Returns:
+            int:
+                N50 of the read lengths, 0 when there are no reads
+        """
+        if self.num_reads == 0:
+            return 0
+        target_len = int(self.total_bases / 2)
+        s = 0
+        value = 0
+        for length_bin in sorted(self.length_hist, reverse=True):
+            count = self.length_hist[length_bin]
+            value = self.length_bin_value(length_bin)
+            if s >= target_len:
+                return value
+            if value > 0 and ceil((target_len - s) / value) < count:
+                return value
+            s += value * count
+        return value
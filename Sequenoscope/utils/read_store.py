@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import sqlite3
+import marshal
+import tempfile
+import weakref
+from collections.abc import MutableMapping
+from Sequenoscope.constant import DefaultValues, ReadRecords
+from Sequenoscope.utils.read_registry import ReadRegistry
+
+
+class MemoryBudget:
+    max_bytes = None
+    used_bytes = 0
+
+    def __init__(self, max_bytes=None):
+        """
+        Initalize the class with the number of bytes the per-read state of a run may use. The budget is shared
+        by all the read stores of a run, the store that pushes it over the limit spills to disk.
+
+        Arguments:
+            max_bytes: int
+                approximate number of bytes available, None for no limit
+        """
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+
+    def add(self, num_bytes):
+        """
+        Accounts for memory taken by a store
+
+        Arguments:
+            num_bytes: int
+                number of bytes taken
+        """
+        self.used_bytes += num_bytes
+
+    def release(self, num_bytes):
+        """
+        Accounts for memory given back by a store
+
+        Arguments:
+            num_bytes: int
+                number of bytes given back
+        """
+        self.used_bytes -= num_bytes
+
+    def exceeded(self):
+        """
+        Returns:
+            bool:
+                True if the used memory is above the budget, False otherwise or when there is no limit
+        """
+        return self.max_bytes is not None and self.used_bytes > self.max_bytes
+
+
+def remove_spill(connection, spill_dir):
+    """
+    Closes the database of a spilled store and removes its directory
+
+    Arguments:
+        connection: sqlite3.Connection
+            connection to the spilled database
+        spill_dir: str
+            temporary directory holding the database
+    """
+    connection.close()
+    shutil.rmtree(spill_dir, ignore_errors=True)
+
+
+class ReadStore(MutableMapping):
+    data = None
+    budget = None
+    spill_dir = None
+    fields = ReadRecords.flag
+    used_bytes = 0
+    spilled = False
+    connection = None
+    pending = None
+    finalizer = None
+
+    def __init__(self, budget=None, spill_dir=None, fields=ReadRecords.flag):
+        """
+        Initalize the class with a memory budget. The store behaves like a dict of read ids and their records and
+        keeps them in a compact ReadRegistry until the budget is exceeded, it then moves every read into a keyed
+        SQLite table in a temporary directory and keeps working from disk. Writes to a spilled store are buffered
+        and written in batches, lookups and writes are best done in batches with get_many and update_many.
+
+        Arguments:
+            budget: MemoryBudget
+                budget shared with the other stores of the run, None to always stay in memory
+            spill_dir: str
+                directory the temporary database is created in, default is the system temporary directory
+            fields: tuple
+                fields of the records, see ReadRecords
+        """
+        self.fields = fields
+        self.data = ReadRegistry(fields)
+        self.budget = budget
+        self.spill_dir = spill_dir
+        self.used_bytes = 0
+        self.pending = {}
+
+    def __getitem__(self, read_id):
+        if not self.spilled:
+            return self.data[read_id]
+        if read_id in self.pending:
+            return self.pending[read_id]
+        row = self.connection.execute("SELECT value FROM reads WHERE read_id = ?", (read_id,)).fetchone()
+        if row is None:
+            raise KeyError(read_id)
+        return marshal.loads(row[0])
+
+    def __setitem__(self, read_id, value):
+        self.update_many({read_id: value})
+
+    def __delitem__(self, read_id):
+        if not self.spilled:
+            del self.data[read_id]
+            return
+        self.flush()
+        if self.connection.execute("DELETE FROM reads WHERE read_id = ?", (read_id,)).rowcount == 0:
+            raise KeyError(read_id)
+
+    def __contains__(self, read_id):
+        if not self.spilled:
+            return read_id in self.data
+        if read_id in self.pending:
+            return True
+        return self.connection.execute("SELECT 1 FROM reads WHERE read_id = ?", (read_id,)).fetchone() is not None
+
+    def __len__(self):
+        if not self.spilled:
+            return len(self.data)
+        self.flush()
+        return self.connection.execute("SELECT COUNT(*) FROM reads").fetchone()[0]
+
+    def __iter__(self):
+        if not self.spilled:
+            return iter(self.data)
+        self.flush()
+        return (row[0] for row in self.connection.execute("SELECT read_id FROM reads ORDER BY rowid"))
+
+    def items(self):
+        """
+        Returns:
+            iterable:
+                read ids and their values in insertion order, streamed from disk when the store spilled
+        """
+        if not self.spilled:
+            return self.data.items()
+        self.flush()
+        return ((row[0], marshal.loads(row[1])) for row in
+                self.connection.execute("SELECT read_id, value FROM reads ORDER BY rowid"))
+
+    def values(self):
+        """
+        Returns:
+            iterable:
+                values in insertion order, streamed from disk when the store spilled
+        """
+        if not self.spilled:
+            return self.data.values()
+        return (value for (read_id, value) in self.items())
+
+    def account(self):
+        """
+        Charges the growth of the registry to the budget and spills the store once the budget is exceeded
+        """
+        num_bytes = self.data.nbytes
+        if self.budget is not None:
+            self.budget.add(num_bytes - self.used_bytes)
+        self.used_bytes = num_bytes
+        if self.budget is not None and self.budget.exceeded():
+            self.spill()
+
+    def spill(self):
+        """
+        Moves the reads held in memory into a SQLite table keyed on read_id and gives their memory back to the budget
+        """
+        if self.spilled:
+            return
+        spill_dir = tempfile.mkdtemp(prefix="sequenoscope_reads_", dir=self.spill_dir)
+        self.connection = sqlite3.connect(os.path.join(spill_dir, "reads.sqlite"))
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute("CREATE TABLE reads (read_id TEXT PRIMARY KEY, value BLOB)")
+        self.finalizer = weakref.finalize(self, remove_spill, self.connection, spill_dir)
+        self.spilled = True
+        batch = {}
+        for read_id, value in self.data.items():
+            batch[read_id] = value
+            if len(batch) >= DefaultValues.read_store_batch_size:
+                self.pending = batch
+                self.flush()
+                batch = {}
+        self.pending = batch
+        self.flush()
+        self.data = ReadRegistry(self.fields)
+        if self.budget is not None:
+            self.budget.release(self.used_bytes)
+        self.used_bytes = 0
+
+    def flush(self):
+        """
+        Writes the buffered writes of a spilled store to disk, later writes of a read replace its value
+        but keep its position
+        """
+        if not self.spilled or len(self.pending) == 0:
+            return
+        self.connection.executemany("INSERT INTO reads (read_id, value) VALUES (?, ?) "
+                                    "ON CONFLICT(read_id) DO UPDATE SET value = excluded.value",
+                                    ((read_id, marshal.dumps(value)) for read_id, value in self.pending.items()))
+        self.connection.commit()
+        self.pending = {}
+
+    def update_many(self, reads):
+        """
+        Adds a batch of reads, later values of a read replace earlier ones
+
+        Arguments:
+            reads: dict
+                read ids and their values
+        """
+        if self.spilled:
+            self.pending.update(reads)
+            if len(self.pending) >= DefaultValues.read_store_batch_size:
+                self.flush()
+        else:
+            self.data.update_many(reads)
+            self.account()
+
+    def get_many(self, read_ids):
+        """
+        Looks up a batch of read ids, a spilled store queries the read ids in batches of
+        DefaultValues.read_store_query_size.
+
+        Arguments:
+            read_ids: list
+                read ids to look up
+
+        Returns:
+            dict:
+                the read ids that were found and their values
+        """
+        if not self.spilled:
+            return self.data.get_many(read_ids)
+        self.flush()
+        found = {}
+        read_ids = list(set(read_ids))
+        batch_size = DefaultValues.read_store_query_size
+        for i in range(0, len(read_ids), batch_size):
+            batch = read_ids[i:i + batch_size]
+            query = "SELECT read_id, value FROM reads WHERE read_id IN ({})".format(",".join("?" * len(batch)))
+            for (read_id, value) in self.connection.execute(query, batch):
+                found[read_id] = marshal.loads(value)
+        return found
+
+    def close(self):
+        """
+        Drops the reads of the store and removes its temporary database
+        """
+        if self.spilled:
+            self.finalizer()
+            self.spilled = False
+            self.connection = None
+        if self.budget is not None:
+            self.budget.release(self.used_bytes)
+        self.used_bytes = 0
+        self.data = ReadRegistry(self.fields)
+        self.pending = {}
@@ -1,8 +1,9 @@
 #!/usr/bin/env python
+from Sequenoscope.utils.compressed import open_input
 
 class Sequence:
     technology = None
-    files = []
+    files = None
     is_paired = False
     out_files = ''
 
@@ -21,7 +22,7 @@ class Sequence:
             self.is_paired = True
 
     def is_fastq(self, input):
-        with open(input, "r") as f:
+        with open_input(input, "r") as f:
             first_line = f.readline().strip()
             if not first_line.startswith("@"):
                 return False
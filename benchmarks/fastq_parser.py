@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+import argparse as ap
+import os
+import sys
+import time
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Sequenoscope.utils.parser import fastq_parser
+from Sequenoscope.utils.qscore import calc_mean_qscores
+from Sequenoscope.constant import DefaultValues
+
+def parse_args():
+    parser = ap.ArgumentParser(prog="fastq_parser.py",
+                               description="Benchmarks the line based fastq parser against the chunked parse_batches "
+                                           "of Sequenoscope.utils.parser on a generated fastq file",
+                               formatter_class=ap.RawTextHelpFormatter)
+    parser.add_argument("-o", "--output", metavar="", default="benchmark_reads.fastq", help="Path of the generated fastq file, reused when it exists. default is [benchmark_reads.fastq]")
+    parser.add_argument("--reads", default=1000000, metavar="", type=int, help="Number of generated reads. default is 1000000")
+    parser.add_argument("--min_len", default=150, metavar="", type=int, help="Shortest generated read. default is 150")
+    parser.add_argument("--max_len", default=150, metavar="", type=int, help="Longest generated read. default is 150")
+    parser.add_argument("--seed", default=42, metavar="", type=int, help="Seed of the generated reads. default is 42")
+    parser.add_argument("--repeats", default=3, metavar="", type=int, help="Number of timed runs of each parser, the fastest is reported. default is 3")
+    parser.add_argument("--no_qscores", help="Only collect the read ids and lengths", action='store_true')
+    return parser.parse_args()
+
+def generate_fastq(out_file, num_reads, min_len, max_len, seed=42, batch_size=10000):
+    """
+    Writes a fastq file of random reads with random Phred+33 qualities
+
+    Arguments:
+        out_file: str
+            path of the fastq file
+        num_reads: int
+            number of reads
+        min_len: int
+            shortest read
+        max_len: int
+            longest read
+        seed: int
+            seed of the random generator
+        batch_size: int
+            number of reads generated at a time
+    """
+    rng = np.random.default_rng(seed)
+    bases = np.frombuffer(b"ACGT", dtype=np.uint8)
+    with open(out_file, 'wb') as f:
+        for start in range(0, num_reads, batch_size):
+            lengths = rng.integers(min_len, max_len + 1, size=min(batch_size, num_reads - start))
+            seqs = bases[rng.integers(0, 4, size=int(lengths.sum()))].tobytes()
+            quals = (rng.integers(2, 41, size=int(lengths.sum()), dtype=np.uint8) + 33).tobytes()
+            records = []
+            offset = 0
+            for (i, length) in enumerate(lengths.tolist()):
+                records.append(b"@read_%d ch=1\n%s\n+\n%s\n" % (start + i, seqs[offset:offset + length],
+                                                                quals[offset:offset + length]))
+                offset += length
+            f.write(b"".join(records))
+
+def run_line_parser(fastq_file, qscores=True):
+    """
+    Collects the read ids, lengths and mean qscores with the line based parser, the way process_fastq did
+    before parse_batches. Qscores are calculated in batches of DefaultValues.qscore_batch_size reads with the
+    shared qscore kernel
+
+    Returns:
+        int:
+            number of records
+    """
+    num_reads = 0
+    fastq_obj = fastq_parser(fastq_file)
+    read_ids = []
+    seq_lens = []
+    quals = []
+    for record in fastq_obj.parse():
+        read_ids.append(fastq_obj.read_id_from_record)
+        seq_lens.append(len(record[1]))
+        quals.append(record[3])
+        if len(read_ids) >= DefaultValues.qscore_batch_size:
+            if qscores:
+                calc_mean_qscores(quals, offset=DefaultValues.phred_33_encoding_value)
+            num_reads += len(read_ids)
+            read_ids = []
+            seq_lens = []
+            quals = []
+    if qscores and len(quals) > 0:
+        calc_mean_qscores(quals, offset=DefaultValues.phred_33_encoding_value)
+    return num_reads + len(read_ids)
+
+def run_batch_parser(fastq_file, qscores=True):
+    """
+    Collects the read ids, lengths and mean qscores with parse_batches, the way process_fastq does
+
+    Returns:
+        int:
+            number of records
+    """
+    num_reads = 0
+    for batch in fastq_parser(fastq_file).parse_batches():
+        read_ids = batch.read_ids()
+        lengths = batch.lengths().tolist()
+        if qscores:
+            batch.qscore_values()
+        num_reads += len(read_ids)
+    return num_reads
+
+def time_parser(func, fastq_file, qscores, repeats):
+    """
+    Returns:
+        tuple:
+            number of records and fastest run time in seconds
+    """
+    best = None
+    for i in range(max(repeats, 1)):
+        start = time.perf_counter()
+        num_reads = func(fastq_file, qscores)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return (num_reads, best)
+
+def run():
+    args = parse_args()
+    if not os.path.isfile(args.output):
+        print(f"Generating {args.reads} reads of {args.min_len}-{args.max_len} bp into {args.output}....")
+        generate_fastq(args.output, args.reads, args.min_len, args.max_len, args.seed)
+    size_mb = os.path.getsize(args.output) / 1024 / 1024
+    qscores = not args.no_qscores
+
+    (line_reads, line_time) = time_parser(run_line_parser, args.output, qscores, args.repeats)
+    (batch_reads, batch_time) = time_parser(run_batch_parser, args.output, qscores, args.repeats)
+    if line_reads != batch_reads:
+        print(f"Error the parsers found {line_reads} and {batch_reads} reads")
+        sys.exit(1)
+
+    print(f"{args.output}: {batch_reads} reads, {size_mb:.0f} MB, qscores {'on' if qscores else 'off'}")
+    print(f"parse:         {line_time:.2f} s, {line_reads / line_time:,.0f} reads/s")
+    print(f"parse_batches: {batch_time:.2f} s, {batch_reads / batch_time:,.0f} reads/s")
+    print(f"speedup:       {line_time / batch_time:.2f}x")
+
+if __name__ == '__main__':
+    run()
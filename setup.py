@@ -60,6 +60,10 @@ setup(
         'six'
     ],
 
+    extras_require={
+        'parquet': ['pyarrow'],
+    },
+
     entry_points={
         'console_scripts': [
             'Sequenoscope=Sequenoscope.main:main',